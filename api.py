@@ -0,0 +1,207 @@
+"""API JSON par lots des transactions (/api/v1/transactions), commune aux deux applis.
+
+- Création : un tableau d'objets validés avec les règles de `TransactionForm`
+  (`importer.validate_row`), puis inséré en une seule transaction par
+  `ledger.bulk_insert`. Une seule ligne invalide et rien n'est inséré.
+- Lecture par lot : `?ids=1,2,3`, une requête `IN` unique. La liste d'ids est
+  liée en un seul paramètre JSON (`json_each`), donc le texte SQL ne change pas
+  et reste dans le cache de requêtes préparées.
+- Liste filtrée (filtres de l'export), paginée par clé sur l'id décroissant
+  (`before_id`, comme /transactions), avec projection `?fields=`.
+
+Chaque ligne est sérialisée par SQLite (`json_object`) : Python ne fait que
+joindre des chaînes, sans Row ni dict intermédiaire. SQLite écrit les réels
+sur 15 chiffres significatifs, ce qui couvre tout montant saisi au centime.
+"""
+import json
+
+import exporter
+import importer
+import ledger
+
+FIELDS = exporter.COLUMNS
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Taille maximale d'un lot (création ou lecture par ids)
+MAX_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = importer.MAX_REPORTED_ERRORS
+
+
+class ApiError(ValueError):
+    """Requête invalide : message et code HTTP"""
+
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+    def body(self):
+        payload = {'error': str(self)}
+        if self.errors:
+            payload['errors'] = self.errors
+        return json.dumps(payload, ensure_ascii=False)
+
+
+def parse_fields(value):
+    """Projection `?fields=id,amount` ; toutes les colonnes si absente"""
+    if not value:
+        return FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in FIELDS]
+    if unknown or not fields:
+        raise ApiError(f"champ(s) inconnu(s) : {', '.join(unknown) or '(aucun)'} (attendu : {', '.join(FIELDS)})")
+    return fields
+
+
+def parse_ids(value):
+    """Liste d'ids `?ids=3,1,2` (ordre et doublons conservés à la lecture, bornée à MAX_BATCH_SIZE)"""
+    try:
+        ids = [int(part) for part in value.split(',') if part.strip()]
+    except ValueError:
+        raise ApiError('ids doit être une liste d\'entiers séparés par des virgules')
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ApiError(f'au plus {MAX_BATCH_SIZE} ids par requête', 413)
+    return ids
+
+
+def parse_filters(args):
+    """Filtres de la liste : ceux de l'export (category, min_id, max_id, since, until)"""
+    try:
+        return exporter.parse_filters(args)
+    except ValueError as e:
+        raise ApiError(str(e))
+
+
+def parse_page(args):
+    """`before_id` et `limit` (borné) de la liste paginée"""
+    try:
+        before_id = int(args['before_id']) if args.get('before_id') not in (None, '') else None
+        limit = int(args.get('limit') or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        raise ApiError('before_id et limit doivent être des entiers')
+    return before_id, max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_batch(payload):
+    """Valide un lot à créer (tableau d'objets, ou objet seul) ; renvoie les tuples à insérer
+
+    Lève ApiError avec les erreurs par position si une ligne au moins est invalide.
+    """
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list) or not payload:
+        raise ApiError('corps attendu : tableau JSON non vide de transactions')
+    if len(payload) > MAX_BATCH_SIZE:
+        raise ApiError(f'au plus {MAX_BATCH_SIZE} transactions par lot', 413)
+    rows, errors = [], []
+    validate = importer.validate_row
+    for index, item in enumerate(payload):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('objet attendu')
+            rows.append(validate(item.get('description'), item.get('amount'), item.get('category'),
+                                 item.get('booked_on')))
+        except ValueError as e:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'index': index, 'error': str(e)})
+    if errors:
+        raise ApiError('lot refusé, aucune transaction insérée', 422, errors)
+    return rows
+
+
+def check_batch(index, payload):
+    """Contrôle un lot sans l'insérer (catégorie facultative) : par ligne, catégorie retenue ou suggérée,
+    confiance, doublon probable, ou erreur de validation ; renvoie (corps JSON, code HTTP)"""
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list) or not payload:
+        return ApiError('corps attendu : tableau JSON non vide de transactions').body(), 400
+    if len(payload) > MAX_BATCH_SIZE:
+        return ApiError(f'au plus {MAX_BATCH_SIZE} transactions par lot', 413).body(), 413
+    results, rows, positions = [], [], []
+    for item in payload:
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('objet attendu')
+            description, category = item.get('description'), item.get('category')
+            suggested, confidence = index.suggest_category(description) if isinstance(description, str) else (None, 0.0)
+            category = index.canonical_category(category) if isinstance(category, str) and category else suggested
+            rows.append(importer.validate_row(description, item.get('amount'), category, item.get('booked_on')))
+        except ValueError as e:
+            results.append({'error': str(e)})
+            continue
+        positions.append(len(results))
+        results.append({'category': category, 'suggested': suggested, 'confidence': confidence})
+    for position, duplicate_of in zip(positions, index.check(rows)):
+        results[position]['duplicate_of'] = duplicate_of
+    return render([json.dumps(result, ensure_ascii=False) for result in results]), 200
+
+
+def create(conn, rows, table='transactions'):
+    """Insère le lot en une transaction ; renvoie les ids créés (consécutifs, dans l'ordre du lot)"""
+    last_id = ledger.bulk_insert(conn, rows, table)
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+def _select(fields, table):
+    pairs = ', '.join(f"'{name}', {name}" for name in fields)
+    return f'SELECT id, json_object({pairs}) FROM "{table}"'
+
+
+def _raw_cursor(conn):
+    cursor = conn.cursor()
+    cursor.row_factory = None  # tuples bruts (id, json)
+    return cursor
+
+
+def get_many(conn, ids, fields=FIELDS, table='transactions'):
+    """Lignes des ids demandés, dans l'ordre de la requête : (morceaux JSON, ids introuvables)"""
+    cursor = _raw_cursor(conn)
+    cursor.execute(_select(fields, table) + ' WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(ids),))
+    found = dict(cursor.fetchall())
+    return [found[i] for i in ids if i in found], [i for i in ids if i not in found]
+
+
+def list_page(conn, filters, before_id=None, limit=DEFAULT_PAGE_SIZE, fields=FIELDS, table='transactions'):
+    """Page de la liste filtrée, par id décroissant : (morceaux JSON, before_id de la page suivante)"""
+    clauses, params = [], []
+    # Mêmes filtres que l'export (catégorie, bornes d'id, période)
+    for key, clause in (('category', 'category = ?'), ('min_id', 'id >= ?'), ('max_id', 'id <= ?'),
+                        ('since', 'booked_on >= ?'), ('until', 'booked_on <= ?')):
+        if key in filters:
+            clauses.append(clause)
+            params.append(filters[key])
+    if before_id is not None:
+        clauses.append('id < ?')
+        params.append(before_id)
+    sql = _select(fields, table)
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    cursor = _raw_cursor(conn)
+    cursor.execute(sql + ' ORDER BY id DESC LIMIT ?', params + [limit])
+    rows = cursor.fetchall()
+    next_before_id = rows[-1][0] if len(rows) == limit else None
+    return [row[1] for row in rows], next_before_id
+
+
+def render(chunks, **meta):
+    """Corps JSON `{"data": [...], ...}` : lignes déjà sérialisées, métadonnées via json.dumps"""
+    tail = ''.join(f', {json.dumps(key)}: {json.dumps(value)}' for key, value in meta.items())
+    return '{"data": [' + ', '.join(chunks) + ']' + tail + '}'
+
+
+def respond(conn, method, args, payload=None, table='transactions'):
+    """Traite une requête de l'API ; renvoie (corps JSON, code HTTP)"""
+    try:
+        if method == 'POST':
+            ids = create(conn, parse_batch(payload), table)
+            return json.dumps({'created': len(ids), 'ids': ids}), 201
+        fields = parse_fields(args.get('fields'))
+        if args.get('ids') is not None:
+            chunks, missing = get_many(conn, parse_ids(args['ids']), fields, table)
+            return render(chunks, missing=missing), 200
+        before_id, limit = parse_page(args)
+        chunks, next_before_id = list_page(conn, parse_filters(args), before_id, limit, fields, table)
+        return render(chunks, next_before_id=next_before_id), 200
+    except ApiError as e:
+        return e.body(), e.status
@@ -1,25 +1,47 @@
 import os
-import ast
-import operator
 import sqlite3
-from flask import Flask, request, render_template_string, redirect, url_for, flash
+import click
+from flask import Blueprint, Flask, Response, request, render_template, redirect, url_for, flash, stream_template, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import FlaskForm, CSRFProtect
 from wtforms import StringField, FloatField, SubmitField
 from wtforms.validators import DataRequired, Length
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
-# --- INITIALISATION ET SÉCURITÉ CONFIG ---
-app = Flask(__name__)
+import api
+import archive
+import db_pool
+import formula
+import ingest
+import ledger
+import ledger_cache
+import metrics
+import migrations
+import page_cache
+import ratelimit
+import reports
+import search_index
+import suggest
+
+# Pagination par clé (keyset) sur l'id de /transactions
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_FETCH_SIZE = 500
 
-# ✅ SÉCURITÉ : Ne jamais coder les secrets en dur. On utilise des variables d'environnement.
-# On génère une clé aléatoire si aucune n'est fournie (standard de sécurité).
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24).hex())
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///budget.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Nombre maximum de résultats renvoyés par /search
+SEARCH_LIMIT = 100
 
 # ✅ SÉCURITÉ : Protection contre les attaques Cross-Site Request Forgery (CSRF)
-csrf = CSRFProtect(app)
-db = SQLAlchemy(app)
+csrf = CSRFProtect()
+db = SQLAlchemy()
+# Routes et commandes, enregistrées sur l'application par create_app()
+bp = Blueprint('budget', __name__, cli_group=None)
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite(dbapi_connection, connection_record):
+    # Configurées une seule fois à l'ouverture : WAL, synchronous=NORMAL, mmap, cache, busy_timeout
+    db_pool.configure_connection(dbapi_connection)
 
 # --- MODÈLES DE DONNÉES (ORM) ---
 # L'utilisation d'un ORM comme SQLAlchemy empêche nativement les injections SQL
@@ -28,6 +50,83 @@ class Transaction(db.Model):
     description = db.Column(db.String(100), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     category = db.Column(db.String(50), nullable=False)
+    # Date de la transaction (AAAA-MM-JJ), indexée par les migrations avec la catégorie et le montant
+    booked_on = db.Column(db.String(10), default=db.func.date('now'))
+
+# --- INITIALISATION ET SÉCURITÉ CONFIG ---
+def create_app(config=None):
+    """Crée l'application : configuration (variables d'environnement, puis `config`), extensions et routes"""
+    app = Flask(__name__)
+    # ✅ SÉCURITÉ : Ne jamais coder les secrets en dur. On utilise des variables d'environnement.
+    # On génère une clé aléatoire si aucune n'est fournie (standard de sécurité).
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', os.urandom(24).hex())
+    # Chemin relatif : dans le dossier instance/ de Flask-SQLAlchemy (BUDGET_DATABASE pour le changer)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.environ.get('BUDGET_DATABASE', 'budget.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # ✅ PERFORMANCE : pool de connexions borné, réutilisé d'une requête à l'autre
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': db_pool.DEFAULT_POOL_SIZE,
+        'max_overflow': 0,
+        'pool_timeout': db_pool.DEFAULT_TIMEOUT,
+        # ✅ PERFORMANCE : chaque instruction SQL (ORM ou brute) est chronométrée, voir /metrics
+        'connect_args': {'factory': metrics.InstrumentedConnection},
+    }
+    # ✅ PERFORMANCE : cache en colonnes du ledger au lieu d'une instance ORM par ligne lue (BUDGET_LEDGER_CACHE=1)
+    app.config['LEDGER_CACHE'] = os.environ.get('BUDGET_LEDGER_CACHE', '0') == '1'
+    # ✅ PERFORMANCE : démarrage rapide, cache et index chargés à la première requête sauf BUDGET_WARMUP=1
+    app.config['WARMUP'] = os.environ.get('BUDGET_WARMUP', '0') == '1'
+    # ✅ SÉCURITÉ : /search et /calculate limités par client (seau à jetons) et en concurrence (BUDGET_RATE_LIMIT=1)
+    app.config['RATE_LIMIT'] = os.environ.get('BUDGET_RATE_LIMIT', '0') == '1'
+    app.config['RATE_LIMIT_STORE'] = os.environ.get('BUDGET_RATE_LIMIT_STORE') or None
+    # ✅ SÉCURITÉ : X-Forwarded-For lu seulement derrière des proxys déclarés de confiance (BUDGET_RATE_LIMIT_TRUSTED_PROXIES)
+    app.config['RATE_LIMIT_TRUSTED_PROXIES'] = int(os.environ.get('BUDGET_RATE_LIMIT_TRUSTED_PROXIES', 0))
+    app.config.update(config or {})
+
+    csrf.init_app(app)
+    # Moteur créé sans connexion : le pool n'en ouvre qu'à la première requête
+    db.init_app(app)
+    metrics.init_app(app)
+    ratelimit.init_app(app)
+    ledger_cache.init_app(app, Transaction.__tablename__)
+    # ✅ PERFORMANCE : suggestions servies par un index de préfixes en mémoire et un cache TTL/LRU
+    suggest.init_app(app, Transaction.__tablename__)
+    # ✅ PERFORMANCE : catégorie suggérée et doublons probables en O(1) par transaction entrante
+    ingest.init_app(app, Transaction.__tablename__)
+    # ✅ PERFORMANCE : templates compilés au premier rendu puis réutilisés
+    page_cache.register_templates(app, TEMPLATES)
+    app.register_blueprint(bp)
+    return app
+
+def raw_connection():
+    """Connexion sqlite3 sous-jacente à la session SQLAlchemy courante"""
+    return db.session.connection().connection.driver_connection
+
+def setup_ledger():
+    """Crée le schéma ORM puis applique les migrations en attente (agrégats, index plein texte, index)"""
+    db.create_all()
+    conn = db.engine.raw_connection()
+    try:
+        applied = migrations.migrate(conn.driver_connection, Transaction.__tablename__)
+        conn.commit()
+    finally:
+        conn.close()
+    return applied
+
+def prepare_server(app):
+    """Processus maître gunicorn, avant le fork : migrations une seule fois, puis fermeture des connexions"""
+    with app.app_context():
+        setup_ledger()
+        if app.config['WARMUP']:
+            ledger_cache.get_cache(raw_connection())
+            suggest.get_index(raw_connection())
+        db.session.remove()
+        db.engine.dispose()
+
+def init_worker(app):
+    """Worker gunicorn, après le fork : le pool SQLAlchemy hérité est écarté sans fermer ses connexions"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+    ratelimit.after_fork(app)
 
 # --- FORMULAIRES SÉCURISÉS (WTForms) ---
 # Valide les données côté serveur pour empêcher les injections XSS ou NaN
@@ -38,60 +137,63 @@ class TransactionForm(FlaskForm):
     submit = SubmitField('Ajouter')
 
 # --- LOGIQUE DE CALCUL SÉCURISÉE (Remplace eval()) ---
-# ✅ SÉCURITÉ : Parseur AST pour limiter strictement les opérations autorisées
+# ✅ SÉCURITÉ : grammaire arithmétique stricte, avec limites (taille, exposant, ordre de grandeur)
+# ✅ PERFORMANCE : formule analysée une seule fois, compilée en fermetures et mise en cache (LRU)
 def safe_eval(expr):
-    allowed_operators = {
-        ast.Add: operator.add, ast.Sub: operator.sub, 
-        ast.Mult: operator.mul, ast.Div: operator.truediv, 
-        ast.Pow: operator.pow, ast.USub: operator.neg,
-        ast.UAdd: operator.pos
-    }
-    
     try:
-        node = ast.parse(expr, mode='eval').body
-        def _eval(node):
-            if isinstance(node, ast.Num): 
-                return node.n
-            elif isinstance(node, ast.BinOp):
-                return allowed_operators[type(node.op)](_eval(node.left), _eval(node.right))
-            elif isinstance(node, ast.UnaryOp):
-                return allowed_operators[type(node.op)](_eval(node.operand))
-            else:
-                raise ValueError("Opération non autorisée détectée.")
-        return _eval(node)
-    except Exception:
+        return formula.evaluate(expr)
+    except formula.FormulaError:
         raise ValueError("Formule invalide ou dangereuse.")
 
 # --- ROUTES ---
 
-@app.route('/')
+@bp.route('/')
 def index():
     form = TransactionForm()
-    # Utilisation de templates pour éviter le XSS lié au render_template_string
-    return render_template_string(BASE_TEMPLATE, form=form)
+    # Templates enregistrés et compilés une seule fois (évite aussi le XSS lié au render_template_string)
+    # Pas de cache de page ici : la page contient le jeton CSRF de la session et les messages flash
+    return render_template('base.html', form=form)
 
-@app.route('/search', methods=['POST'])
+@bp.route('/search', methods=['POST'])
 def search():
-    # ✅ SÉCURITÉ : Utilisation de l'ORM avec paramètres (protection SQLi)
+    # ✅ SÉCURITÉ : Requête paramétrée (protection SQLi)
+    # ✅ PERFORMANCE : index FTS5 classé et limité au lieu d'un LIKE '%...%' sur toute la table
     query = request.form.get('query', '')
-    results = Transaction.query.filter(Transaction.description.contains(query)).all()
-    return render_template_string(RESULTS_TEMPLATE, results=results, query=query)
+    conn = raw_connection()
+    cache = ledger_cache.get_cache(conn)
+    # ✅ PERFORMANCE : vocabulaire construit ici seulement avec le cache du ledger, sinon réutilisé s'il est chaud
+    vocabulary = suggest.get_index(conn) if cache else suggest.warm_index(conn)
+    ids = search_index.search_ids(conn, query, SEARCH_LIMIT, Transaction.__tablename__, vocabulary) if cache else None
+    if ids is not None:
+        results = cache.lookup(ids)
+    else:
+        results = search_index.search(conn, query, SEARCH_LIMIT, Transaction.__tablename__, vocabulary)
+    return render_template('results.html', results=results, query=query)
+
+@bp.route('/api/search/suggest')
+def search_suggest():
+    # Lecture seule en GET : pas de jeton CSRF à fournir pour la frappe
+    query = request.args.get('q', '')
+    suggestions = suggest.cached_suggest(raw_connection(), query, suggest.parse_limit(request.args))
+    return jsonify({'q': query, 'suggestions': suggestions})
 
-@app.route('/calculate', methods=['POST'])
+@bp.route('/calculate', methods=['POST'])
 def calculate():
     formula = request.form.get('formula', '0')
     try:
         # ✅ SÉCURITÉ : Plus d'eval(), utilisation de safe_eval
         result = safe_eval(formula)
-        return render_template_string(CALC_TEMPLATE, result=result, formula=formula)
+        return render_template('calc.html', result=result, formula=formula)
     except ValueError as e:
         flash(str(e), "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('.index'))
 
-@app.route('/add', methods=['POST'])
+@bp.route('/add', methods=['POST'])
 def add_transaction():
     form = TransactionForm()
     if form.validate_on_submit():
+        # Même description normalisée, même montant, même jour : ajout conservé mais signalé
+        duplicate_of = ingest.get_index(raw_connection()).find_duplicate(form.description.data, form.amount.data)
         new_tx = Transaction(
             description=form.description.data,
             amount=form.amount.data,
@@ -100,13 +202,149 @@ def add_transaction():
         db.session.add(new_tx)
         db.session.commit()
         flash("✅ Transaction ajoutée avec succès !", "success")
-    return redirect(url_for('index'))
+        if duplicate_of:
+            flash(f"⚠️ Doublon probable de la transaction #{duplicate_of}", "warning")
+    return redirect(url_for('.index'))
 
-@app.route('/transactions')
+def ledger_version():
+    return ledger.read_version(raw_connection())
+
+@bp.route('/transactions')
+# ✅ PERFORMANCE : page mise en cache par version du ledger, ETag fort et réponses 304
+@page_cache.cached_page(ledger_version)
 def list_transactions():
-    transactions = Transaction.query.order_by(Transaction.id.desc()).all()
-    total = sum(t.amount for t in transactions)
-    return render_template_string(LIST_TEMPLATE, transactions=transactions, total=total)
+    # ✅ PERFORMANCE : pagination par clé (?before_id=&limit=) au lieu de .all() sur toute la table
+    before_id = request.args.get('before_id', type=int)
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    cache = ledger_cache.get_cache(raw_connection())
+    if cache is not None:
+        # ✅ PERFORMANCE : lignes lues dans le cache en colonnes, sans requête SQL ni objet ORM
+        if request.args.get('stream'):
+            return stream_template('list.html', transactions=cache.iter_rows(before_id),
+                                   total=cache.balance(), next_before_id=None, limit=limit)
+        transactions = cache.page(before_id, limit)
+        next_before_id = transactions[-1]['id'] if len(transactions) == limit else None
+        return render_template('list.html', transactions=transactions, total=cache.balance(),
+                               next_before_id=next_before_id, limit=limit)
+
+    query = Transaction.query.order_by(Transaction.id.desc())
+    if before_id is not None:
+        query = query.filter(Transaction.id < before_id)
+    # ✅ PERFORMANCE : solde lu dans les agrégats tenus à jour par triggers (O(1))
+    total = ledger.read_balance(raw_connection())
+
+    if request.args.get('stream'):
+        # Mode flux : les lignes sont lues par blocs et envoyées au fil du rendu
+        return stream_template('list.html', transactions=query.yield_per(STREAM_FETCH_SIZE),
+                               total=total, next_before_id=None, limit=limit)
+
+    transactions = query.limit(limit).all()
+    next_before_id = transactions[-1].id if len(transactions) == limit else None
+    return render_template('list.html', transactions=transactions, total=total,
+                           next_before_id=next_before_id, limit=limit)
+
+@bp.route('/reports')
+# ✅ PERFORMANCE : rapport lu dans les rollups mensuels (mois × catégories lignes), indépendant de la taille du ledger
+@page_cache.cached_page(ledger_version)
+def monthly_reports():
+    try:
+        filters = reports.parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(reports.monthly_report(raw_connection(), filters))
+
+@bp.route('/api/v1/transactions', methods=['GET', 'POST'])
+# ✅ SÉCURITÉ : pas de jeton CSRF pour l'API JSON, mais Content-Type application/json exigé en écriture :
+# un formulaire d'un autre site ne peut pas l'envoyer sans preflight CORS
+@csrf.exempt
+def api_transactions():
+    # ✅ PERFORMANCE : lots validés avec les règles de TransactionForm, insérés en une transaction,
+    # lignes sérialisées en JSON par SQLite sans objet ORM
+    if request.method == 'GET':
+        body, status = api.respond(raw_connection(), 'GET', request.args, table=Transaction.__tablename__)
+    elif not request.is_json:
+        body, status = api.ApiError('Content-Type application/json requis', 415).body(), 415
+    else:
+        # Connexion dédiée du pool : l'écriture par lot gère elle-même sa transaction
+        conn = db.engine.raw_connection()
+        try:
+            body, status = api.respond(conn.driver_connection, 'POST', request.args,
+                                       request.get_json(silent=True), Transaction.__tablename__)
+        finally:
+            conn.close()
+    return Response(body, status, mimetype='application/json')
+
+@bp.route('/api/v1/transactions/check', methods=['POST'])
+@csrf.exempt
+def api_check_transactions():
+    # Lecture seule : catégorie suggérée et doublon probable, sans insertion
+    if not request.is_json:
+        return Response(api.ApiError('Content-Type application/json requis', 415).body(), 415,
+                        mimetype='application/json')
+    body, status = api.check_batch(ingest.get_index(raw_connection()), request.get_json(silent=True))
+    return Response(body, status, mimetype='application/json')
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    # ✅ PERFORMANCE : latence par route, temps SQL et requêtes lentes au format Prometheus
+    return metrics.metrics_response()
+
+# --- COMMANDES ---
+
+@bp.cli.command('init-db')
+def init_db_command():
+    """Crée la base ou met son schéma à niveau, sans toucher aux transactions (idempotent)"""
+    applied = setup_ledger()
+    click.echo(f"✓ Base initialisée (schéma v{migrations.MIGRATIONS[-1][0]}, {len(applied)} migration(s) appliquée(s))")
+
+@bp.cli.command('migrate')
+def migrate_command():
+    """Met à niveau le schéma de la base de données sans toucher aux transactions"""
+    applied = setup_ledger()
+    click.echo(f"✓ Schéma en version {migrations.MIGRATIONS[-1][0]}" + ('' if applied else ' (déjà à jour)'))
+
+@bp.cli.command('rebuild-totals')
+def rebuild_totals_command():
+    """Reconstruit le solde et les totaux par catégorie à partir des transactions"""
+    setup_ledger()
+    totals = ledger.rebuild_totals(raw_connection(), Transaction.__tablename__)
+    click.echo(f"✓ Totaux reconstruits : {totals['count']} transactions, solde {totals['balance']:.2f} €")
+
+@bp.cli.command('rebuild-reports')
+def rebuild_reports_command():
+    """Reconstruit les rollups mensuels à partir des transactions (après une reprise d'historique)"""
+    setup_ledger()
+    rows = reports.rebuild_rollups(raw_connection(), Transaction.__tablename__)
+    click.echo(f"✓ Rollups reconstruits : {rows} lignes (mois × catégorie)")
+
+@bp.cli.command('verify-totals')
+def verify_totals_command():
+    """Vérifie les totaux incrémentaux contre un parcours complet de la table"""
+    errors = ledger.verify_totals(raw_connection(), Transaction.__tablename__)
+    if errors:
+        for error in errors:
+            click.echo(f"❌ {error}", err=True)
+        raise SystemExit(1)
+    click.echo("✓ Totaux cohérents avec les transactions")
+
+@bp.cli.command('archive')
+@click.option('--before', help='Premier mois gardé dans la table (AAAA-MM)')
+@click.option('--keep-months', type=click.IntRange(min=1), default=12, show_default=True,
+              help='Mois gardés dans la table, le mois courant compris (sans --before)')
+def archive_command(before, keep_months):
+    """Déplace les mois clos dans des partitions annuelles en lecture seule"""
+    # ✅ PERFORMANCE : la table chaude (et ses index) ne garde que les mois ouverts, les totaux restent exacts
+    setup_ledger()
+    month = before or archive.cutoff_month(keep_months)
+    conn = db.engine.raw_connection()
+    try:
+        archived = archive.archive_before(conn.driver_connection, month, Transaction.__tablename__)
+    except (ValueError, archive.ArchiveConflict) as e:
+        click.echo(f"❌ {e}", err=True)
+        raise SystemExit(1)
+    finally:
+        conn.close()
+    click.echo(f"✓ Transactions antérieures à {month} archivées ({sum(archived.values())} lignes)")
 
 # --- TEMPLATES (SÉCURISÉS) ---
 # Note : En production, ces blocs doivent être dans des fichiers .html séparés.
@@ -168,18 +406,32 @@ LIST_TEMPLATE = '''
 <h1>📋 Transactions</h1>
 <h3>Solde Total : {{ total }} €</h3>
 <table border="1">
-    <tr><th>ID</th><th>Description</th><th>Montant</th><th>Catégorie</th></tr>
+    <tr><th>ID</th><th>Date</th><th>Description</th><th>Montant</th><th>Catégorie</th></tr>
     {% for t in transactions %}
-    <tr><td>{{ t.id }}</td><td>{{ t.description }}</td><td>{{ t.amount }}</td><td>{{ t.category }}</td></tr>
+    <tr><td>{{ t.id }}</td><td>{{ t.booked_on }}</td><td>{{ t.description }}</td><td>{{ t.amount }}</td><td>{{ t.category }}</td></tr>
     {% endfor %}
 </table>
+{% if next_before_id %}<br><a href="/transactions?before_id={{ next_before_id }}&limit={{ limit }}">Page suivante</a>{% endif %}
 <br><a href="/">Retour</a>
 '''
 
+TEMPLATES = {
+    'base.html': BASE_TEMPLATE,
+    'results.html': RESULTS_TEMPLATE,
+    'calc.html': CALC_TEMPLATE,
+    'list.html': LIST_TEMPLATE,
+}
+
+app = create_app()
+
 # --- DÉMARRAGE ---
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all() # Crée la base de données de manière sécurisée
+        setup_ledger() # Crée la base de données ou applique les seules migrations en attente, données conservées
+        if app.config['WARMUP']:
+            ledger_cache.get_cache(raw_connection())  # Chargé au démarrage si activé
+            suggest.get_index(raw_connection())
     
     # ✅ SÉCURITÉ : debug=False impératif en production. Host restreint à localhost
+    # ✅ PERFORMANCE : serveur de développement ; en production, gunicorn wsgi:app (BUDGET_APP=corrige)
     app.run(debug=False, host='127.0.0.1', port=5000)
@@ -1,63 +1,198 @@
-from flask import Flask, request, render_template_string
+from flask import Blueprint, Flask, current_app, request, render_template, Response, stream_with_context, jsonify, send_file
 import sqlite3
 import os
+from array import array
+from itertools import islice
+from operator import itemgetter
+import click
 
-app = Flask(__name__)
+import api
+import archive
+import db_pool
+import exporter
+import formula as formula_engine
+import importer
+import ingest
+import jobs
+import ledger
+import ledger_cache
+import live
+import metrics
+import migrations
+import page_cache
+import ratelimit
+import reports
+import search_index
+import shards
+import suggest
+import write_queue
+
+# Routes et commandes, enregistrées sur l'application par create_app()
+bp = Blueprint('budget', __name__, cli_group=None)
+
+def create_app(config=None):
+    """Crée l'application : configuration (variables BUDGET_*, puis `config`), extensions, routes et commandes.
+
+    Rien n'est ouvert ni chargé ici : pool de connexions, file d'écriture, cache du ledger,
+    index de suggestions et templates sont créés au premier usage.
+    """
+    app = Flask(__name__)
+    app.config['DATABASE'] = os.environ.get('BUDGET_DATABASE', 'budget.db')
+    app.config['DB_POOL_SIZE'] = int(os.environ.get('BUDGET_DB_POOL_SIZE', db_pool.DEFAULT_POOL_SIZE))
+    # Latence par route, temps SQL par instruction, requêtes lentes (> SLOW_QUERY_MS) ; exposés sur /metrics
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('BUDGET_SLOW_QUERY_MS', metrics.DEFAULT_SLOW_QUERY_MS))
+    # Écriture différée de /add avec commit groupé (BUDGET_WRITE_BEHIND=1 pour l'activer)
+    app.config['WRITE_BEHIND'] = os.environ.get('BUDGET_WRITE_BEHIND', '0') == '1'
+    # Cache en colonnes du ledger pour /transactions, /search et les agrégats (BUDGET_LEDGER_CACHE=1 pour l'activer)
+    app.config['LEDGER_CACHE'] = os.environ.get('BUDGET_LEDGER_CACHE', '0') == '1'
+    # Un fichier SQLite par locataire (en-tête X-Tenant) si BUDGET_SHARDS_DIR est défini
+    app.config['SHARDS_DIR'] = os.environ.get('BUDGET_SHARDS_DIR')
+    # Chargement du cache et de l'index de suggestions au démarrage plutôt qu'à la première requête
+    app.config['WARMUP'] = os.environ.get('BUDGET_WARMUP', '0') == '1'
+    # Relecture de l'état du ledger par le diffuseur de /stream (écritures des autres processus), en s
+    app.config['LIVE_POLL'] = float(os.environ.get('BUDGET_LIVE_POLL', live.DEFAULT_POLL))
+    # Seau à jetons par client et places limitées pour /search, /calculate et /api/formula (BUDGET_RATE_LIMIT=1) ;
+    # seaux partagés entre workers dans BUDGET_RATE_LIMIT_STORE (fichier SQLite, ex. /dev/shm/budget-ratelimit.db)
+    app.config['RATE_LIMIT'] = os.environ.get('BUDGET_RATE_LIMIT', '0') == '1'
+    app.config['RATE_LIMIT_STORE'] = os.environ.get('BUDGET_RATE_LIMIT_STORE') or None
+    # Derrière un reverse proxy : nombre de proxys de confiance, le client est lu dans X-Forwarded-For
+    app.config['RATE_LIMIT_TRUSTED_PROXIES'] = int(os.environ.get('BUDGET_RATE_LIMIT_TRUSTED_PROXIES', 0))
+    # Taille des lots (et des transactions SQL) de l'import en masse
+    app.config['IMPORT_BATCH_SIZE'] = importer.DEFAULT_BATCH_SIZE
+    app.config['SECRET_KEY'] = SECRET_KEY
+    app.config.update(config or {})
+
+    db_pool.init_app(app)
+    metrics.init_app(app)
+    ratelimit.init_app(app)
+    write_queue.init_app(app)
+    ledger_cache.init_app(app)
+    # Index de préfixes en mémoire pour les suggestions de /api/search/suggest, réutilisé par /search
+    suggest.init_app(app)
+    # Catégorie suggérée et doublons probables des transactions entrantes (/add, /import)
+    ingest.init_app(app)
+    # Flux SSE des nouvelles transactions et du solde (/stream), un thread diffuseur par base
+    live.init_app(app)
+    shards.init_app(app)
+    page_cache.register_templates(app, {'index.html': INDEX_TEMPLATE})
+    app.register_blueprint(bp)
+    return app
+
+# Pagination par clé (keyset) sur l'id de /transactions
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+STREAM_FETCH_SIZE = 500
+
+# Nombre maximum de résultats renvoyés par /search
+SEARCH_LIMIT = 100
+
+# Mois gardés dans la table chaude par la commande `flask archive` (le mois courant compris)
+ARCHIVE_KEEP_MONTHS = 12
 
 # ❌ VULNÉRABILITÉ 1: Secrets en dur dans le code
 DATABASE_PASSWORD = "admin123"
 SECRET_KEY = "my-secret-key-12345"
-app.config['SECRET_KEY'] = SECRET_KEY
 
-def init_db():
-    """Initialise la base de données avec quelques données de test"""
-    conn = sqlite3.connect('budget.db')
-    cursor = conn.cursor()
-    
-    # Créer la table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            description TEXT NOT NULL,
-            amount REAL NOT NULL,
-            category TEXT
+# Données de démonstration insérées par `flask seed` (ou au lancement direct) si la table est vide
+DEMO_TRANSACTIONS = [
+    ('Salaire mensuel', 3000.00, 'Revenu'),
+    ('Courses Carrefour', -150.50, 'Alimentation'),
+    ('Loyer appartement', -800.00, 'Logement'),
+    ('Électricité EDF', -80.00, 'Factures'),
+    ('Abonnement Netflix', -15.99, 'Loisirs'),
+    ('Restaurant', -45.00, 'Alimentation'),
+    ('Essence voiture', -60.00, 'Transport'),
+    ('Bonus travail', 500.00, 'Revenu'),
+]
+
+def init_db(app, seed=True):
+    """Met le schéma à niveau (migrations en attente seulement) puis, si `seed`, insère les données de test
+    dans une table vide. Idempotent : les transactions existantes sont conservées."""
+    conn = db_pool.configure_connection(sqlite3.connect(app.config['DATABASE']))
+    try:
+        # Table, agrégats du ledger, index plein texte, dates et index : migrations versionnées
+        applied = migrations.migrate(conn)
+        seeded = seed_db(conn) if seed else 0
+    finally:
+        conn.close()
+    print(f"✓ Base de données initialisée (schéma v{migrations.MIGRATIONS[-1][0]}, "
+          f"{len(applied)} migration(s) appliquée(s), {seeded} transaction(s) de test)")
+    return applied, seeded
+
+def seed_db(conn):
+    """Insère les données de test si la table est vide ; renvoie le nombre de lignes insérées"""
+    if conn.execute('SELECT 1 FROM transactions LIMIT 1').fetchone() is not None:
+        return 0
+    with conn:
+        conn.executemany(
+            "INSERT INTO transactions (description, amount, category, booked_on) VALUES (?, ?, ?, date('now'))",
+            DEMO_TRANSACTIONS
         )
-    ''')
-    
-    # Vider la table si elle existe déjà
-    cursor.execute('DELETE FROM transactions')
-    
-    # Insérer des données de test
-    test_data = [
-        ('Salaire mensuel', 3000.00, 'Revenu'),
-        ('Courses Carrefour', -150.50, 'Alimentation'),
-        ('Loyer appartement', -800.00, 'Logement'),
-        ('Électricité EDF', -80.00, 'Factures'),
-        ('Abonnement Netflix', -15.99, 'Loisirs'),
-        ('Restaurant', -45.00, 'Alimentation'),
-        ('Essence voiture', -60.00, 'Transport'),
-        ('Bonus travail', 500.00, 'Revenu'),
-    ]
-    
-    cursor.executemany(
-        'INSERT INTO transactions (description, amount, category) VALUES (?, ?, ?)',
-        test_data
-    )
-    
-    conn.commit()
-    conn.close()
-    print("✓ Base de données initialisée avec succès")
+    return len(DEMO_TRANSACTIONS)
+
+def warm_up(app):
+    """Charge les index de suggestions et de contrôle (et le cache du ledger s'il est activé) sans attendre
+    la première requête"""
+    with app.app_context():
+        conn = get_db_connection()
+        print(f"✓ Index de suggestions : {suggest.get_index(conn).stats()['words']} mots")
+        print(f"✓ Index des doublons : {ingest.get_index(conn).stats()['fingerprints']} empreintes")
+        if app.config['LEDGER_CACHE']:
+            print(f"✓ Cache du ledger chargé : {ledger_cache.get_cache(conn).stats()['rows']} transactions")
+
+def prepare_server(app):
+    """Processus maître gunicorn, avant le fork : migrations (une seule fois) et préchargement éventuel
+    partagé par les workers ; aucune connexion SQLite ne reste ouverte ensuite"""
+    init_db(app, seed=False)
+    if app.config['WARMUP']:
+        warm_up(app)
+    db_pool.close_pool(app)
+
+def init_worker(app):
+    """Worker gunicorn, après le fork : pool, file d'écriture et shards propres au processus"""
+    db_pool.after_fork(app)
+    write_queue.after_fork(app)
+    live.after_fork(app)
+    ratelimit.after_fork(app)
+    shards.after_fork(app)
 
 def get_db_connection():
-    """Retourne une connexion à la base de données"""
-    conn = sqlite3.connect('budget.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Retourne la connexion de la requête courante (empruntée au pool, rendue en fin de requête)"""
+    return db_pool.get_connection()
 
-@app.route('/')
-def index():
-    """Page d'accueil avec formulaires"""
-    return render_template_string('''
+def get_ledger_cache():
+    """Cache en colonnes synchronisé avec la base, ou None s'il est désactivé"""
+    return ledger_cache.get_cache(get_db_connection())
+
+def iter_batches(cursor, size=STREAM_FETCH_SIZE):
+    """Parcourt un curseur par blocs de `size` lignes sans tout charger en mémoire"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield rows
+
+def parse_page_args(args):
+    """Lit `before_id` et `limit` depuis la query string (limit borné)"""
+    before_id = args.get('before_id', type=int)
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return before_id, limit
+
+def query_transactions_page(conn, before_id=None, limit=None):
+    """Curseur sur les transactions triées par id décroissant, à partir de `before_id`"""
+    sql = 'SELECT id, description, amount, category, booked_on FROM transactions'
+    params = []
+    if before_id is not None:
+        sql += ' WHERE id < ?'
+        params.append(before_id)
+    sql += ' ORDER BY id DESC'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return conn.execute(sql, params)
+
+INDEX_TEMPLATE = '''
         <!DOCTYPE html>
         <html lang="fr">
         <head>
@@ -180,7 +315,8 @@ def index():
                         <button type="submit">Calculer</button>
                     </form>
                     <p style="font-size: 0.9em; color: #666; margin-top: 10px;">
-                        Opérations : +, -, *, /, (), puissance avec **
+                        Opérations : +, -, *, /, (), puissance avec **<br>
+                        Agrégats : sum(Catégorie), avg(...), count(...), min(...), max(...)
                     </p>
                 </div>
                 
@@ -189,7 +325,7 @@ def index():
                     <form action="/add" method="post">
                         <input type="text" name="description" placeholder="Description" required>
                         <input type="number" step="0.01" name="amount" placeholder="Montant (positif=revenu, négatif=dépense)" required>
-                        <input type="text" name="category" placeholder="Catégorie" required>
+                        <input type="text" name="category" placeholder="Catégorie (suggérée si vide)">
                         <button type="submit">Ajouter</button>
                     </form>
                 </div>
@@ -202,26 +338,43 @@ def index():
             </div>
         </body>
         </html>
-    ''')
+    '''
 
-@app.route('/search', methods=['POST'])
+def ledger_version():
+    """Version courante du ledger (clé des caches de pages), préfixée du locataire si les bases sont partitionnées"""
+    version = ledger.read_version(get_db_connection())
+    if shards.get_router() is not None:
+        return f'{shards.current_tenant()}.{version}'
+    return version
+
+@bp.route('/')
+@page_cache.cached_page(ledger_version)
+def index():
+    """Page d'accueil avec formulaires"""
+    return render_template('index.html')
+
+@bp.route('/search', methods=['POST'])
 def search():
-    """Recherche de transactions - VULNÉRABLE À L'INJECTION SQL"""
-    # ❌ VULNÉRABILITÉ 2: Injection SQL
+    """Recherche de transactions dans l'index plein texte"""
     query = request.form.get('query', '')
     
     conn = get_db_connection()
-    cursor = conn.cursor()
     
-    # Construction DANGEREUSE de la requête SQL avec f-string
-    sql = f"SELECT * FROM transactions WHERE description LIKE '%{query}%'"
-    
-    # Afficher la requête SQL dans la console (pour debug)
-    print(f"[SQL QUERY] {sql}")
+    # Recherche via l'index FTS5 (classée, par préfixe, limitée), LIKE en secours
+    # (temps d'exécution mesuré par l'instrumentation SQL, voir /metrics)
+    sql = search_index.match_expression(query)
     
     try:
-        results = cursor.execute(sql).fetchall()
-        conn.close()
+        cache = get_ledger_cache()
+        # Vocabulaire des descriptions : saisies sans correspondance écartées sans requête SQL. Construit
+        # ici seulement avec le cache du ledger ; sinon utilisé s'il est déjà chaud (suggestions, WARMUP)
+        vocabulary = suggest.get_index(conn) if cache is not None else suggest.warm_index(conn)
+        ids = search_index.search_ids(conn, query, SEARCH_LIMIT, vocabulary=vocabulary) if cache is not None else None
+        if ids is not None:
+            # L'index FTS5 donne les ids classés, les lignes sont lues dans le cache
+            results = cache.lookup(ids)
+        else:
+            results = search_index.search(conn, query, SEARCH_LIMIT, vocabulary=vocabulary)
         
         # Construction du HTML de réponse
         html = '''
@@ -260,7 +413,6 @@ def search():
         return html
         
     except Exception as e:
-        conn.close()
         return f'''
         <html>
         <body style="font-family: Arial; margin: 40px;">
@@ -274,16 +426,21 @@ def search():
         </html>
         '''
 
-@app.route('/calculate', methods=['POST'])
+@bp.route('/api/search/suggest')
+def search_suggest():
+    """Suggestions à la frappe (JSON) : catégories et mots des descriptions commençant par ?q= (?limit=)"""
+    query = request.args.get('q', '')
+    suggestions = suggest.cached_suggest(get_db_connection(), query, suggest.parse_limit(request.args))
+    return jsonify({'q': query, 'suggestions': suggestions})
+
+@bp.route('/calculate', methods=['POST'])
 def calculate():
-    """Calculatrice - VULNÉRABLE À L'EXÉCUTION DE CODE ARBITRAIRE"""
-    # ❌ VULNÉRABILITÉ 3: Utilisation de eval() - TRÈS DANGEREUX
+    """Calculatrice - formules compilées et mises en cache par le moteur de formules"""
     formula = request.form.get('formula', '0')
     
     try:
-        # eval() exécute du code Python arbitraire !
-        # Un attaquant peut faire : __import__('os').system('commande')
-        result = eval(formula)
+        # Grammaire arithmétique restreinte, avec limites (taille, exposant, ordre de grandeur)
+        result = formula_engine.evaluate(formula, formula_categories(formula))
         
         return f'''
         <html>
@@ -311,7 +468,7 @@ def calculate():
         </body>
         </html>
         '''
-    except Exception as e:
+    except formula_engine.FormulaError as e:
         return f'''
         <html>
         <body style="font-family: Arial; margin: 40px;">
@@ -325,7 +482,73 @@ def calculate():
         </html>
         '''
 
-@app.route('/add', methods=['POST'])
+def formula_categories(formula):
+    """Agrégats par catégorie, lus seulement si la formule y fait référence"""
+    if formula_engine.compile_formula(formula).uses_aggregates:
+        cache = get_ledger_cache()
+        if cache is not None:
+            return cache.category_totals()
+        return ledger.read_category_totals(get_db_connection())
+    return None
+
+def load_amount_column(conn, category=None):
+    """Colonnes (ids, montants) des transactions, en tableaux compacts"""
+    ids, amounts = array('q'), array('d')
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    if category is None:
+        cursor.execute('SELECT id, amount FROM transactions ORDER BY id')
+    else:
+        cursor.execute('SELECT id, amount FROM transactions WHERE category = ? ORDER BY id', (category,))
+    for rows in iter_batches(cursor, 10_000):
+        ids.extend(map(itemgetter(0), rows))
+        amounts.extend(map(itemgetter(1), rows))
+    return ids, amounts
+
+@bp.route('/api/formula', methods=['POST'])
+def formula_api():
+    """Évalue une formule en JSON : {"formula", "mode": "scalar"|"rows", "category", "limit"}
+
+    En mode `rows`, la formule est appliquée en un lot vectorisé à chaque transaction
+    (de la catégorie si précisée), `amount` désignant le montant de la ligne.
+    """
+    payload = request.get_json(silent=True) or {}
+    text = payload.get('formula')
+    if not isinstance(text, str):
+        return jsonify({'error': 'champ « formula » requis'}), 400
+    mode = payload.get('mode', 'scalar')
+    try:
+        limit = max(0, min(int(payload.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit doit être un entier'}), 400
+
+    try:
+        categories = formula_categories(text)
+        if mode == 'scalar':
+            return jsonify({'formula': text, 'result': formula_engine.evaluate(text, categories)})
+        if mode != 'rows':
+            return jsonify({'error': f"mode inconnu {mode!r}"}), 400
+        cache = get_ledger_cache()
+        if cache is not None:
+            ids, amounts = cache.amount_column(payload.get('category'))
+        else:
+            ids, amounts = load_amount_column(get_db_connection(), payload.get('category'))
+        results = formula_engine.evaluate_batch(text, amounts, categories)
+    except formula_engine.FormulaError as e:
+        return jsonify({'error': str(e)}), 400
+
+    count = len(results)
+    total, low, high = formula_engine.summarize_column(results)
+    return jsonify({
+        'formula': text,
+        'count': count,
+        'sum': total,
+        'min': low,
+        'max': high,
+        'rows': [{'id': ids[i], 'amount': amounts[i], 'result': float(results[i])} for i in range(min(limit, count))],
+    })
+
+@bp.route('/add', methods=['POST'])
 def add_transaction():
     """Ajout d'une transaction - PAS DE PROTECTION CSRF"""
     # ❌ VULNÉRABILITÉ 4: Pas de protection CSRF
@@ -334,6 +557,10 @@ def add_transaction():
     description = request.form.get('description')
     amount = request.form.get('amount')
     category = request.form.get('category')
+    # Catégorie facultative : suggérée d'après les mots de la description (index mot → catégorie)
+    index = ingest.get_index(get_db_connection())
+    if description and not category:
+        category, _ = index.suggest_category(description)
     
     # Validation minimale
     if not description or not amount or not category:
@@ -360,15 +587,36 @@ def add_transaction():
         </html>
         ''', 400
     
+    # Même description, même montant, même jour : doublon probable (insertion conservée, signalée)
+    duplicate_of = index.find_duplicate(description, amount_float)
+    warning = f'<p style="color: #e65100;">⚠️ Doublon probable de la transaction #{duplicate_of}</p>' if duplicate_of else ''
+
     # Insérer dans la base de données
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO transactions (description, amount, category) VALUES (?, ?, ?)',
-        (description, amount_float, category)
-    )
-    conn.commit()
-    conn.close()
+    # (la file d'écriture différée sert la base principale : chaque shard a déjà son propre verrou d'écriture)
+    queue = write_queue.get_queue() if shards.get_router() is None else None
+    if queue is not None:
+        # Écriture différée : commit groupé avec les requêtes concurrentes, réponse une fois le lot durable
+        try:
+            queue.write((description, amount_float, category, None), current_app.config['WRITE_TIMEOUT'])
+        except write_queue.WriteTimeout:
+            return '''
+        <html>
+        <body style="font-family: Arial; margin: 40px;">
+            <h1 style="color: #c62828;">❌ Erreur</h1>
+            <p>Serveur surchargé, réessayez dans un instant.</p>
+            <a href="/" style="display: inline-block; margin-top: 20px; padding: 10px 20px; background: #667eea; color: white; text-decoration: none; border-radius: 5px;">← Retour</a>
+        </body>
+        </html>
+        ''', 503
+    else:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO transactions (description, amount, category, booked_on) VALUES (?, ?, ?, date('now'))",
+            (description, amount_float, category)
+        )
+        conn.commit()
+        ledger.notify_committed()
     
     return f'''
     <html>
@@ -389,6 +637,7 @@ def add_transaction():
                 <p><strong>Montant :</strong> {amount_float} €</p>
                 <p><strong>Catégorie :</strong> {category}</p>
             </div>
+            {warning}
             <a href="/" style="display: inline-block; padding: 12px 25px; background: #667eea; color: white; text-decoration: none; border-radius: 5px; margin: 10px;">← Retour</a>
             <a href="/transactions" style="display: inline-block; padding: 12px 25px; background: #28a745; color: white; text-decoration: none; border-radius: 5px; margin: 10px;">Voir toutes les transactions</a>
         </div>
@@ -396,17 +645,7 @@ def add_transaction():
     </html>
     '''
 
-@app.route('/transactions')
-def transactions():
-    """Affiche toutes les transactions"""
-    conn = get_db_connection()
-    transactions = conn.execute('SELECT * FROM transactions ORDER BY id DESC').fetchall()
-    conn.close()
-    
-    # Calculer le solde total
-    total = sum(t['amount'] for t in transactions)
-    
-    html = '''
+TRANSACTIONS_PAGE_HEAD = '''
     <!DOCTYPE html>
     <html lang="fr">
     <head>
@@ -432,34 +671,467 @@ def transactions():
         <div class="container">
             <h1>📋 Toutes vos transactions</h1>
     '''
-    
-    html += f'''
+
+TRANSACTIONS_TABLE_HEAD = '<table><tr><th>ID</th><th>Date</th><th>Description</th><th>Montant</th><th>Catégorie</th></tr>'
+
+def render_transaction_row(row):
+    """Ligne HTML d'une transaction"""
+    amount_class = 'positive' if row['amount'] > 0 else 'negative'
+    return f'<tr><td>#{row["id"]}</td><td>{row["booked_on"]}</td><td>{row["description"]}</td><td class="{amount_class}">{row["amount"]:.2f} €</td><td>{row["category"]}</td></tr>'
+
+def render_summary(total):
+    return f'''
             <div class="summary">
                 <h2>Solde total : {total:.2f} €</h2>
             </div>
     '''
-    
-    if transactions:
-        html += '<table><tr><th>ID</th><th>Description</th><th>Montant</th><th>Catégorie</th></tr>'
-        for row in transactions:
-            amount_class = 'positive' if row['amount'] > 0 else 'negative'
-            html += f'<tr><td>#{row["id"]}</td><td>{row["description"]}</td><td class="{amount_class}">{row["amount"]:.2f} €</td><td>{row["category"]}</td></tr>'
-        html += '</table>'
+
+# Première page de /transactions : nouvelles lignes et solde reçus par /stream, sans recharger la page
+LIVE_SCRIPT = '''
+    <script>
+        const feed = new EventSource('/stream?last_event_id={last_id}&tenant={tenant}');
+        const table = document.querySelector('table');
+        feed.addEventListener('transactions', (event) => {{
+            for (const row of JSON.parse(event.data)) {{
+                const tr = table.insertRow(1);
+                for (const value of ['#' + row.id, row.booked_on, row.description, row.amount.toFixed(2) + ' €', row.category]) {{
+                    tr.insertCell().textContent = value;
+                }}
+                tr.cells[3].className = row.amount > 0 ? 'positive' : 'negative';
+            }}
+        }});
+        feed.addEventListener('balance', (event) => {{
+            document.querySelector('.summary h2').textContent = 'Solde total : ' + JSON.parse(event.data).balance.toFixed(2) + ' €';
+        }});
+        feed.addEventListener('reset', () => location.reload());
+    </script>
+'''
+
+def ledger_total(conn):
+    """Solde total lu dans les agrégats maintenus par triggers (O(1))"""
+    return ledger.read_balance(conn)
+
+@bp.route('/transactions')
+@page_cache.cached_page(ledger_version)
+def transactions():
+    """Affiche les transactions par pages (?before_id=&limit=) ou en flux (?stream=1)"""
+    if request.args.get('stream'):
+        return stream_transactions()
+
+    before_id, limit = parse_page_args(request.args)
+    cache = get_ledger_cache()
+    if cache is not None:
+        rows, total = cache.page(before_id, limit), cache.balance()
     else:
-        html += '<p style="text-align: center; color: #666;">Aucune transaction enregistrée.</p>'
-    
-    html += '<center><a href="/" class="back-link">← Retour à laccueil</a></center></div></body></html>'
-    return html
+        conn = get_db_connection()
+        rows = query_transactions_page(conn, before_id, limit).fetchall()
+        total = ledger_total(conn)
+
+    parts = [TRANSACTIONS_PAGE_HEAD, render_summary(total)]
+    if rows:
+        parts.append(TRANSACTIONS_TABLE_HEAD)
+        parts.extend(render_transaction_row(row) for row in rows)
+        parts.append('</table>')
+        if len(rows) == limit:
+            parts.append(f'<center><a href="/transactions?before_id={rows[-1]["id"]}&limit={limit}" class="back-link">Page suivante →</a></center>')
+    else:
+        parts.append('<p style="text-align: center; color: #666;">Aucune transaction enregistrée.</p>')
+
+    parts.append('<center><a href="/" class="back-link">← Retour à laccueil</a></center></div>')
+    if rows and before_id is None:
+        # EventSource n'envoie pas d'en-tête X-Tenant : le locataire passe dans l'URL du flux
+        parts.append(LIVE_SCRIPT.format(last_id=rows[0]['id'], tenant=shards.current_tenant()))
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+def stream_transactions():
+    """Envoie toutes les transactions au fil de l'eau depuis un curseur SQLite"""
+    before_id = request.args.get('before_id', type=int)
+
+    def generate():
+        conn = get_db_connection()
+        cache = get_ledger_cache()
+        yield TRANSACTIONS_PAGE_HEAD
+        yield render_summary(ledger_total(conn) if cache is None else cache.balance())
+        yield TRANSACTIONS_TABLE_HEAD
+        if cache is not None:
+            rows = cache.iter_rows(before_id)
+            while chunk := ''.join(render_transaction_row(row) for row in islice(rows, STREAM_FETCH_SIZE)):
+                yield chunk
+        else:
+            for rows in iter_batches(query_transactions_page(conn, before_id)):
+                yield ''.join(render_transaction_row(row) for row in rows)
+        yield '</table>'
+        yield '<center><a href="/" class="back-link">← Retour à laccueil</a></center></div></body></html>'
+
+    return Response(stream_with_context(generate()), mimetype='text/html')
+
+@bp.route('/import', methods=['POST'])
+def import_transactions():
+    """Import en masse d'un fichier CSV ou JSONL (champ `file`, ou corps brut de la requête)"""
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        fmt = request.args.get('format') or importer.guess_format(upload.filename, upload.mimetype)
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or importer.guess_format(mimetype=request.mimetype)
+    batch_size = request.args.get('batch_size', current_app.config['IMPORT_BATCH_SIZE'], type=int)
+    conn = get_db_connection()
+
+    try:
+        # Catégories manquantes suggérées, doublons probables signalés (écartés avec ?skip_duplicates=1)
+        report = importer.import_stream(conn, stream, fmt, max(1, batch_size), index=ingest.get_index(conn),
+                                        skip_duplicates=bool(request.args.get('skip_duplicates')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(report)
+
+@bp.route('/api/v1/transactions', methods=['GET', 'POST'])
+def api_transactions():
+    """API JSON par lots : POST d'un tableau de transactions (une seule transaction SQL),
+    GET ?ids=1,2,3 ou liste filtrée (?category=&since=&until=&min_id=&max_id=&before_id=&limit=&fields=)"""
+    body, status = api.respond(get_db_connection(), request.method, request.args, request.get_json(silent=True))
+    return Response(body, status, mimetype='application/json')
+
+@bp.route('/api/v1/transactions/check', methods=['POST'])
+def api_check_transactions():
+    """Contrôle un lot JSON sans l'insérer : catégorie suggérée (catégorie facultative) et doublon probable"""
+    body, status = api.check_batch(ingest.get_index(get_db_connection()), request.get_json(silent=True))
+    return Response(body, status, mimetype='application/json')
+
+def current_database():
+    """Fichier SQLite de la requête courante (le shard du locataire si le routage est actif)"""
+    router = shards.get_router()
+    return current_app.config['DATABASE'] if router is None else router.current().database
+
+def iter_history_export(fmt, filters):
+    """Export de la table et des partitions d'archive de la période, sur une connexion dédiée"""
+    with archive.history(current_database(), filters.get('since'), filters.get('until')) as (conn, view):
+        yield from exporter.iter_export(conn, fmt, filters, table=view)
+
+@bp.route('/stream')
+def live_stream():
+    """Flux SSE : événements `transactions` (nouvelles lignes) et `balance` (solde), reprise par Last-Event-ID"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        after_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID doit être un id de transaction'}), 400
+    broadcaster = live.get_broadcaster(current_database())
+    # Sans stream_with_context : la connexion de la requête est rendue au pool avant le début du flux
+    chunks = broadcaster.subscribe(get_db_connection(), after_id, current_app.config['LIVE_HEARTBEAT'])
+    return Response(chunks, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/stream-stats')
+def stream_stats():
+    """Statistiques du flux en direct : abonnés, événements publiés, rattrapages (JSON)"""
+    return jsonify(live.get_stats())
+
+@bp.route('/export')
+def export_transactions():
+    """Export en flux CSV ou JSONL (?format=&category=&min_id=&max_id=&since=&until=&gzip=1&archive=1)"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in exporter.FORMATS:
+        return jsonify({'error': f"format inconnu {fmt!r}"}), 400
+    try:
+        filters = exporter.parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('archive'):
+        chunks = iter_history_export(fmt, filters)
+    else:
+        chunks = exporter.iter_export(get_db_connection(), fmt, filters)
+    filename = f'transactions.{fmt}'
+    mimetype = exporter.MIMETYPES[fmt]
+    if request.args.get('gzip'):
+        chunks = exporter.gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@bp.route('/reports')
+@page_cache.cached_page(ledger_version)
+def monthly_reports():
+    """Rapport JSON par mois et par catégorie, lu dans les rollups (?since=AAAA-MM&until=&category=)"""
+    try:
+        filters = reports.parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(reports.monthly_report(get_db_connection(), filters))
+
+@bp.route('/history')
+def history():
+    """Transactions archivées comprises, par id décroissant (JSON ; ?since=&until=&category=&before_id=&limit=)"""
+    before_id, limit = parse_page_args(request.args)
+    try:
+        filters = exporter.parse_filters(request.args)
+        with archive.history(current_database(), filters.get('since'), filters.get('until')) as (conn, view):
+            rows = archive.history_page(conn, view, filters, before_id, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'transactions': rows, 'next_before_id': rows[-1]['id'] if len(rows) == limit else None})
+
+@bp.route('/archive-stats')
+def archive_stats():
+    """Partitions de l'archive : période, nombre de lignes, solde (JSON)"""
+    return jsonify(archive.stats(get_db_connection()))
+
+@bp.route('/pool-stats')
+def pool_stats():
+    """Statistiques du pool de connexions (JSON)"""
+    pool = db_pool.get_pool()
+    return jsonify(pool.stats() if pool else {'enabled': False})
+
+@bp.route('/cache-stats')
+def cache_stats():
+    """Statistiques du cache en colonnes : lignes, empreinte mémoire, rechargements (JSON)"""
+    cache = get_ledger_cache()
+    return jsonify(cache.stats() if cache else {'enabled': False})
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Mesures au format texte Prometheus : latence par route, SQL, requêtes lentes, pool et file d'écriture"""
+    return metrics.metrics_response()
+
+def pool_in_use():
+    pool = current_app.extensions.get('db_pool')
+    return pool.stats()['in_use'] if pool else None
+
+def write_queue_depth():
+    queue = current_app.extensions.get('write_queue')
+    return queue.stats()['depth'] if queue else None
+
+metrics.REGISTRY.register_gauge('budget_db_pool_connections_in_use', 'Connexions du pool empruntées', pool_in_use)
+metrics.REGISTRY.register_gauge('budget_write_queue_depth', "Lignes en attente dans la file d'écriture", write_queue_depth)
+
+@bp.route('/write-stats')
+def write_stats():
+    """Métriques de la file d'écriture différée : profondeur, taille des lots, latence des commits (JSON)"""
+    queue = write_queue.get_queue()
+    return jsonify(queue.stats() if queue else {'enabled': False})
+
+@bp.route('/rate-limit-stats')
+def rate_limit_stats():
+    """Limitation de débit et admission : seaux, refus, requêtes en cours et en attente par route (JSON)"""
+    limiter = ratelimit.get_limiter()
+    return jsonify(limiter.stats() if limiter else {'enabled': False})
+
+@bp.route('/shard-stats')
+def shard_stats():
+    """Statistiques du routage par locataire : shards ouverts, évictions (JSON)"""
+    router = shards.get_router()
+    return jsonify(router.stats() if router else {'enabled': False})
+
+def global_totals(router):
+    """Solde et nombre de transactions de chaque locataire, lus en parallèle, et leur somme"""
+    per_tenant = router.fan_out(ledger.read_totals, workers=current_app.config['SHARD_FANOUT_WORKERS'])
+    return {
+        'tenants': per_tenant,
+        'balance': sum(totals['balance'] for totals in per_tenant.values()),
+        'count': sum(totals['count'] for totals in per_tenant.values()),
+    }
+
+@bp.route('/admin/totals')
+def admin_totals():
+    """Totaux globaux sur tous les locataires (JSON)"""
+    router = shards.get_router()
+    if router is None:
+        return jsonify(dict(ledger.read_totals(get_db_connection()), tenants=None))
+    return jsonify(global_totals(router))
+
+@bp.route('/jobs', methods=['GET', 'POST'])
+def job_queue():
+    """POST : met en file une tâche de fond (JSON {kind, params}), répond 202 et l'URL de suivi ;
+    GET : dernières tâches (?status=&limit=)"""
+    conn = get_db_connection()
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({'error': 'corps JSON {kind, params} attendu'}), 400
+        try:
+            job_id = jobs.submit(conn, payload.get('kind'), payload.get('params'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(jobs.get(conn, job_id)), 202, {'Location': f'/jobs/{job_id}'}
+    _, limit = parse_page_args(request.args)
+    return jsonify({'jobs': jobs.recent(conn, limit, request.args.get('status'))})
+
+@bp.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """État, avancement (tranches terminées) et résultat d'une tâche de fond (JSON)"""
+    job = jobs.get(get_db_connection(), job_id)
+    if job is None:
+        return jsonify({'error': f'tâche {job_id} introuvable'}), 404
+    return jsonify(job)
+
+@bp.route('/jobs/<int:job_id>/download')
+def job_download(job_id):
+    """Fichier produit par une tâche d'export terminée"""
+    job = jobs.get(get_db_connection(), job_id)
+    if job is None or job['kind'] != 'export' or job['status'] != 'done':
+        return jsonify({'error': f"aucun export terminé pour la tâche {job_id}"}), 404
+    return send_file(job['result']['path'], as_attachment=True)
+
+@bp.cli.command('shard-totals')
+def shard_totals_command():
+    """Affiche le solde de chaque locataire et le total global"""
+    router = shards.get_router()
+    if router is None:
+        click.echo("❌ Routage par locataire désactivé (BUDGET_SHARDS_DIR)", err=True)
+        raise SystemExit(1)
+    totals = global_totals(router)
+    for tenant, tenant_totals in totals['tenants'].items():
+        click.echo(f"  {tenant} : {tenant_totals['count']} transactions, solde {tenant_totals['balance']:.2f} €")
+    click.echo(f"✓ {len(totals['tenants'])} locataires : {totals['count']} transactions, solde {totals['balance']:.2f} €")
+
+@bp.cli.command('init-db')
+@click.option('--seed/--no-seed', default=False, help='Ajoute les données de test si la table est vide')
+def init_db_command(seed):
+    """Crée la base ou met son schéma à niveau, sans toucher aux transactions (idempotent)"""
+    init_db(current_app, seed)
+
+@bp.cli.command('seed')
+def seed_command():
+    """Ajoute les données de test si la table est vide (idempotent)"""
+    seeded = seed_db(get_db_connection())
+    click.echo(f"✓ {seeded} transaction(s) de test ajoutée(s)" if seeded else "✓ Table déjà remplie, rien à ajouter")
+
+@bp.cli.command('migrate')
+@click.option('--target', type=int, help='Version cible (dernière par défaut)')
+def migrate_command(target):
+    """Met à niveau le schéma de la base de données sans toucher aux transactions"""
+    conn = get_db_connection()
+    applied = migrations.migrate(conn, target=target, echo=click.echo)
+    click.echo(f"✓ Schéma en version {migrations.current_version(conn)}" + ('' if applied else ' (déjà à jour)'))
+
+@bp.cli.command('rebuild-totals')
+def rebuild_totals_command():
+    """Reconstruit le solde et les totaux par catégorie à partir des transactions"""
+    conn = get_db_connection()
+    ledger.install_totals(conn)
+    totals = ledger.rebuild_totals(conn)
+    click.echo(f"✓ Totaux reconstruits : {totals['count']} transactions, solde {totals['balance']:.2f} €")
+
+@bp.cli.command('verify-totals')
+def verify_totals_command():
+    """Vérifie les totaux incrémentaux contre un parcours complet de la table"""
+    conn = get_db_connection()
+    errors = ledger.verify_totals(conn)
+    if errors:
+        for error in errors:
+            click.echo(f"❌ {error}", err=True)
+        raise SystemExit(1)
+    click.echo("✓ Totaux cohérents avec les transactions")
+
+@bp.cli.command('rebuild-reports')
+def rebuild_reports_command():
+    """Reconstruit les rollups mensuels à partir des transactions (après une reprise d'historique)"""
+    rows = reports.rebuild_rollups(get_db_connection())
+    click.echo(f"✓ Rollups reconstruits : {rows} lignes (mois × catégorie)")
+
+@bp.cli.command('archive')
+@click.option('--before', help='Premier mois gardé dans la table (AAAA-MM)')
+@click.option('--keep-months', type=click.IntRange(min=1), default=ARCHIVE_KEEP_MONTHS, show_default=True,
+              help='Mois gardés dans la table, le mois courant compris (sans --before)')
+def archive_command(before, keep_months):
+    """Déplace les mois clos dans des partitions annuelles en lecture seule"""
+    month = before or archive.cutoff_month(keep_months)
+    try:
+        archived = archive.archive_before(get_db_connection(), month)
+    except (ValueError, archive.ArchiveConflict) as e:
+        click.echo(f"❌ {e}", err=True)
+        raise SystemExit(1)
+    for year, count in archived.items():
+        click.echo(f"  {year} : {count} transactions archivées")
+    click.echo(f"✓ Transactions antérieures à {month} archivées ({sum(archived.values())} lignes)")
+
+@bp.cli.command('import-transactions')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(importer.FORMATS), help='Déduit de l\'extension par défaut')
+@click.option('--batch-size', type=click.IntRange(min=1), default=importer.DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--skip-duplicates', is_flag=True, help='Écarte les doublons probables des transactions enregistrées')
+def import_transactions_command(path, fmt, batch_size, skip_duplicates):
+    """Importe un fichier CSV ou JSONL de transactions"""
+    conn = get_db_connection()
+    with open(path, 'rb') as stream:
+        report = importer.import_stream(conn, stream, fmt or importer.guess_format(path), batch_size,
+                                        index=ingest.get_index(conn), skip_duplicates=skip_duplicates)
+    for error in report['errors']:
+        click.echo(f"  ligne {error['line']} : {error['error']}", err=True)
+    for duplicate in report['duplicate_lines']:
+        click.echo(f"  ligne {duplicate['line']} : doublon probable de #{duplicate['duplicate_of']}", err=True)
+    click.echo(f"✓ {report['accepted']} transactions importées, {report['rejected']} rejetées, "
+               f"{report['duplicates']} doublon(s) probable(s)" + (' écarté(s)' if skip_duplicates else '')
+               + f", {report['categorized']} catégorie(s) suggérée(s)")
+
+@bp.cli.command('export-transactions')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Fichier de sortie (stdout par défaut)')
+@click.option('--format', 'fmt', type=click.Choice(exporter.FORMATS), default='csv', show_default=True)
+@click.option('--category')
+@click.option('--min-id', type=int)
+@click.option('--max-id', type=int)
+@click.option('--since', help='Date de début incluse (AAAA-MM-JJ)')
+@click.option('--until', help='Date de fin incluse (AAAA-MM-JJ)')
+@click.option('--gzip', 'compress', is_flag=True, help='Compresse la sortie en gzip')
+def export_transactions_command(output, fmt, category, min_id, max_id, since, until, compress):
+    """Exporte les transactions en CSV ou JSONL"""
+    try:
+        filters = exporter.parse_filters({'category': category, 'min_id': min_id, 'max_id': max_id,
+                                          'since': since, 'until': until})
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    chunks = exporter.iter_export(get_db_connection(), fmt, filters)
+    if compress:
+        for data in exporter.gzip_chunks(chunks):
+            output.write(data)
+    else:
+        for chunk in chunks:
+            output.write(chunk.encode('utf-8'))
+
+@bp.cli.command('jobs-worker')
+@click.option('--processes', type=click.IntRange(min=1), help='Processus du pool (nombre de cœurs par défaut)')
+@click.option('--chunks', type=click.IntRange(min=1), help=f'Tranches par parcours ({jobs.CHUNKS_PER_PROCESS} par processus par défaut)')
+@click.option('--poll', type=float, default=jobs.DEFAULT_POLL, show_default=True, help='Attente entre deux relevés de la file (s)')
+@click.option('--once', is_flag=True, help="S'arrête quand la file est vide")
+def jobs_worker_command(processes, chunks, poll, once):
+    """Exécute les tâches de fond en file, les parcours du ledger répartis sur plusieurs processus"""
+    router = shards.get_router()
+    # Routage par locataire : files de tous les shards (les nouveaux locataires sont vus au tour suivant)
+    databases = (lambda: [router.database_for(tenant) for tenant in router.tenants()]) if router else None
+    jobs.run_worker(current_database(), processes=processes, chunks=chunks, poll=poll, once=once, echo=click.echo,
+                    databases=databases)
+
+@bp.cli.command('submit-job')
+@click.argument('kind', type=click.Choice(list(jobs.RUNNERS)))
+@click.option('--param', '-p', 'params', multiple=True, help='Paramètre clé=valeur (export : format, gzip, category…)')
+def submit_job_command(kind, params):
+    """Met une tâche de fond en file"""
+    parsed = {}
+    for param in params:
+        key, sep, value = param.partition('=')
+        if not sep or not key:
+            raise click.BadParameter(f"{param!r} : clé=valeur attendu", param_hint="'--param'")
+        parsed[key] = value
+    try:
+        job_id = jobs.submit(get_db_connection(), kind, parsed)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    click.echo(f"✓ Tâche {job_id} ({kind}) en file")
+
+app = create_app()
 
 if __name__ == '__main__':
-    # Créer/réinitialiser la base de données au démarrage
-    if not os.path.exists('budget.db'):
+    # Créer la base ou la mettre à niveau en place (les données existantes sont conservées)
+    if not os.path.exists(app.config['DATABASE']):
         print("Création de la base de données...")
-        init_db()
-    else:
-        # Réinitialiser à chaque démarrage pour les tests
-        print("Réinitialisation de la base de données...")
-        init_db()
+    init_db(app)
+    # Sinon cache et index de suggestions sont chargés à la première requête qui les utilise
+    if app.config['WARMUP']:
+        warm_up(app)
     
     print("\n" + "="*50)
     print("🚀 Application Flask Budget App démarrée !")
@@ -469,4 +1141,5 @@ if __name__ == '__main__':
     print("="*50 + "\n")
     
     # ❌ VULNÉRABILITÉ 5: Debug mode activé (expose des infos sensibles en cas d'erreur)
+    # (serveur de développement mono-processus ; en production : gunicorn wsgi:app, voir gunicorn.conf.py)
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,344 @@
+"""Archivage des mois clos dans des partitions SQLite en lecture seule, une par année.
+
+Les transactions antérieures à un mois donné quittent la table « chaude » pour
+un fichier `<base>-archive/<année>.<suffixe>.db`. Ce fichier est écrit une fois,
+compacté (VACUUM), indexé par date, puis ouvert en lecture seule et
+`immutable` : SQLite le lit sans verrou ni journal. Les partitions ne sont pas
+compressées, car le SQLite de la bibliothèque standard n'a pas de codec de
+pages. Le gain vient de ce que la table chaude, ses index et l'index plein
+texte (compacté après archivage) ne contiennent plus que les mois ouverts.
+
+Les agrégats restent exacts :
+
+- La suppression des lignes archivées se fait sous le drapeau
+  `ledger_bulk_load`. Les triggers de solde et de rollups l'ignorent (migration
+  7), donc `ledger_totals`, `ledger_category_totals` et
+  `ledger_monthly_totals` comptent toujours l'historique complet.
+- Les totaux de chaque partition sont gardés dans la base principale
+  (`archive_partitions`, `archive_category_totals`, `archive_monthly_totals`).
+  Ils sont déclarés comme sources externes : les recalculs et vérifications
+  complets (`ledger.scan_totals`, `reports.rebuild_rollups`) les ajoutent au
+  parcours de la table.
+
+Les routes courantes ne lisent que la table chaude. Les requêtes historiques
+explicites (`history()`) ouvrent une connexion dédiée. Elles y attachent les
+seules partitions qui recoupent la période, derrière une vue temporaire
+`<table>_history` (UNION ALL).
+
+Archiver une année déjà partiellement archivée réécrit sa partition sous un
+nouveau nom. La base principale ne pointe vers le nouveau fichier qu'une fois
+les lignes supprimées de la table chaude, dans la même transaction. Un arrêt
+en cours de route laisse au pire un fichier orphelin, jamais un doublon ni une
+perte.
+"""
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+from urllib.parse import quote
+
+import ledger
+import reports
+import search_index
+
+COLUMNS = 'id, description, amount, category, booked_on'
+
+ARCHIVE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS archive_partitions (
+    period TEXT PRIMARY KEY NOT NULL,
+    filename TEXT NOT NULL,
+    first_month TEXT NOT NULL,
+    last_month TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    balance REAL NOT NULL,
+    archived_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+CREATE TABLE IF NOT EXISTS archive_category_totals (
+    period TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL,
+    row_count INTEGER NOT NULL,
+    min_amount REAL,
+    max_amount REAL,
+    PRIMARY KEY (period, category)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS archive_monthly_totals (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    income REAL NOT NULL,
+    expense REAL NOT NULL,
+    row_count INTEGER NOT NULL,
+    PRIMARY KEY (month, category)
+) WITHOUT ROWID;
+'''
+
+PARTITION_SCHEMA = '''
+CREATE TABLE "{table}" (
+    id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT,
+    booked_on TEXT
+);
+'''
+
+PARTITION_INDEXES = '''
+CREATE INDEX "idx_{table}_booked_on" ON "{table}" (booked_on);
+CREATE INDEX "idx_{table}_category_booked_on" ON "{table}" (category, booked_on);
+'''
+
+# Lignes d'une année à archiver : [début, fin) par date, et pas au-delà du dernier id lu à la construction
+SELECTION = 'booked_on >= ? AND booked_on < ? AND id <= ?'
+
+MERGE_CATEGORY = '''
+INSERT INTO archive_category_totals (period, category, total, row_count, min_amount, max_amount)
+    SELECT ?, IFNULL(category, ''), SUM(amount), COUNT(*), MIN(amount), MAX(amount)
+    FROM "{table}" WHERE {selection} GROUP BY 2
+    ON CONFLICT (period, category) DO UPDATE SET
+        total = total + excluded.total,
+        row_count = row_count + excluded.row_count,
+        min_amount = MIN(min_amount, excluded.min_amount),
+        max_amount = MAX(max_amount, excluded.max_amount)
+'''
+
+MERGE_MONTHLY = '''
+INSERT INTO archive_monthly_totals (month, category, income, expense, row_count)
+''' + reports.ROLLUP_SELECT.format(table='{table}', where='WHERE {selection}') + '''
+    ON CONFLICT (month, category) DO UPDATE SET
+        income = income + excluded.income,
+        expense = expense + excluded.expense,
+        row_count = row_count + excluded.row_count
+'''
+
+MERGE_PARTITION = '''
+INSERT INTO archive_partitions (period, filename, first_month, last_month, row_count, balance)
+    SELECT ?, ?, substr(MIN(booked_on), 1, 7), substr(MAX(booked_on), 1, 7), COUNT(*), SUM(amount)
+    FROM "{table}" WHERE {selection}
+    ON CONFLICT (period) DO UPDATE SET
+        filename = excluded.filename,
+        first_month = MIN(first_month, excluded.first_month),
+        last_month = MAX(last_month, excluded.last_month),
+        row_count = row_count + excluded.row_count,
+        balance = balance + excluded.balance,
+        archived_at = excluded.archived_at
+'''
+
+
+class ArchiveConflict(RuntimeError):
+    """Le ledger a été modifié entre la construction d'une partition et la suppression des lignes"""
+
+
+def install_archive(conn, table='transactions'):
+    """Crée les tables de l'archive et rend les triggers de suppression des agrégats suspendables"""
+    conn.executescript(ARCHIVE_SCHEMA)
+    ledger.install_bulk_delete(conn, table)
+    reports.install_bulk_delete(conn, table)
+
+
+def has_archive(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archive_partitions'"
+    ).fetchone() is not None
+
+
+def _category_source(conn):
+    if not has_archive(conn):
+        return []
+    return conn.execute('SELECT category, SUM(total), SUM(row_count), MIN(min_amount), MAX(max_amount) '
+                        'FROM archive_category_totals GROUP BY category').fetchall()
+
+
+def _rollup_source(conn):
+    if not has_archive(conn):
+        return []
+    return conn.execute('SELECT month, category, income, expense, row_count FROM archive_monthly_totals').fetchall()
+
+
+ledger.register_totals_source(_category_source)
+reports.register_rollup_source(_rollup_source)
+
+
+def database_path(conn):
+    """Fichier de la base principale d'une connexion"""
+    for _, name, path in conn.execute('PRAGMA database_list'):
+        if name == 'main':
+            return path
+    raise ValueError('base principale introuvable')
+
+
+def archive_dir(database):
+    return os.path.splitext(os.path.abspath(database))[0] + '-archive'
+
+
+def _uri(path, **params):
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    return f'file:{quote(os.path.abspath(path))}' + (f'?{query}' if query else '')
+
+
+def cutoff_month(keep_months, today=None):
+    """Premier mois conservé dans la table chaude (AAAA-MM) : le mois courant et les `keep_months` - 1 précédents"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - max(0, keep_months - 1)
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+
+def archive_before(conn, month, table='transactions'):
+    """Archive les transactions datées d'avant `month` (AAAA-MM, exclu) ; renvoie {année: lignes archivées}"""
+    if not reports.MONTH_RE.match(month):
+        raise ValueError('le mois doit être au format AAAA-MM')
+    cutoff = f'{month}-01'
+    years = [row[0] for row in conn.execute(
+        f'SELECT DISTINCT substr(booked_on, 1, 4) FROM "{table}" WHERE booked_on < ? ORDER BY 1', (cutoff,))]
+    archived = {year: _archive_year(conn, table, year, min(cutoff, f'{int(year) + 1:04d}-01-01')) for year in years}
+    if any(archived.values()):
+        # Les suppressions laissent des marqueurs dans l'index plein texte : on le compacte une fois
+        search_index.optimize_fts(conn, table)
+    return archived
+
+
+def _archive_year(conn, table, year, end):
+    database = database_path(conn)
+    directory = archive_dir(database)
+    os.makedirs(directory, exist_ok=True)
+    previous = conn.execute('SELECT filename FROM archive_partitions WHERE period = ?', (year,)).fetchone()
+    previous = os.path.join(directory, previous[0]) if previous else None
+
+    path, count, max_id, mutations = _build_partition(database, directory, table, year, end, previous)
+    if count == 0:
+        _remove(path)
+        return 0
+    selection = (f'{year}-01-01', end, max_id)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if conn.execute('SELECT seq FROM ledger_mutations WHERE id = 1').fetchone()[0] != mutations:
+            raise ArchiveConflict('ledger modifié pendant l\'archivage, relancer la commande')
+        filename = os.path.basename(path)
+        conn.execute(MERGE_PARTITION.format(table=table, selection=SELECTION), (year, filename) + selection)
+        conn.execute(MERGE_CATEGORY.format(table=table, selection=SELECTION), (year,) + selection)
+        conn.execute(MERGE_MONTHLY.format(table=table, selection=SELECTION), selection)
+        # Agrégats inchangés : les lignes passent de la table aux totaux de la partition
+        conn.execute('INSERT INTO ledger_bulk_load (active) VALUES (1)')
+        deleted = conn.execute(f'DELETE FROM "{table}" WHERE {SELECTION}', selection).rowcount
+        conn.execute('DELETE FROM ledger_bulk_load')
+        if deleted != count:
+            raise ArchiveConflict(f'{deleted} lignes supprimées pour {count} archivées')
+        conn.execute('UPDATE ledger_totals SET version = version + 1 WHERE id = 1')
+    except BaseException:
+        conn.rollback()
+        _remove(path)
+        raise
+    conn.commit()
+    if previous:
+        _remove(previous)
+    return count
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.chmod(path, 0o644)
+        os.remove(path)
+
+
+def _build_partition(database, directory, table, year, end, previous):
+    """Écrit la partition de l'année (lignes déjà archivées et nouvelles) ; renvoie (chemin, lignes nouvelles,
+    dernier id lu, compteur de modifications lu)"""
+    hot = sqlite3.connect(database)
+    max_id = hot.execute(f'SELECT IFNULL(MAX(id), 0) FROM "{table}"').fetchone()[0]
+    hot.close()
+    # Nom toujours nouveau : l'ancienne partition reste lisible jusqu'au commit dans la base principale
+    fd, path = tempfile.mkstemp(prefix=f'{year}.', suffix='.db', dir=directory)
+    os.close(fd)
+    part = sqlite3.connect(path)
+    try:
+        part.executescript('PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;' + PARTITION_SCHEMA.format(table=table))
+        part.execute('ATTACH ? AS hot', (database,))
+        if previous:
+            part.execute('ATTACH ? AS previous', (_uri(previous, mode='ro', immutable=1),))
+        # Lignes copiées et compteur de modifications lus dans le même instantané
+        part.execute('BEGIN')
+        mutations = part.execute('SELECT seq FROM hot.ledger_mutations WHERE id = 1').fetchone()[0]
+        if previous:
+            part.execute(f'INSERT INTO main."{table}" SELECT {COLUMNS} FROM previous."{table}"')
+        count = part.execute(f'INSERT INTO main."{table}" SELECT {COLUMNS} FROM hot."{table}" '
+                             f'WHERE {SELECTION} ORDER BY id', (f'{year}-01-01', end, max_id)).rowcount
+        part.commit()
+        part.execute('DETACH hot')
+        if previous:
+            part.execute('DETACH previous')
+        part.executescript(PARTITION_INDEXES.format(table=table))
+        part.execute('VACUUM')
+    finally:
+        part.close()
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.chmod(path, 0o444)
+    return path, count, max_id, mutations
+
+
+def partitions(conn, since=None, until=None):
+    """Partitions (dict) qui recoupent la période [since, until] (dates ou mois, bornes incluses)"""
+    if not has_archive(conn):
+        return []
+    clauses, params = [], []
+    if since:
+        clauses.append('last_month >= ?')
+        params.append(since[:7])
+    if until:
+        clauses.append('first_month <= ?')
+        params.append(until[:7])
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+    rows = conn.execute('SELECT period, filename, first_month, last_month, row_count, balance '
+                        'FROM archive_partitions' + where + ' ORDER BY period', params)
+    keys = ('period', 'filename', 'first_month', 'last_month', 'count', 'balance')
+    return [dict(zip(keys, row)) for row in rows]
+
+
+@contextmanager
+def history(database, since=None, until=None, table='transactions'):
+    """Connexion dédiée où la vue temporaire `<table>_history` réunit la table chaude et les partitions
+    de la période ; renvoie (connexion, nom de la vue)"""
+    conn = sqlite3.connect(_uri(database), uri=True)
+    try:
+        directory = archive_dir(database)
+        selected = partitions(conn, since, until)
+        if len(selected) > conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+            raise ValueError(f'{len(selected)} partitions dans la période : la restreindre avec since / until')
+        selects = [f'SELECT {COLUMNS} FROM main."{table}"']
+        for partition in selected:
+            schema = f'archive_{partition["period"]}'
+            path = os.path.join(directory, partition['filename'])
+            conn.execute('ATTACH ? AS ' + f'"{schema}"', (_uri(path, mode='ro', immutable=1),))
+            selects.append(f'SELECT {COLUMNS} FROM "{schema}"."{table}"')
+        view = f'{table}_history'
+        conn.execute(f'CREATE TEMP VIEW "{view}" AS ' + ' UNION ALL '.join(selects))
+        yield conn, view
+    finally:
+        conn.close()
+
+
+def history_page(conn, view, filters=None, before_id=None, limit=100):
+    """Transactions de la vue historique par id décroissant (filtres d'exporter.parse_filters)"""
+    filters = dict(filters or {})
+    if before_id is not None:
+        filters['max_id'] = before_id - 1
+    clauses, params = [], []
+    for key, clause in (('category', 'category = ?'), ('min_id', 'id >= ?'), ('max_id', 'id <= ?'),
+                        ('since', 'booked_on >= ?'), ('until', 'booked_on <= ?')):
+        if key in filters:
+            clauses.append(clause)
+            params.append(filters[key])
+    sql = f'SELECT {COLUMNS} FROM "{view}"'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    keys = COLUMNS.split(', ')
+    return [dict(zip(keys, row)) for row in conn.execute(sql + ' ORDER BY id DESC LIMIT ?', params + [limit])]
+
+
+def stats(conn):
+    """Partitions et volumes de l'archive"""
+    selected = partitions(conn)
+    return {'partitions': selected, 'rows': sum(p['count'] for p in selected),
+            'balance': round(sum(p['balance'] for p in selected), 2)}
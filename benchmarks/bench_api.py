@@ -0,0 +1,90 @@
+"""Benchmark de l'API JSON par lots (/api/v1/transactions) contre les routes à formulaires.
+
+Client de test Flask, en processus, sur une base de `--rows` transactions :
+
+- écriture : `--writes` transactions par POST /add (une requête par ligne), puis
+  par POST /api/v1/transactions en lots de `--batch` ;
+- lecture d'une page de `--limit` lignes : /transactions (HTML) contre l'API,
+  toutes colonnes puis projection `fields=id,amount` (before_id aléatoire, hors
+  cache de pages) ;
+- lecture de `--limit` ids : une requête `?ids=` contre une requête par id.
+
+Le CSRF de app-corrigé.py est désactivé pendant la mesure, comme dans suite.py.
+
+    python benchmarks/bench_api.py --rows 100000 --writes 2000 --batch 500
+"""
+import argparse
+import os
+import random
+import time
+
+from common import CATEGORIES, WORDS, load_app, seed_database, temp_database
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = fn()
+        assert response.status_code in (200, 201, 302), response.get_data(as_text=True)[:200]
+    return time.perf_counter() - start
+
+
+def bench_writes(client, writes, batch, rng):
+    rows = [{'description': f'{rng.choice(WORDS)} {i}', 'amount': round(rng.uniform(-200, 200), 2) or 1.0,
+             'category': rng.choice(CATEGORIES)} for i in range(writes)]
+    forms = iter(rows)
+    form_time = timed(lambda: client.post('/add', data=next(forms)), writes)
+    batches = iter(rows[i:i + batch] for i in range(0, writes, batch))
+    api_time = timed(lambda: client.post('/api/v1/transactions', json=next(batches)), -(-writes // batch))
+    return [('écriture', 'POST /add (1 ligne)', writes / form_time),
+            ('écriture', f'POST /api/v1 (lots de {batch})', writes / api_time)]
+
+
+def bench_reads(client, first_id, last_id, limit, repeat, rng):
+    before = lambda: rng.randint(first_id + limit, last_id)
+    html = timed(lambda: client.get(f'/transactions?before_id={before()}&limit={limit}'), repeat)
+    full = timed(lambda: client.get(f'/api/v1/transactions?before_id={before()}&limit={limit}'), repeat)
+    projected = timed(lambda: client.get(f'/api/v1/transactions?before_id={before()}&limit={limit}'
+                                         '&fields=id,amount'), repeat)
+    ids = lambda n: ','.join(str(rng.randint(first_id, last_id)) for _ in range(n))
+    batched = timed(lambda: client.get(f'/api/v1/transactions?ids={ids(limit)}'), repeat)
+    single = timed(lambda: client.get(f'/api/v1/transactions?ids={ids(1)}'), repeat * limit)
+    rows = repeat * limit
+    return [('page', 'GET /transactions (HTML)', rows / html),
+            ('page', 'GET /api/v1', rows / full),
+            ('page', 'GET /api/v1 fields=id,amount', rows / projected),
+            ('ids', f'GET /api/v1 ?ids= ({limit} ids)', rows / batched),
+            ('ids', 'GET /api/v1 ?ids= (1 id)', rows / single)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--apps', nargs='+', choices=['app', 'corrige'], default=['app', 'corrige'])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--writes', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=100, help='lignes par page / ids par requête')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'appli':<8} {'cas':<9} {'route':<32} {'lignes/s':>10}")
+    for name in args.apps:
+        database = temp_database()
+        module = load_app(name, database)
+        seed_database(module, database, args.rows)
+        module.app.config['WTF_CSRF_ENABLED'] = False
+        # Sans cookies : les messages flash de /add ne s'accumulent pas dans la session
+        client = module.app.test_client(use_cookies=False)
+        try:
+            rng = random.Random(1)
+            results = bench_writes(client, args.writes, args.batch, rng)
+            ids = client.get('/api/v1/transactions?limit=1&fields=id').get_json()['data']
+            results += bench_reads(client, 1, ids[0]['id'], args.limit, args.repeat, rng)
+        finally:
+            os.remove(database)
+        for case, route, rate in results:
+            print(f"{name:<8} {case:<9} {route:<32} {rate:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark du chemin chaud en fonction de la taille de l'archive.
+
+Pour chaque volume d'historique, la même base (historique + `--hot` lignes
+récentes) est mesurée deux fois : tout dans la table, puis après `archive_before`
+au mois de la première ligne récente. Temps serveur (p50/p99, client de test) :
+
+- page de /transactions (before_id aléatoire, hors cache de pages) ;
+- POST /search sur un mot ;
+- POST /add ;
+- /history sur un mois archivé (connexion dédiée et partitions attachées).
+
+Le solde et les rollups sont vérifiés après archivage.
+
+    python benchmarks/bench_archive.py --hot 50000 --archived 0 200000 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import time
+
+from common import WORDS, load_app, seed_database, temp_database
+import archive
+import ledger
+import reports
+
+
+def percentiles(fn, n):
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def measure(module, path, requests, rng):
+    app = module.app
+    client = app.test_client()
+    with app.app_context():
+        conn = module.get_db_connection()
+        last_id = conn.execute('SELECT MAX(id) FROM transactions').fetchone()[0]
+        first_hot = conn.execute('SELECT MIN(id) FROM transactions').fetchone()[0]
+        month = conn.execute('SELECT MIN(month) FROM ledger_monthly_totals').fetchone()[0]
+    cases = [
+        ('/transactions', lambda: client.get(f'/transactions?before_id={rng.randint(first_hot, last_id)}')),
+        ('/search', lambda: client.post('/search', data={'query': rng.choice(WORDS)})),
+        ('/add', lambda: client.post('/add', data={'description': 'Test', 'amount': '-1.5', 'category': 'Bench'})),
+        ('/history', lambda: client.get(f'/history?since={month}-01&until={month}-28')),
+    ]
+    return {label: percentiles(fn, requests) for label, fn in cases}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hot', type=int, default=50_000, help='lignes récentes gardées dans la table')
+    parser.add_argument('--archived', type=int, nargs='+', default=[0, 200_000, 1_000_000])
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    module = load_app('app')
+    print(f"{'historique':>10} {'table':<8} {'route':<14} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for archived in args.archived:
+        path = seed_database(module, temp_database(), archived + args.hot)
+        try:
+            with module.app.app_context():
+                conn = module.get_db_connection()
+                results = {'complète': measure(module, path, args.requests, random.Random(1))}
+                cutoff = conn.execute('SELECT substr(booked_on, 1, 7) FROM transactions '
+                                      'ORDER BY booked_on, id LIMIT 1 OFFSET ?', (archived,)).fetchone()[0]
+                start = time.perf_counter()
+                moved = sum(archive.archive_before(conn, cutoff).values())
+                elapsed = time.perf_counter() - start
+                assert not ledger.verify_totals(conn) and not reports.verify_rollups(conn)
+                results['chaude'] = measure(module, path, args.requests, random.Random(1))
+            for table, timings in results.items():
+                for route, (p50, p99) in timings.items():
+                    print(f"{archived:>10} {table:<8} {route:<14} {p50:>9.3f} {p99:>9.3f}")
+            size = sum(os.path.getsize(os.path.join(archive.archive_dir(path), name))
+                       for name in os.listdir(archive.archive_dir(path))) if moved else 0
+            print(f"{'':>10} {moved} lignes archivées en {elapsed:.2f} s, partitions : {size / 1e6:.1f} Mo\n")
+        finally:
+            shutil.rmtree(archive.archive_dir(path), ignore_errors=True)
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
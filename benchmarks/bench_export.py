@@ -0,0 +1,47 @@
+"""Benchmark de l'export en flux : lignes/s et pic RSS, en CSV, JSONL et gzip.
+
+    python benchmarks/bench_export.py --sizes 100000 1000000 3000000
+"""
+import argparse
+import os
+import sqlite3
+import time
+import resource
+
+from common import load_app, seed_database, temp_database
+import exporter
+
+
+def run(conn, fmt, compress):
+    start = time.perf_counter()
+    chunks = exporter.iter_export(conn, fmt)
+    if compress:
+        chunks = exporter.gzip_chunks(chunks)
+    size = sum(len(chunk) for chunk in chunks)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return elapsed, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    module = load_app('app')
+    print(f"{'lignes':>9} {'format':>9} {'lignes/s':>11} {'sortie (Mo)':>12} {'pic RSS (Mo)':>13}")
+    for size in args.sizes:
+        path = seed_database(module, temp_database(), size)
+        conn = sqlite3.connect(path)
+        try:
+            for fmt, compress in (('csv', False), ('jsonl', False), ('csv', True)):
+                elapsed, out, peak = run(conn, fmt, compress)
+                label = fmt + ('.gz' if compress else '')
+                print(f"{size:>9} {label:>9} {size / elapsed:>11,.0f} {out / 1e6:>12.1f} {peak:>13.0f}")
+        finally:
+            conn.close()
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Micro-benchmark du moteur de formules contre l'ancien safe_eval (ast.parse + parcours récursif).
+
+    python benchmarks/bench_formula.py --number 20000
+"""
+import argparse
+import ast
+import operator
+import timeit
+import warnings
+
+from common import ROOT  # noqa: F401  (ajoute la racine du dépôt au sys.path)
+import formula
+
+FORMULAS = ['100 + 50 * 2', '(3000 - 150.5 - 800) / 12', '2 ** 10 - 1', '-(1.5 + 2.5) * (4 - 6) / 3 ** 2',
+            '((((1 + 2) * 3) - 4) / 5) ** 2 + 1000 * 1.2']
+
+
+def legacy_safe_eval(expr):
+    """safe_eval d'origine (app-corrigé.py avant le moteur compilé), conservé pour comparaison"""
+    allowed_operators = {
+        ast.Add: operator.add, ast.Sub: operator.sub,
+        ast.Mult: operator.mul, ast.Div: operator.truediv,
+        ast.Pow: operator.pow, ast.USub: operator.neg,
+        ast.UAdd: operator.pos
+    }
+    node = ast.parse(expr, mode='eval').body
+
+    def _eval(node):
+        if isinstance(node, ast.Num):
+            return node.n
+        elif isinstance(node, ast.BinOp):
+            return allowed_operators[type(node.op)](_eval(node.left), _eval(node.right))
+        elif isinstance(node, ast.UnaryOp):
+            return allowed_operators[type(node.op)](_eval(node.operand))
+        raise ValueError("Opération non autorisée détectée.")
+    return _eval(node)
+
+
+def uncached(expr):
+    formula.cache_clear()
+    return formula.evaluate(expr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20_000)
+    args = parser.parse_args()
+    warnings.simplefilter('ignore', DeprecationWarning)
+
+    print(f"{'formule':>45} {'safe_eval (µs)':>15} {'compilé (µs)':>13} {'en cache (µs)':>14}")
+    for expr in FORMULAS:
+        assert abs(legacy_safe_eval(expr) - formula.evaluate(expr)) < 1e-9
+        row = [timeit.timeit(lambda: fn(expr), number=args.number) / args.number * 1e6
+               for fn in (legacy_safe_eval, uncached, formula.evaluate)]
+        print(f"{expr:>45} {row[0]:>15.2f} {row[1]:>13.2f} {row[2]:>14.2f}")
+
+    # Formule pathologique : refusée sans bloquer le worker
+    elapsed = timeit.timeit(lambda: _rejects('9**9**9'), number=1000) / 1000 * 1e6
+    print(f"\n9**9**9 refusée en {elapsed:.1f} µs")
+
+
+def _rejects(expr):
+    try:
+        formula.evaluate(expr)
+    except formula.FormulaError:
+        return True
+    return False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark de l'évaluation par lot d'une formule sur 1M transactions.
+
+Compare la boucle Python (une fermeture par ligne) aux backends vectorisés
+`array` (toujours disponible) et `numpy` (si installé), et mesure le chargement
+de la colonne des montants depuis SQLite.
+
+    python benchmarks/bench_formula_batch.py --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from common import load_app, seed_database, temp_database
+import formula
+import ledger
+
+FORMULAS = ['amount * 1.2', 'amount * 1.2 + sum(Revenu) / 12', '(amount - avg(Alimentation)) ** 2']
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    module = load_app('app')
+    path = seed_database(module, temp_database(), args.rows)
+    conn = sqlite3.connect(path)
+    try:
+        categories = ledger.read_category_totals(conn)
+        with module.app.app_context():
+            load_ms, (_, amounts) = timed(lambda: module.load_amount_column(conn))
+        print(f"chargement de {len(amounts)} montants : {load_ms:.0f} ms\n")
+
+        backends = ['array'] + (['numpy'] if formula.numpy_module() is not None else [])
+        print(f"{'formule':>36} {'boucle (ms)':>12} " + ' '.join(f"{b + ' (ms)':>12}" for b in backends))
+        for text in FORMULAS:
+            compiled = formula.compile_formula(text)
+            loop_ms, _ = timed(lambda: [compiled(formula.Bindings(categories, a)) for a in amounts])
+            batch = [timed(lambda: formula.evaluate_batch(text, amounts, categories, backend=b))[0] for b in backends]
+            print(f"{text:>36} {loop_ms:>12.0f} " + ' '.join(f"{ms:>12.0f}" for ms in batch))
+    finally:
+        conn.close()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark de l'import en masse (CSV et JSONL) : lignes/s et pic RSS.
+
+    python benchmarks/bench_import.py --rows 1000000 --batch-size 5000 [--without-fts]
+
+L'indexation plein texte domine le coût de l'import ; `--without-fts` mesure le
+chemin d'insertion seul (agrégats compris).
+"""
+import argparse
+import csv
+import json
+import os
+import resource
+import sqlite3
+import time
+
+from common import load_app, seed_database, synthetic_rows, temp_database
+import db_pool
+import importer
+import search_index
+
+
+def write_files(n):
+    csv_path, jsonl_path = temp_database('import-') + '.csv', temp_database('import-') + '.jsonl'
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f_csv, open(jsonl_path, 'w', encoding='utf-8') as f_jsonl:
+        writer = csv.writer(f_csv)
+        writer.writerow(['description', 'amount', 'category', 'booked_on'])
+        for description, amount, category, booked_on in synthetic_rows(n):
+            writer.writerow([description, amount, category, booked_on])
+            f_jsonl.write(json.dumps({'description': description, 'amount': amount, 'category': category,
+                                      'booked_on': booked_on}) + '\n')
+    return {'csv': csv_path, 'jsonl': jsonl_path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=importer.DEFAULT_BATCH_SIZE)
+    parser.add_argument('--without-fts', action='store_true', help="supprime l'index FTS5 avant l'import")
+    args = parser.parse_args()
+
+    module = load_app('app')
+    files = write_files(args.rows)
+    print(f"{'format':>7} {'lignes/s':>10} {'acceptées':>10} {'pic RSS (Mo)':>13}")
+    try:
+        for fmt, path in files.items():
+            db_path = seed_database(module, temp_database(), 0)
+            conn = db_pool.configure_connection(sqlite3.connect(db_path))
+            if args.without_fts:
+                fts = search_index.fts_table()
+                for suffix in ('insert', 'delete', 'update'):
+                    conn.execute(f'DROP TRIGGER "{fts}_{suffix}"')
+                conn.execute(f'DROP TABLE "{fts}"')
+            try:
+                start = time.perf_counter()
+                with open(path, 'rb') as stream:
+                    report = importer.import_stream(conn, stream, fmt, args.batch_size)
+                elapsed = time.perf_counter() - start
+            finally:
+                conn.close()
+                os.remove(db_path)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{fmt:>7} {report['accepted'] / elapsed:>10,.0f} {report['accepted']:>10} {peak:>13.0f}")
+    finally:
+        for path in files.values():
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark des index couvrants (category, booked_on, amount) et (booked_on, amount).
+
+Affiche le plan d'exécution (EXPLAIN QUERY PLAN) et le temps des requêtes de
+rapport par catégorie et par période, avec les index créés par les migrations
+puis après leur suppression (parcours complet de la table).
+
+    python benchmarks/bench_indexes.py --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from common import load_app, seed_database, temp_database
+import migrations
+
+INDEXES = ('idx_transactions_category_booked_on', 'idx_transactions_booked_on_amount')
+
+
+def queries():
+    month_end = date.today() - timedelta(days=30)
+    month_start = (month_end - timedelta(days=30)).isoformat()
+    month_end = month_end.isoformat()
+    return [
+        ('catégorie + mois',
+         'SELECT SUM(amount), COUNT(*) FROM transactions WHERE category = ? AND booked_on BETWEEN ? AND ?',
+         ('Alimentation', month_start, month_end)),
+        ('mois, toutes catégories',
+         'SELECT SUM(amount), COUNT(*) FROM transactions WHERE booked_on BETWEEN ? AND ?',
+         (month_start, month_end)),
+        ('dépenses du mois par catégorie',
+         'SELECT category, SUM(amount) FROM transactions WHERE booked_on BETWEEN ? AND ? AND amount < 0 '
+         'GROUP BY category',
+         (month_start, month_end)),
+        ('catégorie sur 5 ans',
+         'SELECT SUM(amount) FROM transactions WHERE category = ?',
+         ('Loisirs',)),
+    ]
+
+
+def best_of(conn, sql, params, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def plan(conn, sql, params):
+    return ' ; '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    path = seed_database(load_app('app'), temp_database(), args.rows)
+    conn = sqlite3.connect(path)
+    try:
+        print(f"{args.rows} lignes, schéma v{migrations.current_version(conn)}\n")
+        with_index = {}
+        for name, sql, params in queries():
+            with_index[name] = best_of(conn, sql, params)
+            print(f"{name}\n  plan : {plan(conn, sql, params)}")
+
+        for index in INDEXES:
+            conn.execute(f'DROP INDEX "{index}"')
+        print(f"\n{'requête':<32} {'avec index (ms)':>16} {'sans index (ms)':>16} {'gain':>7}")
+        for name, sql, params in queries():
+            without = best_of(conn, sql, params, repeat=3)
+            print(f"{name:<32} {with_index[name]:>16.2f} {without:>16.2f} {without / with_index[name]:>6.1f}x")
+    finally:
+        conn.close()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark du contrôle des transactions entrantes (ingest.py) : catégorie suggérée et doublons.
+
+Pour chaque taille de ledger (`--rows`) :
+
+- construction des deux index depuis la table (lignes/s, mémoire ajoutée) ;
+- coût par ligne entrante de `suggest_category` et de `check` (µs), sur
+  `--probe` lignes dont la moitié sont des doublons : il ne doit pas croître
+  avec le ledger.
+
+Puis un import CSV de `--import-rows` lignes (10 % sans catégorie) sur le plus
+gros ledger : sans index, avec index, et réimport du même fichier, dont toutes
+les lignes doivent être signalées comme doublons.
+
+    python benchmarks/bench_ingest.py --rows 10000 100000 1000000 --import-rows 100000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import resource
+import sqlite3
+import time
+
+from common import load_app, seed_database, synthetic_rows, temp_database
+import db_pool
+import importer
+import ingest
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def probe_rows(conn, n, rng):
+    """n lignes entrantes : moitié copies de lignes existantes, moitié nouvelles"""
+    existing = conn.execute('SELECT description, amount, category, booked_on FROM transactions '
+                            'ORDER BY random() LIMIT ?', (n // 2,)).fetchall()
+    fresh = [(f'{description} {rng.randint(10_000, 99_999)}', amount, category, booked_on)
+             for description, amount, category, booked_on in synthetic_rows(n - len(existing), seed=rng.random())]
+    return [tuple(row) for row in existing] + fresh
+
+
+def per_row_us(fn, rows):
+    start = time.perf_counter()
+    fn(rows)
+    return (time.perf_counter() - start) / len(rows) * 1e6
+
+
+def csv_file(n, seed):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['description', 'amount', 'category', 'booked_on'])
+    for i, (description, amount, category, booked_on) in enumerate(synthetic_rows(n, seed=seed)):
+        writer.writerow([description, amount, '' if i % 10 == 0 else category, booked_on])
+    return buffer.getvalue().encode()
+
+
+def timed_import(conn, data, index=None):
+    start = time.perf_counter()
+    report = importer.import_stream(conn, io.BytesIO(data), 'csv', index=index)
+    return report, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--probe', type=int, default=20_000)
+    parser.add_argument('--import-rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    module = load_app('app')
+    rng = random.Random(1)
+    print(f"{'ledger':>9} {'construction':>13} {'lignes/s':>10} {'+RSS (Mo)':>10} {'suggestion (µs)':>16} "
+          f"{'doublons (µs)':>14} {'signalés':>9}")
+    for size in args.rows:
+        path = seed_database(module, temp_database(), size)
+        conn = db_pool.configure_connection(sqlite3.connect(path))
+        try:
+            before = rss_mb()
+            start = time.perf_counter()
+            index = ingest.IngestIndex().sync(conn)
+            build = time.perf_counter() - start
+            grown = rss_mb() - before
+            rows = probe_rows(conn, args.probe, rng)
+            suggest_us = per_row_us(lambda batch: [index.suggest_category(row[0]) for row in batch], rows)
+            flagged = []
+            check_us = per_row_us(lambda batch: flagged.extend(index.check(batch)), rows)
+            print(f"{size:>9} {build:>12.2f}s {size / build:>10,.0f} {grown:>10.0f} {suggest_us:>16.1f} "
+                  f"{check_us:>14.1f} {sum(d is not None for d in flagged):>9}")
+            if size != max(args.rows):
+                continue
+
+            data = csv_file(args.import_rows, seed=7)
+            print(f"\nimport de {args.import_rows} lignes dans un ledger de {size} :")
+            print(f"{'mode':<22} {'lignes/s':>10} {'acceptées':>10} {'doublons':>9} {'catégorisées':>13}")
+            report, elapsed = timed_import(conn, data.replace(b',,', b',Divers,'))
+            print(f"{'sans index':<22} {report['accepted'] / elapsed:>10,.0f} {report['accepted']:>10} "
+                  f"{'-':>9} {'-':>13}")
+            for label in ('avec index', 'réimport (avec index)'):
+                data = data if label != 'avec index' else csv_file(args.import_rows, seed=8)
+                report, elapsed = timed_import(conn, data, index)
+                print(f"{label:<22} {report['accepted'] / elapsed:>10,.0f} {report['accepted']:>10} "
+                      f"{report['duplicates']:>9} {report['categorized']:>13}")
+        finally:
+            conn.close()
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark du parcours parallèle des tâches de fond (jobs.py) : accélération de 1 à N processus.
+
+Sur une base de `--rows` transactions, recalcule le solde et les totaux par
+catégorie :
+
+- en un seul parcours dans le processus courant (`ledger.scan_totals`, référence) ;
+- par `jobs.parallel_scan_totals` avec 1, 2, … `--processes` processus, en
+  `--chunks-per-process` tranches d'ids par processus. Le pool est démarré et
+  chauffé avant la mesure (coût payé une fois par worker, pas par tâche).
+
+Chaque mesure est la meilleure de `--repeat` ; le résultat doit être identique à
+la référence. L'accélération est bornée par le nombre de cœurs disponibles
+(affiché) et par le débit du disque si la base ne tient pas dans le cache.
+
+    python benchmarks/bench_jobs.py --rows 1000000 --processes 1 2 4 8
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from common import load_app, seed_database, temp_database
+import db_pool
+import jobs
+import ledger
+
+
+def best_of(fn, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def same_totals(a, b):
+    (totals_a, categories_a), (totals_b, categories_b) = a, b
+    return (totals_a['count'] == totals_b['count'] and abs(totals_a['balance'] - totals_b['balance']) < 0.01
+            and categories_a.keys() == categories_b.keys()
+            and all(abs(categories_a[c]['total'] - categories_b[c]['total']) < 0.01 for c in categories_a))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--processes', type=int, nargs='+', default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--chunks-per-process', type=int, default=jobs.CHUNKS_PER_PROCESS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    module = load_app('app')
+    path = seed_database(module, temp_database(), args.rows)
+    conn = db_pool.configure_connection(sqlite3.connect(path))
+    try:
+        baseline, expected = best_of(lambda: ledger.scan_totals(conn), args.repeat)
+        print(f"{args.rows} transactions, {os.cpu_count()} cœur(s) disponible(s)")
+        print(f"{'mode':<24} {'temps (s)':>10} {'lignes/s':>12} {'accélération':>13} {'efficacité':>11}")
+        print(f"{'scan_totals (1 parcours)':<24} {baseline:>10.3f} {args.rows / baseline:>12,.0f} {'1.00x':>13} {'-':>11}")
+        single = None
+        for processes in args.processes:
+            chunks = processes * args.chunks_per_process
+            with jobs.make_pool(processes) as pool:
+                # Chauffe : démarrage des processus `spawn` et import de jobs.py dans chacun
+                jobs.parallel_scan_totals(conn, pool, path, chunks=chunks)
+                elapsed, result = best_of(
+                    lambda: jobs.parallel_scan_totals(conn, pool, path, chunks=chunks), args.repeat)
+            assert same_totals(result, expected), f'résultat différent avec {processes} processus'
+            single = single or elapsed
+            speedup = baseline / elapsed
+            print(f"{f'parallèle ×{processes} ({chunks} tr.)':<24} {elapsed:>10.3f} {args.rows / elapsed:>12,.0f} "
+                  f"{speedup:>12.2f}x {single / elapsed / processes:>10.0%}")
+    finally:
+        conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark du cache en colonnes du ledger contre le chemin ORM de app-corrigé.py.
+
+Mesure le chargement du cache et son empreinte mémoire (ramenée au million de
+lignes), puis compare avec l'ORM (instances `Transaction`) et avec le cache :
+
+- un parcours complet des transactions, en temps et en pic mémoire Python
+  (tracemalloc) ;
+- le débit de /transactions (page de 50 lignes) et de /search.
+
+Les pages sont rendues à chaque requête : on varie la query string pour
+contourner le cache de pages.
+
+    python benchmarks/bench_ledger_cache.py --rows 1000000
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from common import load_app, seed_database, temp_database
+import ledger_cache
+
+
+def traced(fn):
+    """(durée en s, pic mémoire Python en Mo) : un appel chronométré, puis un second sous tracemalloc"""
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6
+
+
+def scan_orm(module):
+    total = 0.0
+    for t in module.Transaction.query.yield_per(1000):
+        total += t.amount
+    return total
+
+
+def scan_cache(cache):
+    total = 0.0
+    for t in cache.iter_rows():
+        total += t['amount']
+    return total
+
+
+def throughput(client, n, call):
+    start = time.perf_counter()
+    for i in range(n):
+        response = call(client, i)
+        assert response.status_code == 200
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    path = temp_database()
+    module = load_app('corrige', database=path)
+    app = module.app
+    app.config['WTF_CSRF_ENABLED'] = False
+    try:
+        seed_database(module, path, args.rows)
+        with app.app_context():
+            app.config['LEDGER_CACHE'] = True
+            load, load_peak = traced(lambda: ledger_cache.LedgerCache('transaction').sync(module.raw_connection()))
+            cache = ledger_cache.get_cache(module.raw_connection())
+            stats = cache.stats()
+            print(f"cache : {stats['rows']} lignes chargées en {load:.2f} s (pic {load_peak:.0f} Mo), "
+                  f"{stats['bytes'] / 1e6:.1f} Mo, soit {stats['bytes_per_million_rows'] / 1e6:.1f} Mo par million de lignes")
+
+            print(f"\n{'parcours complet':<18} {'durée (s)':>10} {'pic mém (Mo)':>13}")
+            for label, fn in (('ORM', lambda: scan_orm(module)), ('cache', lambda: scan_cache(cache))):
+                elapsed, peak = traced(fn)
+                print(f"{label:<18} {elapsed:>10.2f} {peak:>13.1f}")
+            module.db.session.remove()
+
+        client = app.test_client()
+        routes = (
+            ('/transactions', lambda c, i: c.get(f'/transactions?limit=50&n={i}')),
+            ('/search', lambda c, i: c.post('/search', data={'query': 'cour'})),
+        )
+        print(f"\n{'route':<14} {'ORM (req/s)':>12} {'cache (req/s)':>14}")
+        for route, call in routes:
+            rates = []
+            for enabled in (False, True):
+                app.config['LEDGER_CACHE'] = enabled
+                rates.append(throughput(client, args.requests, call))
+            print(f"{route:<14} {rates[0]:>12.0f} {rates[1]:>14.0f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark du surcoût de l'instrumentation (histogrammes HTTP et SQL).
+
+Compare une connexion sqlite3 nue et `metrics.InstrumentedConnection` sur des
+lectures ponctuelles et un parcours de table, puis le débit de /search et
+/reports avec l'instrumentation activée et désactivée (METRICS_ENABLED).
+
+    python benchmarks/bench_metrics.py --rows 100000
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from common import load_app, seed_database, temp_database
+import db_pool
+import metrics
+
+
+def per_call(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def sql_overhead(path, n):
+    print(f"{'opération':<28} {'nue (µs)':>10} {'instrumentée (µs)':>18}")
+    conns = [db_pool.configure_connection(sqlite3.connect(path, factory=factory))
+             for factory in (sqlite3.Connection, metrics.InstrumentedConnection)]
+    cases = [
+        ('SELECT par id', lambda c: c.execute('SELECT * FROM transactions WHERE id = ?', (42,)).fetchone(), n),
+        ('solde (ledger_totals)', lambda c: c.execute('SELECT balance FROM ledger_totals WHERE id = 1').fetchone(), n),
+        ('parcours 10k lignes', lambda c: sum(1 for _ in c.execute('SELECT id FROM transactions LIMIT 10000')), 50),
+    ]
+    for label, fn, count in cases:
+        plain, instrumented = (per_call(lambda: fn(conn), count) for conn in conns)
+        print(f"{label:<28} {plain:>10.2f} {instrumented:>18.2f}")
+    for conn in conns:
+        conn.close()
+
+
+def http_overhead(module, n):
+    app = module.app
+    client = app.test_client()
+    print(f"\n{'route':<12} {'sans mesures (req/s)':>21} {'avec mesures (req/s)':>21}")
+    for route, method, data in (('/search', 'post', {'query': 'cour'}), ('/reports', 'get', None)):
+        rates = []
+        for enabled in (False, True):
+            app.config['METRICS_ENABLED'] = enabled
+            app.config['DB_CONNECTION_FACTORY'] = metrics.InstrumentedConnection if enabled else None
+            app.extensions['db_pool'] = None
+            call = getattr(client, method)
+            # /reports est servi par le cache de pages : on varie la query string pour forcer le rendu
+            start = time.perf_counter()
+            for i in range(n):
+                call(route, data=data) if data else call(f'{route}?category=Loisirs&n={i}')
+            rates.append(n / (time.perf_counter() - start))
+        print(f"{route:<12} {rates[0]:>21.0f} {rates[1]:>21.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--calls', type=int, default=20_000)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    module = load_app('app')
+    path = seed_database(module, temp_database(), args.rows)
+    try:
+        sql_overhead(path, args.calls)
+        http_overhead(module, args.requests)
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark du cache de pages : rendu complet, page en cache et 304 (If-None-Match).
+
+    python benchmarks/bench_page_cache.py --rows 100000 --number 500
+"""
+import argparse
+import os
+import time
+
+from common import load_app, seed_database, temp_database
+
+
+def per_request(client, url, number, headers=None):
+    start = time.perf_counter()
+    for _ in range(number):
+        client.get(url, headers=headers)
+    return (time.perf_counter() - start) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--number', type=int, default=500)
+    args = parser.parse_args()
+
+    module = load_app('app')
+    path = seed_database(module, temp_database(), args.rows)
+    client = module.app.test_client()
+    try:
+        print(f"{'page':>28} {'rendu (ms)':>11} {'en cache (ms)':>14} {'304 (ms)':>9}")
+        for url in ('/', '/transactions', '/transactions?limit=500'):
+            views = (module.index, module.transactions)
+            for view in views:
+                view.cache.clear()
+            # Rendu complet : on vide le cache avant chaque requête
+            start = time.perf_counter()
+            for _ in range(args.number):
+                for view in views:
+                    view.cache.clear()
+                client.get(url)
+            render = (time.perf_counter() - start) / args.number * 1000
+            cached = per_request(client, url, args.number)
+            etag = client.get(url).headers['ETag']
+            not_modified = per_request(client, url, args.number, {'If-None-Match': etag})
+            print(f"{url:>28} {render:>11.3f} {cached:>14.3f} {not_modified:>9.3f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark de la limitation de débit et de l'admission (ratelimit.py) : routes légères sous attaque.
+
+Le serveur gunicorn (gunicorn.conf.py, `--workers` workers gthread) tourne sur
+une base de `--rows` transactions, limitation désactivée puis activée (seaux
+partagés entre workers dans un fichier SQLite sous /dev/shm). Dans chaque cas :
+
+- calme : `--cheap` clients enchaînent des requêtes sur des routes légères
+  (suggestions, rapports) pendant `--duration` s ;
+- attaque : mêmes clients, pendant que `--attackers` clients martèlent /search
+  (terme fréquent, classement de nombreuses lignes) et /calculate.
+
+Mesures : p50 / p99 des routes légères dans les deux phases, et réponses des
+attaquants (200 traitées, 429 débit, 503 admission). Avec la limitation, la
+latence des routes légères sous attaque doit rester proche de celle au calme.
+
+    python benchmarks/bench_ratelimit.py --rows 200000 --duration 10
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from common import load_app, seed_database, temp_database
+from bench_servers import free_port, start_server, stop_server
+from suite import summarize
+
+CHEAP = [('GET', '/api/search/suggest?q=Co', None), ('GET', '/reports', None)]
+EXPENSIVE = [('POST', '/search', {'query': 'Courses'}), ('POST', '/calculate', {'formula': '9 ** 9 * 2 ** 40'})]
+
+
+def client_loop(port, routes, threads, duration):
+    """Processus client : `threads` connexions qui enchaînent les routes jusqu'à l'échéance ;
+    renvoie (latences ms, nombre de réponses par statut)"""
+    deadline = time.monotonic() + duration
+
+    def run(offset):
+        latencies, statuses = [], Counter()
+        i = offset
+        while time.monotonic() < deadline:
+            method, path, form = routes[i % len(routes)]
+            i += 1
+            body = urlencode(form) if form else None
+            headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+            start = time.perf_counter()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                statuses[response.status] += 1
+            except OSError:
+                statuses['erreur'] += 1
+            finally:
+                conn.close()
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies, statuses
+
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(run, range(threads)))
+    return [t for latencies, _ in results for t in latencies], sum((s for _, s in results), Counter())
+
+
+def phase(pool, port, cheap, attackers, duration):
+    futures = [pool.submit(client_loop, port, CHEAP, cheap, duration)]
+    if attackers:
+        futures.append(pool.submit(client_loop, port, EXPENSIVE, attackers, duration))
+    cheap_latencies, cheap_statuses = futures[0].result()
+    attack_statuses = futures[1].result()[1] if attackers else Counter()
+    return summarize(cheap_latencies, duration, sum(n for s, n in cheap_statuses.items() if s != 200)), attack_statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--duration', type=float, default=10.0, help='durée de chaque phase (s)')
+    parser.add_argument('--cheap', type=int, default=4, help='clients des routes légères')
+    parser.add_argument('--attackers', type=int, default=16, help='clients des routes coûteuses')
+    parser.add_argument('--workers', type=int, default=2, help='workers gunicorn')
+    args = parser.parse_args()
+
+    database = temp_database()
+    seed_database(load_app('app', database), database, args.rows)
+    store = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else os.path.dirname(database),
+                         f'budget-ratelimit-{os.getpid()}.db')
+    print(f"{os.cpu_count()} cœur(s), {args.workers} workers gthread, {args.rows} transactions, "
+          f"{args.cheap} clients légers, {args.attackers} attaquants, phases de {args.duration:.0f} s")
+    print(f"{'limitation':<11} {'phase':<8} {'légères req/s':>14} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'attaque 200':>12} {'429':>7} {'503':>7}")
+    try:
+        for enabled in (False, True):
+            env = dict(os.environ, BUDGET_APP='app', BUDGET_DATABASE=database, BUDGET_WORKERS=str(args.workers),
+                       BUDGET_RATE_LIMIT='1' if enabled else '0', BUDGET_RATE_LIMIT_STORE=store)
+            port = free_port()
+            process = start_server('gthread', port, env)
+            try:
+                with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    # Processus clients démarrés avant la mesure
+                    list(pool.map(time.sleep, [0, 0]))
+                    for name, attackers in (('calme', 0), ('attaque', args.attackers)):
+                        cheap, attack = phase(pool, port, args.cheap, attackers, args.duration)
+                        print(f"{'activée' if enabled else 'désactivée':<11} {name:<8} {cheap['rps']:>14.0f} "
+                              f"{cheap['p50_ms']:>9.2f} {cheap['p99_ms']:>9.2f} {attack[200]:>12} "
+                              f"{attack[429]:>7} {attack[503]:>7}")
+            finally:
+                stop_server(process)
+    finally:
+        for path in (database, store):
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
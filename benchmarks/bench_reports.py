@@ -0,0 +1,59 @@
+"""Benchmark des rapports mensuels : rollups matérialisés contre recalcul sur les transactions.
+
+Pour des ledgers couvrant 5 ans (de 10k à 1M lignes), compare `reports.monthly_report()`
+(lecture des rollups), un `GROUP BY` SQLite sur toute la table et l'ancienne
+méthode externe (relire chaque ligne en Python). Vérifie aussi que les rollups
+correspondent au recalcul complet.
+
+    python benchmarks/bench_reports.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import sqlite3
+import time
+from collections import defaultdict
+
+from common import load_app, seed_database, temp_database
+import reports
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def python_report(conn):
+    totals = defaultdict(float)
+    for amount, category, booked_on in conn.execute('SELECT amount, category, booked_on FROM transactions'):
+        totals[booked_on[:7], category] += amount
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    module = load_app('app')
+    print(f"{'lignes':>10} {'rollups (ms)':>13} {'GROUP BY (ms)':>14} {'Python (ms)':>12} {'mois':>5}")
+    for size in args.sizes:
+        path = seed_database(module, temp_database(), size)
+        conn = sqlite3.connect(path)
+        try:
+            assert not reports.verify_rollups(conn)
+            months = len(reports.monthly_report(conn)['months'])
+            rollups = best_of(lambda: reports.monthly_report(conn))
+            scan = best_of(lambda: conn.execute(reports.ROLLUP_SELECT.format(table='transactions', where='')).fetchall(), 3)
+            python = best_of(lambda: python_report(conn), 1)
+            print(f"{size:>10} {rollups:>13.3f} {scan:>14.1f} {python:>12.1f} {months:>5}")
+        finally:
+            conn.close()
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
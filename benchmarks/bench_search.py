@@ -0,0 +1,63 @@
+"""Benchmark de la recherche : index FTS5 contre `LIKE '%...%'` (p50/p99).
+
+    python benchmarks/bench_search.py --sizes 10000 100000 1000000 --queries 200
+"""
+import argparse
+import os
+import random
+import sqlite3
+import time
+
+from common import WORDS, load_app, seed_database, temp_database
+import search_index
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def latencies(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentile(timings, 50), percentile(timings, 99)
+
+
+def like_search(conn, query):
+    """Ancien chemin : LIKE sans index ni limite"""
+    return conn.execute(
+        'SELECT id, description, amount, category FROM transactions WHERE description LIKE ?',
+        (f'%{query}%',)
+    ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    # Mélange de mots complets, de préfixes et de termes absents (pire cas pour LIKE)
+    queries = [rng.choice([w, w[:4].lower(), f'{w} {rng.choice(WORDS)}', 'introuvable'])
+               for w in (rng.choice(WORDS) for _ in range(args.queries))]
+
+    module = load_app('app')
+    print(f"{'lignes':>10} {'FTS5 p50':>9} {'FTS5 p99':>9} {'LIKE p50':>9} {'LIKE p99':>9}  (ms)")
+    for size in args.sizes:
+        path = seed_database(module, temp_database(), size)
+        conn = sqlite3.connect(path)
+        try:
+            fts = latencies(lambda q: search_index.search(conn, q), queries)
+            like = latencies(lambda q: like_search(conn, q), queries)
+            print(f"{size:>10} {fts[0]:>9.3f} {fts[1]:>9.3f} {like[0]:>9.3f} {like[1]:>9.3f}")
+        finally:
+            conn.close()
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
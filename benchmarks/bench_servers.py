@@ -0,0 +1,133 @@
+"""Benchmark de débit : serveur de développement Werkzeug contre gunicorn (sync, gthread, gevent).
+
+Chaque serveur tourne dans son propre processus sur la même base synthétique.
+Les modèles gunicorn utilisent gunicorn.conf.py : préchargement, migrations
+dans le maître, connexions ouvertes dans chaque worker après le fork. Seule la
+classe de worker change. La charge vient de `--clients` processus de
+`--threads` connexions chacun (générateur de suite.py) et vise des routes en
+lecture, servies à l'identique par les deux applis.
+
+Les chiffres dépendent de la machine : relever `nproc` avec les résultats.
+`--workers` fixe le nombre de workers (2 × cœurs + 1 par défaut).
+
+    python benchmarks/bench_servers.py --rows 100000 --requests 2000
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common import ROOT, load_app, seed_database, temp_database
+from suite import http_client, summarize
+
+ROUTES = ['/transactions', '/api/search/suggest?q=Co', '/reports']
+MODES = ['dev', 'sync', 'gthread', 'gevent']
+
+DEV_SERVER = '''
+import sys
+sys.path.insert(0, {root!r})
+import wsgi
+wsgi.module.prepare_server(wsgi.app) if hasattr(wsgi.module, 'prepare_server') else None
+wsgi.app.run(host='127.0.0.1', port={port}, threaded=True)
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, env):
+    if mode == 'dev':
+        command = [sys.executable, '-c', DEV_SERVER.format(root=ROOT, port=port)]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'wsgi:app']
+        env = dict(env, BUDGET_WORKER_CLASS=mode, BUDGET_BIND=f'127.0.0.1:{port}')
+    # Journal dans un fichier : un tube jamais lu finit par bloquer le serveur
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise RuntimeError(f'{mode} : le serveur s\'est arrêté\n{log.read().decode()}')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', ROUTES[0])
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{mode} : pas de réponse après 30 s')
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def load(port, path, requests, clients, threads):
+    per_client = max(1, requests // (clients * threads))
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(clients, mp_context=context) as pool:
+        # Processus clients démarrés avant la mesure
+        list(pool.map(time.sleep, [0] * clients))
+        start = time.perf_counter()
+        futures = [pool.submit(http_client, port, 'GET', path, None, per_client, threads) for _ in range(clients)]
+        latencies, errors = [], 0
+        for future in futures:
+            client_latencies, client_errors = future.result()
+            latencies.extend(client_latencies)
+            errors += client_errors
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', choices=['app', 'corrige'], default='app')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--requests', type=int, default=2000, help='requêtes par route')
+    parser.add_argument('--clients', type=int, default=4, help='processus générateurs de charge')
+    parser.add_argument('--threads', type=int, default=8, help='connexions simultanées par processus')
+    parser.add_argument('--workers', type=int, help='workers gunicorn (défaut : gunicorn.conf.py)')
+    args = parser.parse_args()
+
+    database = temp_database()
+    seed_database(load_app(args.app, database), database, args.rows)
+    env = dict(os.environ, BUDGET_APP=args.app, BUDGET_DATABASE=database)
+    if args.workers:
+        env['BUDGET_WORKERS'] = str(args.workers)
+    print(f"{os.cpu_count()} cœur(s), {args.clients} × {args.threads} clients, {args.rows} transactions")
+    print(f"{'serveur':<9} {'route':<26} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'erreurs':>8}")
+    try:
+        for mode in args.modes:
+            port = free_port()
+            process = start_server(mode, port, env)
+            try:
+                for path in ROUTES:
+                    result = load(port, path, args.requests, args.clients, args.threads)
+                    print(f"{mode:<9} {path:<26} {result['rps']:>8.0f} {result['p50_ms']:>9.2f} "
+                          f"{result['p99_ms']:>9.2f} {result['errors']:>8}")
+            finally:
+                stop_server(process)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark du démarrage à froid : import de l'appli et première réponse.
+
+Chaque essai est un nouveau processus Python, comme un worker gunicorn qui
+démarre. Sur une base existante (déjà migrée, `--rows` transactions), on mesure :
+
+- le processus complet (interpréteur compris, jusqu'à la première réponse) ;
+- l'import du module (création de l'application comprise) ;
+- la première requête, puis la seconde (caches et pools chauds) ;
+- `init_db()` / `setup_ledger()` sur la base à jour (aucune migration, aucune donnée réinsérée).
+
+Avec `--budget-ms`, le script échoue (code 1) si le p50 du processus complet
+dépasse le budget.
+
+    python benchmarks/bench_startup.py --runs 10 --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import load_app, seed_database, temp_database
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = '''
+import json, sys, time
+sys.path.insert(0, {bench_dir!r})
+from common import load_app
+start = time.perf_counter()
+module = load_app({name!r})
+imported = time.perf_counter()
+client = module.app.test_client()
+status = client.get({path!r}).status_code
+first = time.perf_counter()
+client.get({path!r})
+second = time.perf_counter()
+with module.app.app_context():
+    module.init_db(module.app, seed=False) if hasattr(module, 'init_db') else module.setup_ledger()
+init = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'first': first - imported, 'second': second - first,
+                  'init_db': init - second, 'status': status}}))
+'''
+
+
+def run_child(name, path, database):
+    env = dict(os.environ, BUDGET_DATABASE=database)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD.format(bench_dir=BENCH_DIR, name=name, path=path)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process'] = time.perf_counter() - start - result['init_db']
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--apps', nargs='+', choices=['app', 'corrige'], default=['app', 'corrige'])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--path', default='/transactions', help='route de la première requête')
+    parser.add_argument('--budget-ms', type=float, help='p50 maximal du processus complet')
+    args = parser.parse_args()
+
+    over_budget = False
+    print(f"{'appli':<8} {'mesure':<22} {'p50 (ms)':>9} {'max (ms)':>9}")
+    for name in args.apps:
+        database = temp_database()
+        seed_database(load_app(name, database), database, args.rows)
+        try:
+            runs = [run_child(name, args.path, database) for _ in range(args.runs)]
+        finally:
+            os.remove(database)
+        assert all(run['status'] == 200 for run in runs), runs
+        for key, label in (('process', 'processus complet'), ('import', 'import + create_app'),
+                           ('first', 'première requête'), ('second', 'seconde requête'),
+                           ('init_db', 'init_db (base à jour)')):
+            timings = sorted(run[key] * 1000 for run in runs)
+            print(f"{name:<8} {label:<22} {timings[len(timings) // 2]:>9.1f} {timings[-1]:>9.1f}")
+            if key == 'process' and args.budget_ms and timings[len(timings) // 2] > args.budget_ms:
+                over_budget = True
+                print(f"❌ {name} : démarrage au-delà du budget de {args.budget_ms:.0f} ms")
+    if over_budget:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Test de charge du flux en direct (/stream) : `--subscribers` abonnés SSE simultanés.
+
+Le serveur tourne dans son propre processus (serveur de développement ou
+gunicorn, voir bench_servers.py). Tous les abonnés sont tenus par un seul thread
+client (sockets non bloquantes et `selectors`). Mesures :
+
+- ouverture : temps pour que tous les abonnés reçoivent le solde initial ;
+- mémoire du serveur (RSS, workers compris) avant et avec les abonnés ;
+- diffusion : `--writes` transactions ajoutées une à une par l'API toutes les
+  `--interval` s ; latence entre l'envoi du POST et la réception par chaque
+  abonné (p50 / p99 / max) et livraisons manquantes ;
+- reprise : `--resume` abonnés se déconnectent, `--writes` lignes sont ajoutées,
+  puis ils se reconnectent avec `Last-Event-ID` ; toutes les lignes manquées
+  doivent arriver.
+
+Avec plusieurs workers gunicorn, une écriture reçue par un autre worker n'est
+vue qu'au relevé suivant (BUDGET_LIVE_POLL, `--poll`).
+
+    python benchmarks/bench_stream.py --subscribers 500 --modes dev gevent
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import selectors
+import socket
+import threading
+import time
+
+from common import load_app, seed_database, temp_database
+from bench_servers import free_port, start_server, stop_server
+from suite import summarize
+
+ID_RE = re.compile(rb'^id: (\d+)$', re.M)
+MODES = ['dev', 'gevent', 'gthread']
+CONNECT_WAVE = 100
+
+
+def rss_mb(pid):
+    """RSS du processus et de ses enfants (workers gunicorn), en Mo"""
+    pids = [pid] + [int(entry) for entry in os.listdir('/proc') if entry.isdigit() and _parent(entry) == pid]
+    total = 0
+    for child in pids:
+        try:
+            with open(f'/proc/{child}/status') as status:
+                total += next(int(line.split()[1]) for line in status if line.startswith('VmRSS'))
+        except (OSError, StopIteration):
+            pass
+    return total / 1024
+
+
+def _parent(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            return int(stat.read().rsplit(')', 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class Subscribers:
+    """Abonnés SSE tenus par un seul thread : dernier id reçu et instant de chaque progression"""
+
+    def __init__(self, port):
+        self.port = port
+        self.selector = selectors.DefaultSelector()
+        self.last_ids = {}
+        self.buffers = {}
+        self.progress = {}  # socket -> [(instant, dernier id reçu)]
+        self.ready = set()
+
+    def open(self, last_event_id=None):
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        header = f'Last-Event-ID: {last_event_id}\r\n' if last_event_id is not None else ''
+        sock.sendall(f'GET /stream HTTP/1.1\r\nHost: bench\r\n{header}\r\n'.encode())
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.last_ids[sock] = last_event_id or 0
+        self.buffers[sock] = b''
+        self.progress[sock] = []
+        return sock
+
+    def close(self, sock):
+        self.selector.unregister(sock)
+        sock.close()
+        self.ready.discard(sock)
+        self.buffers.pop(sock)
+        self.progress.pop(sock)
+        return self.last_ids.pop(sock)
+
+    def poll(self, timeout):
+        for key, _ in self.selector.select(timeout):
+            sock = key.fileobj
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                raise RuntimeError('flux fermé par le serveur')
+            now = time.perf_counter()
+            # Lignes complètes seulement : un id peut être coupé entre deux recv
+            complete, _, rest = (self.buffers[sock] + data).rpartition(b'\n')
+            self.buffers[sock] = rest
+            if b'event: balance' in complete:
+                self.ready.add(sock)
+            ids = ID_RE.findall(complete)
+            if ids:
+                last_id = max(int(id_) for id_ in ids)
+                if last_id > self.last_ids[sock]:
+                    self.last_ids[sock] = last_id
+                    self.progress[sock].append((now, last_id))
+
+    def wait(self, predicate, timeout):
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            self.poll(0.05)
+        return predicate()
+
+
+def post_row(port, i):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = json.dumps([{'description': f'Flux {i}', 'amount': -1.5, 'category': 'Loisirs'}])
+    conn.request('POST', '/api/v1/transactions', body, {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    ids = json.loads(response.read())['ids']
+    conn.close()
+    return ids[-1]
+
+
+def writer(port, writes, interval, sent):
+    for i in range(writes):
+        start = time.perf_counter()
+        sent.append((start, post_row(port, i)))
+        time.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+
+def delivery_ms(sent, progress):
+    """Délais (ms) entre chaque POST et la réception, par chaque abonné, d'un id >= celui de la ligne ;
+    renvoie (délais, livraisons manquantes)"""
+    samples, missing = [], 0
+    for steps in progress:
+        for sent_at, row_id in sent:
+            received_at = next((at for at, last_id in steps if last_id >= row_id), None)
+            if received_at is None:
+                missing += 1
+            else:
+                samples.append((received_at - sent_at) * 1000)
+    return samples, missing
+
+
+def run_mode(mode, env, args):
+    port = free_port()
+    process = start_server(mode, port, env)
+    try:
+        base_rss = rss_mb(process.pid)
+        clients = Subscribers(port)
+        start = time.perf_counter()
+        sockets = []
+        # Par vagues : 500 connexions simultanées débordent la file d'attente d'accept du serveur
+        for _ in range(0, args.subscribers, CONNECT_WAVE):
+            sockets += [clients.open() for _ in range(min(CONNECT_WAVE, args.subscribers - len(sockets)))]
+            clients.wait(lambda: len(clients.ready) == len(sockets), 60)
+        connected = len(clients.ready)
+        open_s = time.perf_counter() - start
+        idle_rss = rss_mb(process.pid)
+
+        # Diffusion : chaque abonné enregistre l'instant où son dernier id progresse
+        for sock in sockets:
+            clients.progress[sock].clear()
+        sent = []
+        thread = threading.Thread(target=writer, args=(port, args.writes, args.interval, sent))
+        thread.start()
+        while thread.is_alive():
+            clients.poll(0.01)
+        final_id = sent[-1][1]
+        clients.wait(lambda: all(clients.last_ids[sock] >= final_id for sock in sockets), args.poll + 5)
+        samples, missing = delivery_ms(sent, [clients.progress[sock] for sock in sockets])
+
+        # Reprise : déconnexion, écritures manquées, reconnexion avec Last-Event-ID
+        resumed = [clients.close(sock) for sock in sockets[:args.resume]]
+        sent = []
+        writer(port, args.writes, 0, sent)
+        final_id = sent[-1][1]
+        back = [clients.open(last_id) for last_id in resumed]
+        clients.wait(lambda: all(clients.last_ids[sock] >= final_id for sock in back), 30)
+        caught_up = sum(clients.last_ids[sock] >= final_id for sock in back)
+        for sock in list(clients.last_ids):
+            clients.close(sock)
+        return {'connected': connected, 'open_s': open_s, 'base_rss': base_rss, 'idle_rss': idle_rss,
+                'samples': samples, 'missing': missing, 'resumed': caught_up}
+    finally:
+        stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=['dev', 'gevent'])
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--writes', type=int, default=100)
+    parser.add_argument('--interval', type=float, default=0.02, help='entre deux écritures (s)')
+    parser.add_argument('--resume', type=int, default=50, help='abonnés déconnectés puis reconnectés')
+    parser.add_argument('--workers', type=int, default=1, help='workers gunicorn')
+    parser.add_argument('--threads', type=int, help='threads par worker gthread (défaut : --subscribers + 8)')
+    parser.add_argument('--poll', type=float, default=1.0, help='BUDGET_LIVE_POLL (s)')
+    args = parser.parse_args()
+
+    database = temp_database()
+    seed_database(load_app('app', database), database, args.rows)
+    env = dict(os.environ, BUDGET_APP='app', BUDGET_DATABASE=database, BUDGET_WORKERS=str(args.workers),
+               BUDGET_THREADS=str(args.threads or args.subscribers + 8), BUDGET_LIVE_POLL=str(args.poll),
+               BUDGET_WORKER_CONNECTIONS=str(args.subscribers + 100))
+    print(f"{os.cpu_count()} cœur(s), {args.subscribers} abonnés, {args.writes} écritures toutes les "
+          f"{args.interval * 1000:.0f} ms, {args.workers} worker(s) gunicorn")
+    print(f"{'serveur':<9} {'abonnés':>8} {'ouverture':>10} {'RSS (Mo)':>15} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'max (ms)':>9} {'manquées':>9} {'reprise':>9}")
+    try:
+        for mode in args.modes:
+            result = run_mode(mode, env, args)
+            delivery = summarize(result['samples'], None, result['missing'])
+            print(f"{mode:<9} {result['connected']:>8} {result['open_s']:>9.2f}s {result['base_rss']:>6.0f} → "
+                  f"{result['idle_rss']:>6.0f} {delivery['p50_ms']:>9.2f} {delivery['p99_ms']:>9.2f} "
+                  f"{max(result['samples'], default=0):>9.2f} {result['missing']:>9} "
+                  f"{result['resumed']:>4}/{args.resume:<4}")
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark des suggestions à la frappe (/api/search/suggest) sur un grand ledger.
+
+Mesure la construction de l'index de préfixes, puis le temps serveur d'une
+suggestion (p50/p99) :
+
+- index seul, sans cache ;
+- index et cache TTL ;
+- route complète via le client de test.
+
+La référence est une requête FTS5 par préfixe sur la table. Les préfixes
+simulent une frappe : 1 à 5 premières lettres de mots et de catégories.
+
+    python benchmarks/bench_suggest.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import time
+
+from common import CATEGORIES, WORDS, load_app, seed_database, temp_database
+import search_index
+import suggest
+
+
+def percentiles(fn, prefixes):
+    timings = []
+    for prefix in prefixes:
+        start = time.perf_counter()
+        fn(prefix)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    prefixes = [word[:rng.randint(1, 5)] for word in (rng.choice(WORDS + CATEGORIES) for _ in range(args.queries))]
+
+    module = load_app('app')
+    app = module.app
+    path = seed_database(module, temp_database(), args.rows)
+    try:
+        with app.app_context():
+            conn = module.get_db_connection()
+            start = time.perf_counter()
+            index = suggest.get_index(conn)
+            print(f"index construit en {time.perf_counter() - start:.2f} s : {index.stats()}")
+
+            fts = search_index.fts_table()
+            cases = [
+                ('index seul', lambda p: index.suggest(p)),
+                ('index + cache', lambda p: suggest.cached_suggest(conn, p)),
+                ('FTS5 préfixe', lambda p: conn.execute(
+                    f'SELECT rowid FROM "{fts}" WHERE "{fts}" MATCH ? LIMIT 10',
+                    (search_index.match_expression(p),)).fetchall()),
+            ]
+            print(f"\n{'chemin':<16} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+            for label, fn in cases:
+                p50, p99 = percentiles(fn, prefixes)
+                print(f"{label:<16} {p50:>9.3f} {p99:>9.3f}")
+
+        client = app.test_client()
+        p50, p99 = percentiles(lambda p: client.get('/api/search/suggest', query_string={'q': p}), prefixes)
+        print(f"{'route complète':<16} {p50:>9.3f} {p99:>9.3f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark du solde : agrégats maintenus par triggers contre recalcul à chaque requête.
+
+Compare, pour des ledgers de 1k à 1M lignes, la lecture de `ledger_totals` (O(1)),
+un `SUM()` SQLite et l'ancienne somme Python sur `fetchall()`. Mesure aussi le
+surcoût des triggers à l'insertion.
+
+    python benchmarks/bench_totals.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+
+from common import INSERT_SQL, load_app, seed_database, synthetic_rows, temp_database
+import ledger
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def insert_rate(conn, with_triggers, n=20_000):
+    if not with_triggers:
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall():
+            conn.execute(f'DROP TRIGGER {name}')
+    rows = list(synthetic_rows(n, seed=7))
+    start = time.perf_counter()
+    with conn:
+        conn.executemany(INSERT_SQL.format(table='transactions'), rows)
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    module = load_app('app')
+    print(f"{'lignes':>10} {'agrégats (ms)':>14} {'SUM() (ms)':>11} {'sum Python (ms)':>16}")
+    for size in args.sizes:
+        path = seed_database(module, temp_database(), size)
+        conn = sqlite3.connect(path)
+        try:
+            o1 = best_of(lambda: ledger.read_balance(conn))
+            sql = best_of(lambda: conn.execute('SELECT SUM(amount) FROM transactions').fetchone())
+            py = best_of(lambda: sum(r[0] for r in conn.execute('SELECT amount FROM transactions').fetchall()), 3)
+            assert not ledger.verify_totals(conn)
+            print(f"{size:>10} {o1:>14.4f} {sql:>11.2f} {py:>16.2f}")
+        finally:
+            conn.close()
+            os.remove(path)
+
+    path = seed_database(module, temp_database(), 0)
+    conn = sqlite3.connect(path)
+    with_triggers = statistics.mean(insert_rate(conn, True) for _ in range(3))
+    without = statistics.mean(insert_rate(conn, False) for _ in range(3))
+    conn.close()
+    os.remove(path)
+    print(f"\ninsertions/s : {with_triggers:,.0f} avec triggers, {without:,.0f} sans")
+
+
+if __name__ == '__main__':
+    main()
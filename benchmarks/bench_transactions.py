@@ -0,0 +1,62 @@
+"""Benchmark de /transactions : page keyset et mode flux, de 1k à 1M lignes.
+
+Mesure pour chaque taille de ledger le temps d'une page, la latence du premier
+octet en mode flux et le pic mémoire Python (tracemalloc) pendant le flux complet.
+
+    python benchmarks/bench_transactions.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from common import load_app, seed_database, temp_database, timed
+
+
+def measure(module, size):
+    path = seed_database(module, temp_database(), size)
+    client = module.app.test_client()
+    try:
+        page_time, response = timed(client.get, '/transactions?limit=50')
+        assert response.status_code == 200
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get('/transactions?stream=1', buffered=False)
+        chunks = iter(response.response)
+        first = next(chunks)
+        first_byte = time.perf_counter() - start
+        streamed = len(first)
+        for chunk in chunks:
+            streamed += len(chunk)
+        total_time = time.perf_counter() - start
+        response.close()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        os.remove(path)
+    return {
+        'rows': size,
+        'page_ms': page_time * 1000,
+        'first_byte_ms': first_byte * 1000,
+        'stream_s': total_time,
+        'stream_mb': streamed / 1e6,
+        'peak_kb': peak / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    module = load_app('app')
+    print(f"{'lignes':>10} {'page (ms)':>10} {'1er octet (ms)':>15} {'flux (s)':>9} {'HTML (Mo)':>10} {'pic mém (Ko)':>13}")
+    for size in args.sizes:
+        r = measure(module, size)
+        print(f"{r['rows']:>10} {r['page_ms']:>10.2f} {r['first_byte_ms']:>15.2f} {r['stream_s']:>9.2f} "
+              f"{r['stream_mb']:>10.1f} {r['peak_kb']:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Outils partagés par les benchmarks : import des applis et génération de ledgers synthétiques"""
+import importlib.util
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CATEGORIES = ['Revenu', 'Alimentation', 'Logement', 'Factures', 'Loisirs', 'Transport', 'Santé', 'Épargne']
+WORDS = ['Courses', 'Carrefour', 'Loyer', 'Restaurant', 'Essence', 'Netflix', 'Pharmacie', 'Salaire',
+         'Bonus', 'Électricité', 'EDF', 'Cinéma', 'Train', 'SNCF', 'Boulangerie', 'Assurance']
+
+
+def load_app(name='app', database=None):
+    """Importe app.py (`app`) ou app-corrigé.py (`corrige`) et renvoie le module
+
+    Le moteur SQLAlchemy de app-corrigé.py est créé à l'import : sa base doit être
+    choisie ici (`database`, chemin absolu) et non après coup.
+    """
+    if database is not None:
+        os.environ['BUDGET_DATABASE'] = database
+    if name == 'app':
+        import app as module
+        return module
+    path = os.path.join(ROOT, 'app-corrigé.py')
+    spec = importlib.util.spec_from_file_location('app_corrige', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['app_corrige'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_rows(n, seed=42, years=5):
+    """Génère `n` transactions (description, amount, category, booked_on) reproductibles,
+    datées dans l'ordre des ids sur les `years` dernières années"""
+    rng = random.Random(seed)
+    days = 365 * years
+    start = date.today() - timedelta(days=days)
+    for i in range(n):
+        category = rng.choice(CATEGORIES)
+        amount = round(rng.uniform(1000, 4000), 2) if category == 'Revenu' else -round(rng.uniform(1, 300), 2)
+        description = f'{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.randint(1, 9999)}'
+        yield description, amount, category, (start + timedelta(days=i * days // max(n, 1))).isoformat()
+
+
+INSERT_SQL = 'INSERT INTO "{table}" (description, amount, category, booked_on) VALUES (?, ?, ?, ?)'
+
+
+def temp_database(prefix='budget-bench-'):
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix='.db')
+    os.close(fd)
+    return path
+
+
+def seed_database(module, path, n, batch=50_000):
+    """Crée le schéma de l'appli (`init_db()` ou `setup_ledger()`) puis insère `n` lignes synthétiques"""
+    if hasattr(module, 'init_db'):
+        module.app.config['DATABASE'] = path
+        module.init_db(module.app)
+        table = 'transactions'
+    else:
+        with module.app.app_context():
+            if module.db.engine.url.database != path:
+                raise ValueError(f"app-corrigé.py utilise {module.db.engine.url.database}, pas {path} (voir load_app)")
+            module.setup_ledger()
+        table = module.Transaction.__tablename__
+    conn = sqlite3.connect(path)
+    rows = synthetic_rows(n)
+    while True:
+        chunk = [row for _, row in zip(range(batch), rows)]
+        if not chunk:
+            break
+        conn.executemany(INSERT_SQL.format(table=table), chunk)
+        conn.commit()
+    conn.close()
+    return path
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+class serve:
+    """Lance l'appli sur un serveur WSGI multi-thread local le temps d'un bloc `with` ; renvoie l'URL de base"""
+
+    def __init__(self, app, threaded=True):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=threaded, request_handler=QuietHandler)
+        self.thread = None
+
+    def __enter__(self):
+        import threading
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.thread.join()
+
+
+def hammer(url, requests_per_client, clients, method='GET', body=None):
+    """Envoie `clients` × `requests_per_client` requêtes HTTP en parallèle ; renvoie (req/s, latences en ms)"""
+    from concurrent.futures import ThreadPoolExecutor
+    import urllib.request
+
+    data = body.encode() if body else None
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+
+    def client(_):
+        timings = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers, method=method)) as r:
+                r.read()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as executor:
+        latencies = [t for timings in executor.map(client, range(clients)) for t in timings]
+    return len(latencies) / (time.perf_counter() - start), latencies
@@ -0,0 +1,43 @@
+"""Test de charge du pool de connexions sur /transactions et /add.
+
+Compare le débit avec une connexion neuve par requête (DB_POOL_SIZE=0, ancien
+comportement) et avec le pool configuré (WAL, mmap, cache partagé entre requêtes).
+
+    python benchmarks/load_test_pool.py --rows 100000 --clients 8 --requests 200
+"""
+import argparse
+import os
+
+from common import hammer, load_app, seed_database, serve, temp_database
+import db_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requêtes par client')
+    args = parser.parse_args()
+
+    module = load_app('app')
+    app = module.app
+    path = seed_database(module, temp_database(), args.rows)
+    print(f"{'mode':>12} {'route':>14} {'req/s':>9}")
+    try:
+        for label, size in (('sans pool', 0), ('pool', db_pool.DEFAULT_POOL_SIZE)):
+            app.config['DB_POOL_SIZE'] = size
+            app.extensions['db_pool'] = None
+            with serve(app) as base:
+                for route, method, body in (('/transactions', 'GET', None),
+                                            ('/add', 'POST', 'description=Test&amount=-1.5&category=Bench')):
+                    rate, _ = hammer(base + route, args.requests, args.clients, method, body)
+                    print(f"{label:>12} {route:>14} {rate:>9.0f}")
+            pool = db_pool.get_pool(app)
+            if pool:
+                print(f"{'':>12} stats pool : {pool.stats()}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
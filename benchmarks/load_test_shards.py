@@ -0,0 +1,108 @@
+"""Test de charge des écritures : une seule base contre un fichier SQLite par locataire.
+
+Chaque client écrit pour son propre locataire. Avec une seule base, tous se
+disputent le même verrou d'écriture. Avec le routage par locataire, chacun
+écrit dans son shard.
+
+- Sans HTTP : commits durables (`--synchronous FULL`) via les pools du routeur.
+- Via HTTP : POST /add avec l'en-tête X-Tenant, sur le serveur local multi-thread.
+
+    python benchmarks/load_test_shards.py --tenants 1 4 16 --writes 200
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.request
+
+from common import load_app, seed_database, serve, temp_database
+import ledger
+import shards
+
+ROW = ('Test', -1.5, 'Bench', None)
+BODY = b'description=Test&amount=-1.5&category=Bench'
+
+
+def direct_writes(router, tenants, writes, synchronous, sharded):
+    """Chaque thread valide `writes` insertions une à une ; renvoie écritures/s"""
+    def client(tenant):
+        shard = router.shard(tenant if sharded else shards.DEFAULT_TENANT)
+        conn = shard.pool.acquire()
+        conn.execute(f'PRAGMA synchronous = {synchronous}')
+        for _ in range(writes):
+            conn.execute(ledger.INSERT_SQL.format(table='transactions'), ROW)
+            conn.commit()
+        shard.pool.release(conn)
+    return run_clients(client, tenants, writes)
+
+
+def http_writes(base, tenants, writes, sharded):
+    def client(tenant):
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if sharded:
+            headers[shards.TENANT_HEADER] = tenant
+        for _ in range(writes):
+            with urllib.request.urlopen(urllib.request.Request(base + '/add', data=BODY, headers=headers)) as r:
+                r.read()
+    return run_clients(client, tenants, writes)
+
+
+def run_clients(target, tenants, writes):
+    threads = [threading.Thread(target=target, args=(f'tenant{i}',)) for i in range(tenants)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return tenants * writes / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--tenants', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--writes', type=int, default=200, help='écritures par locataire')
+    parser.add_argument('--synchronous', default='FULL', choices=['NORMAL', 'FULL'])
+    args = parser.parse_args()
+
+    module = load_app('app')
+    app = module.app
+    path = seed_database(module, temp_database(), args.rows)
+    directory = tempfile.mkdtemp(prefix='budget-shards-')
+    app.config['SHARDS_DIR'] = directory
+    app.config['SHARD_POOL_SIZE'] = max(args.tenants)
+    router = shards.enable(app)
+    try:
+        print(f"Sans HTTP, synchronous = {args.synchronous}")
+        print(f"{'locataires':>10} {'une base (écr./s)':>18} {'shards (écr./s)':>16}")
+        for tenants in args.tenants:
+            single = direct_writes(router, tenants, args.writes, args.synchronous, sharded=False)
+            sharded = direct_writes(router, tenants, args.writes, args.synchronous, sharded=True)
+            print(f"{tenants:>10} {single:>18.0f} {sharded:>16.0f}")
+
+        print("\nPOST /add via HTTP")
+        print(f"{'locataires':>10} {'une base (req/s)':>17} {'shards (req/s)':>15}")
+        with serve(app) as base:
+            for tenants in args.tenants:
+                single = http_writes(base, tenants, args.writes, sharded=False)
+                sharded = http_writes(base, tenants, args.writes, sharded=True)
+                print(f"{tenants:>10} {single:>17.0f} {sharded:>15.0f}")
+
+        with app.app_context():
+            totals = module.global_totals(router)
+        print(f"\n{len(totals['tenants'])} locataires, {totals['count']} transactions au total")
+        for tenant in router.tenants():
+            conn = sqlite3.connect(router.database_for(tenant))
+            assert not ledger.verify_totals(conn), tenant
+            conn.close()
+    finally:
+        router.close()
+        shutil.rmtree(directory)
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
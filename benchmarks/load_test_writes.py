@@ -0,0 +1,109 @@
+"""Test de charge des écritures sur /add : commit par requête contre file write-behind à commit groupé.
+
+Mesure le débit et la latence de /add avec 1, 8 et 64 clients concurrents, d'abord
+avec l'insertion synchrone (un commit par requête), puis avec la file d'écriture
+différée (WRITE_BEHIND), et affiche la taille moyenne des lots validés.
+
+La seconde partie mesure le chemin d'écriture seul, sans HTTP, à durabilité égale
+(`--synchronous`) : un commit par écriture depuis chaque thread contre la file.
+
+    python benchmarks/load_test_writes.py --total 4000 --clients 1 8 64
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import threading
+import time
+
+from common import hammer, load_app, seed_database, serve, temp_database
+import db_pool
+import ledger
+import write_queue
+
+BODY = 'description=Test&amount=-1.5&category=Bench'
+ROW = ('Test', -1.5, 'Bench', None)
+
+
+def direct_writes(path, clients, per_client, synchronous):
+    """Chaque thread insère et valide ses lignes une à une sur sa propre connexion ; renvoie écritures/s"""
+    def client():
+        conn = db_pool.configure_connection(sqlite3.connect(path))
+        conn.execute(f'PRAGMA synchronous = {synchronous}')
+        for _ in range(per_client):
+            conn.execute(ledger.INSERT_SQL.format(table='transactions'), ROW)
+            conn.commit()
+        conn.close()
+    return run_threads(client, clients, per_client)
+
+
+def queued_writes(queue, clients, per_client):
+    def client():
+        for _ in range(per_client):
+            queue.write(ROW)
+    return run_threads(client, clients, per_client)
+
+
+def run_threads(target, clients, per_client):
+    threads = [threading.Thread(target=target) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * per_client / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--total', type=int, default=4000, help='requêtes par niveau de concurrence')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--max-batch', type=int, default=write_queue.DEFAULT_MAX_BATCH)
+    parser.add_argument('--max-latency-ms', type=float, default=write_queue.DEFAULT_MAX_LATENCY * 1000)
+    parser.add_argument('--synchronous', default=write_queue.DEFAULT_SYNCHRONOUS, choices=['NORMAL', 'FULL'])
+    args = parser.parse_args()
+
+    module = load_app('app')
+    app = module.app
+    app.config['WRITE_MAX_BATCH'] = args.max_batch
+    app.config['WRITE_MAX_LATENCY_MS'] = args.max_latency_ms
+    app.config['WRITE_SYNCHRONOUS'] = args.synchronous
+    path = seed_database(module, temp_database(), args.rows)
+    print(f"{'mode':>12} {'clients':>8} {'écritures/s':>12} {'p50 (ms)':>9} {'p99 (ms)':>9} {'lot moyen':>10}")
+    try:
+        for label, enabled in (('synchrone', False), ('write-behind', True)):
+            app.config['WRITE_BEHIND'] = enabled
+            with serve(app) as base:
+                for clients in args.clients:
+                    rate, latencies = hammer(base + '/add', max(1, args.total // clients), clients, 'POST', BODY)
+                    latencies.sort()
+                    queue = write_queue.get_queue(app)
+                    batch = queue.stats()['avg_batch'] if queue else 1
+                    print(f"{label:>12} {clients:>8} {rate:>12.0f} {statistics.median(latencies):>9.2f} "
+                          f"{latencies[int(0.99 * (len(latencies) - 1))]:>9.2f} {batch:>10}")
+            queue = write_queue.get_queue(app)
+            if queue:
+                print(f"{'':>12} stats file : {queue.stats()}")
+                queue.close()
+                app.extensions['write_queue'] = None
+
+        print(f"\nSans HTTP, synchronous = {args.synchronous}")
+        print(f"{'clients':>8} {'commit/écriture (écr./s)':>25} {'write-behind (écr./s)':>22} {'lot moyen':>10}")
+        for clients in args.clients:
+            per_client = max(1, args.total // clients)
+            direct = direct_writes(path, clients, per_client, args.synchronous)
+            queue = write_queue.WriteBehindQueue(path, args.max_batch, args.max_latency_ms / 1000,
+                                                 synchronous=args.synchronous)
+            queued = queued_writes(queue, clients, per_client)
+            queue.close()
+            print(f"{clients:>8} {direct:>25.0f} {queued:>22.0f} {queue.stats()['avg_batch']:>10}")
+        conn = sqlite3.connect(path)
+        assert not ledger.verify_totals(conn)
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
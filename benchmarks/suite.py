@@ -0,0 +1,260 @@
+"""Suite de benchmarks reproductible de toutes les routes, pour app.py et app-corrigé.py.
+
+Pour chaque appli (dans un processus dédié, pour isoler la mémoire) :
+
+1. crée une base synthétique de `--rows` transactions avec le schéma de l'appli ;
+2. appelle `/`, `/search`, `/calculate`, `/transactions` et `/add` via le client de
+   test Flask (coût de l'appli seule, sans réseau) ;
+3. sert l'appli sur un serveur HTTP local multi-thread et la charge avec
+   `--workers` processus de `--threads` clients chacun.
+
+Débit, latences p50/p95/p99, erreurs et pic de RSS sont écrits dans un fichier JSON.
+`compare` (ou `run --baseline`) confronte un résultat à une référence et sort en
+erreur si le débit baisse ou si la p95 monte de plus de `--threshold`.
+
+    python benchmarks/suite.py run --rows 100000 --output results.json
+    python benchmarks/suite.py run --baseline benchmarks/baseline.json
+    python benchmarks/suite.py compare results.json --baseline benchmarks/baseline.json
+    python benchmarks/suite.py seed --rows 100000 --database budget.db
+
+Le CSRF de app-corrigé.py est désactivé pendant la mesure (les formulaires WTForms
+sont toujours validés) : le générateur de charge ne gère pas de session.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from common import ROOT, load_app, seed_database, serve, temp_database
+
+APPS = ('app', 'corrige')
+DEFAULT_THRESHOLD = 0.15
+
+# (nom, méthode, chemin, formulaire) ; /add en dernier pour ne pas invalider le cache des autres pages
+ROUTES = [
+    ('index', 'GET', '/', None),
+    ('search', 'POST', '/search', {'query': 'courses'}),
+    ('calculate', 'POST', '/calculate', {'formula': '100 + 50 * 2'}),
+    ('transactions', 'GET', '/transactions', None),
+    ('add', 'POST', '/add', {'description': 'Bench', 'amount': '-1.5', 'category': 'Bench'}),
+]
+
+
+def summarize(latencies, elapsed, errors):
+    """Débit et percentiles (ms) d'une série de latences"""
+    ordered = sorted(latencies)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3) if ordered else None
+    return {'requests': len(ordered), 'errors': errors, 'rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+            'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99)}
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_test_client(app, requests):
+    client = app.test_client()
+    results = {}
+    for name, method, path, form in ROUTES:
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            response = client.open(path, method=method, data=form)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            errors += response.status_code >= 400
+        results[name] = summarize(latencies, time.perf_counter() - start, errors)
+    return results
+
+
+def http_client(port, method, path, form, requests, threads):
+    """Processus générateur de charge : `threads` clients enchaînant `requests` requêtes chacun"""
+    body = urlencode(form) if form else None
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+
+    def client(_):
+        latencies, errors = [], 0
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                errors += response.status >= 400
+            except OSError:
+                errors += 1
+            finally:
+                conn.close()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        return latencies, errors
+
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(client, range(threads)))
+    return [t for latencies, _ in results for t in latencies], sum(errors for _, errors in results)
+
+
+def run_http(app, requests, workers, threads):
+    results = {}
+    per_client = max(1, requests // (workers * threads))
+    with serve(app) as base, ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        port = int(base.rsplit(':', 1)[1])
+        for name, method, path, form in ROUTES:
+            start = time.perf_counter()
+            futures = [pool.submit(http_client, port, method, path, form, per_client, threads) for _ in range(workers)]
+            latencies, errors = [], 0
+            for future in futures:
+                worker_latencies, worker_errors = future.result()
+                latencies.extend(worker_latencies)
+                errors += worker_errors
+            results[name] = summarize(latencies, time.perf_counter() - start, errors)
+    return results
+
+
+def bench_app(name, options, output):
+    """Processus dédié à une appli : base synthétique, client de test puis charge HTTP"""
+    path = temp_database(f'suite-{name}-')
+    try:
+        module = load_app(name, database=path)
+        module.app.config['WTF_CSRF_ENABLED'] = False
+        start = time.perf_counter()
+        seed_database(module, path, options['rows'])
+        result = {'seed_seconds': round(time.perf_counter() - start, 2), 'rss_after_seed_mb': peak_rss_mb()}
+        result['test_client'] = run_test_client(module.app, options['requests'])
+        result['rss_after_test_client_mb'] = peak_rss_mb()
+        result['http'] = run_http(module.app, options['requests'], options['workers'], options['threads'])
+        result['peak_rss_mb'] = peak_rss_mb()
+        output.put((name, result))
+    except BaseException as e:
+        output.put((name, {'error': repr(e)}))
+        raise
+    finally:
+        os.remove(path)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    options = {'rows': args.rows, 'requests': args.requests, 'workers': args.workers, 'threads': args.threads}
+    report = {'meta': dict(options, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), revision=git_revision(),
+                           python=platform.python_version(), platform=platform.platform()),
+              'apps': {}}
+    context = multiprocessing.get_context('spawn')
+    for name in args.apps:
+        output = context.Queue()
+        process = context.Process(target=bench_app, args=(name, options, output))
+        process.start()
+        app_name, result = output.get()
+        process.join()
+        report['apps'][app_name] = result
+        print_app(app_name, result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✓ Résultats écrits dans {args.output}")
+    if args.baseline:
+        return compare_reports(report, load_report(args.baseline), args.threshold)
+    return 0
+
+
+def print_app(name, result):
+    if 'error' in result:
+        print(f"\n❌ {name} : {result['error']}")
+        return
+    print(f"\n{name} — base en {result['seed_seconds']} s, pic RSS {result['peak_rss_mb']} Mo")
+    print(f"{'mode':>12} {'route':>13} {'req/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'erreurs':>8}")
+    for mode in ('test_client', 'http'):
+        for route, stats in result[mode].items():
+            print(f"{mode:>12} {route:>13} {stats['rps']:>9} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                  f"{stats['p99_ms']:>9} {stats['errors']:>8}")
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_reports(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Affiche les écarts avec la référence ; renvoie 1 en cas de régression au-delà du seuil"""
+    regressions = []
+    print(f"\nComparaison avec la référence ({baseline['meta'].get('revision')}), seuil {threshold:.0%}")
+    print(f"{'appli':>8} {'mode':>12} {'route':>13} {'req/s':>16} {'p95 (ms)':>18}")
+    for app_name, result in current['apps'].items():
+        base = baseline['apps'].get(app_name)
+        if not base or 'error' in result or 'error' in base:
+            continue
+        for mode in ('test_client', 'http'):
+            for route, stats in result[mode].items():
+                ref = base.get(mode, {}).get(route)
+                if not ref:
+                    continue
+                rps_change = stats['rps'] / ref['rps'] - 1
+                p95_change = stats['p95_ms'] / ref['p95_ms'] - 1
+                flag = ''
+                if rps_change < -threshold or p95_change > threshold or stats['errors'] > ref['errors']:
+                    flag = '  ❌ régression'
+                    regressions.append((app_name, mode, route))
+                print(f"{app_name:>8} {mode:>12} {route:>13} {ref['rps']:>7} → {stats['rps']:<7} "
+                      f"{ref['p95_ms']:>8} → {stats['p95_ms']:<8}{flag}")
+    if regressions:
+        print(f"\n❌ {len(regressions)} régression(s) au-delà de {threshold:.0%}")
+        return 1
+    print("\n✓ Aucune régression")
+    return 0
+
+
+def seed(args):
+    module = load_app('app')
+    path = os.path.abspath(args.database)
+    seed_database(module, path, args.rows)
+    print(f"✓ {args.rows} transactions synthétiques ajoutées à {path}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='mesure les applis et écrit le JSON des résultats')
+    run_parser.add_argument('--apps', nargs='+', choices=APPS, default=list(APPS))
+    run_parser.add_argument('--rows', type=int, default=100_000)
+    run_parser.add_argument('--requests', type=int, default=1000, help='requêtes par route et par mode')
+    run_parser.add_argument('--workers', type=int, default=2, help='processus générateurs de charge')
+    run_parser.add_argument('--threads', type=int, default=4, help='clients par processus')
+    run_parser.add_argument('--output', default='benchmark-results.json')
+    run_parser.add_argument('--baseline', help='JSON de référence à comparer')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser('compare', help='compare un JSON de résultats à une référence')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('--baseline', required=True)
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    compare_parser.set_defaults(handler=lambda a: compare_reports(load_report(a.results), load_report(a.baseline),
+                                                                  a.threshold))
+
+    seed_parser = commands.add_parser('seed', help='ajoute des transactions synthétiques à une base (schéma de init_db)')
+    seed_parser.add_argument('--rows', type=int, default=100_000)
+    seed_parser.add_argument('--database', default=os.path.join(ROOT, 'budget.db'))
+    seed_parser.set_defaults(handler=seed)
+
+    args = parser.parse_args()
+    sys.exit(args.handler(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Pool de connexions SQLite partagé par les requêtes Flask.
+
+Chaque connexion est ouverte et configurée une seule fois (WAL, synchronous=NORMAL,
+mmap, cache, busy_timeout) puis réutilisée : on évite le coût de connexion, la
+relecture du schéma et on garde le cache de pages chaud d'une requête à l'autre.
+
+Une connexion n'est utilisée que par un thread à la fois : elle est empruntée au
+premier `get_connection()` d'une requête, rangée dans `g`, et rendue au pool par
+le hook `teardown_appcontext`. Le pool est borné ; au-delà, les requêtes attendent
+qu'une connexion se libère (`timeout`).
+"""
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -16000,  # en Kio, soit ~16 Mo par connexion
+    'busy_timeout': 5000,  # en ms
+}
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_TIMEOUT = 10.0
+
+
+class PoolTimeout(RuntimeError):
+    """Aucune connexion libre dans le délai imparti"""
+
+
+def configure_connection(conn):
+    """Applique les PRAGMA de performance à une connexion SQLite"""
+    for name, value in PRAGMAS.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+class ConnectionPool:
+    """Pool borné de connexions sqlite3 configurées, réutilisées en LIFO (la plus chaude d'abord)"""
+
+    def __init__(self, database, max_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, factory=sqlite3.Connection):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.factory = factory
+        self._idle = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self.closed = False
+        self._stats = {'created': 0, 'reused': 0, 'waits': 0, 'timeouts': 0, 'discarded': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        return configure_connection(conn)
+
+    def acquire(self):
+        with self._cond:
+            deadline = None
+            while not self._idle and self._size >= self.max_size:
+                if deadline is None:
+                    self._stats['waits'] += 1
+                    deadline = time.monotonic() + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f'aucune connexion libre après {self.timeout}s')
+                self._cond.wait(remaining)
+            if self._idle:
+                self._stats['reused'] += 1
+                return self._idle.pop()
+            self._size += 1
+            self._stats['created'] += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        """Rend une connexion au pool (une transaction laissée ouverte est annulée)"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._cond:
+                self._size -= 1
+                self._stats['discarded'] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            if self.closed:
+                # Pool fermé pendant l'emprunt (ex. shard évincé) : la connexion n'y retourne pas
+                conn.close()
+                self._size -= 1
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            for conn in self._idle:
+                conn.close()
+            self._size -= len(self._idle)
+            self._idle.clear()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, size=self._size, idle=len(self._idle),
+                        in_use=self._size - len(self._idle), max_size=self.max_size)
+
+
+def init_app(app):
+    """Crée le pool de l'application et enregistre la restitution des connexions en fin de requête"""
+    app.config.setdefault('DB_POOL_SIZE', DEFAULT_POOL_SIZE)
+    app.config.setdefault('DB_POOL_TIMEOUT', DEFAULT_TIMEOUT)
+    app.config.setdefault('DB_CONNECTION_FACTORY', None)
+    app.extensions['db_pool'] = None
+    app.teardown_appcontext(release_connection)
+
+
+def creation_lock(app, name):
+    """Verrou de création paresseuse de l'extension `name`, propre au processus
+
+    Créé au premier usage (setdefault est atomique), donc dans le worker après le
+    patch gevent ; `after_fork` doit le retirer pour que l'enfant ait le sien.
+    """
+    return app.extensions.setdefault(f'{name}_lock', threading.Lock())
+
+
+def get_pool(app=None):
+    """Pool de l'application, créé au premier usage ; None si le pool est désactivé (DB_POOL_SIZE = 0)"""
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+    if pool is not None and pool.database == app.config['DATABASE']:
+        return pool
+    # Un seul pool même si les premières requêtes arrivent ensemble : sinon le perdant et ses connexions
+    # vivraient hors de la borne DB_POOL_SIZE
+    with creation_lock(app, 'db_pool'):
+        pool = app.extensions.get('db_pool')
+        if pool is None or pool.database != app.config['DATABASE']:
+            if pool is not None:
+                pool.close()
+            pool = None
+            if app.config['DB_POOL_SIZE'] > 0:
+                pool = ConnectionPool(app.config['DATABASE'], app.config['DB_POOL_SIZE'],
+                                      app.config['DB_POOL_TIMEOUT'], connection_factory(app))
+            app.extensions['db_pool'] = pool
+    return pool
+
+
+def close_pool(app):
+    """Ferme les connexions inactives du pool (ex. dans le processus maître, avant le fork des workers)"""
+    pool = app.extensions.get('db_pool')
+    if pool is not None:
+        pool.close()
+        app.extensions['db_pool'] = None
+
+
+# Pools hérités d'un processus parent : gardés en vie pour que leurs connexions ne soient jamais
+# fermées dans l'enfant (la fermeture peut checkpointer ou supprimer le WAL du parent)
+_inherited = []
+
+
+def keep_inherited(obj):
+    """Garde en vie un objet hérité du parent qui détient des connexions SQLite"""
+    _inherited.append(obj)
+
+
+def after_fork(app):
+    """Dans un processus enfant (gunicorn post_fork) : écarte le pool hérité, un pool neuf sera créé à l'usage"""
+    pool = app.extensions.get('db_pool')
+    if pool is not None:
+        keep_inherited(pool)
+    app.extensions['db_pool'] = None
+    app.extensions.pop('db_pool_lock', None)
+
+
+def connection_factory(app):
+    """Classe des connexions (DB_CONNECTION_FACTORY, ex. metrics.InstrumentedConnection)"""
+    return app.config.get('DB_CONNECTION_FACTORY') or sqlite3.Connection
+
+
+def get_connection():
+    """Connexion de la requête courante, empruntée au pool au premier appel"""
+    if 'db_conn' not in g:
+        router = current_app.extensions.get('shard_router')
+        # Base du locataire de la requête si le routage par shard est actif (voir shards.py)
+        pool = router.current().pool if router is not None else get_pool()
+        if pool is None:
+            # Comportement historique : une connexion neuve par requête
+            g.db_conn = sqlite3.connect(current_app.config['DATABASE'], factory=connection_factory(current_app))
+            g.db_conn.row_factory = sqlite3.Row
+        else:
+            g.db_conn = pool.acquire()
+        g.db_pool = pool
+    return g.db_conn
+
+
+def extensions(app=None):
+    """Structures propres à une base (caches, index) : celles du shard de la requête, sinon celles de l'appli"""
+    app = app or current_app
+    router = app.extensions.get('shard_router')
+    return router.current().extensions if router is not None else app.extensions
+
+
+def release_connection(exc=None):
+    conn = g.pop('db_conn', None)
+    pool = g.pop('db_pool', None)
+    if conn is None:
+        return
+    if pool is None:
+        conn.close()
+    else:
+        pool.release(conn)
@@ -0,0 +1,111 @@
+"""Export en flux des transactions au format CSV ou JSONL, éventuellement compressé en gzip.
+
+Les lignes sont lues depuis un curseur SQLite par blocs de `arraysize` et chaque
+bloc est sérialisé puis émis aussitôt : la mémoire utilisée ne dépend pas de la
+taille du ledger.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import date
+
+FORMATS = ('csv', 'jsonl')
+COLUMNS = ('id', 'description', 'amount', 'category', 'booked_on')
+DEFAULT_ARRAYSIZE = 1000
+MIMETYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def parse_filters(args):
+    """Filtres d'export depuis une query string ou des options CLI (clés absentes ignorées)"""
+    filters = {}
+    if args.get('category'):
+        filters['category'] = args.get('category')
+    for key in ('min_id', 'max_id'):
+        value = args.get(key)
+        if value not in (None, ''):
+            try:
+                filters[key] = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f'{key} doit être un entier')
+    # Période par date de transaction (bornes incluses), servie par l'index (booked_on, amount)
+    for key in ('since', 'until'):
+        value = args.get(key)
+        if value not in (None, ''):
+            try:
+                filters[key] = date.fromisoformat(value).isoformat()
+            except (TypeError, ValueError):
+                raise ValueError(f'{key} doit être une date AAAA-MM-JJ')
+    return filters
+
+
+def build_query(filters, table='transactions'):
+    clauses, params = [], []
+    if 'category' in filters:
+        clauses.append('category = ?')
+        params.append(filters['category'])
+    if 'min_id' in filters:
+        clauses.append('id >= ?')
+        params.append(filters['min_id'])
+    if 'max_id' in filters:
+        clauses.append('id <= ?')
+        params.append(filters['max_id'])
+    if 'since' in filters:
+        clauses.append('booked_on >= ?')
+        params.append(filters['since'])
+    if 'until' in filters:
+        clauses.append('booked_on <= ?')
+        params.append(filters['until'])
+    sql = f'SELECT {", ".join(COLUMNS)} FROM "{table}"'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    return sql + ' ORDER BY id', params
+
+
+def _csv_chunk(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+
+def _jsonl_chunk(rows):
+    # Gabarit fixe : seules les chaînes passent par json.dumps, sans dict intermédiaire par ligne
+    dumps = json.dumps
+    return ''.join(
+        f'{{"id": {id_}, "description": {dumps(description, ensure_ascii=False)}, '
+        f'"amount": {dumps(amount)}, "category": {dumps(category, ensure_ascii=False)}, '
+        f'"booked_on": {dumps(booked_on)}}}\n'
+        for id_, description, amount, category, booked_on in rows
+    )
+
+
+def iter_export(conn, fmt='csv', filters=None, arraysize=DEFAULT_ARRAYSIZE, table='transactions'):
+    """Génère le contenu de l'export, un morceau de texte par bloc de `arraysize` lignes"""
+    if fmt not in FORMATS:
+        raise ValueError(f"format inconnu {fmt!r} (attendu : {', '.join(FORMATS)})")
+    sql, params = build_query(filters or {}, table)
+    cursor = conn.cursor()
+    cursor.row_factory = None  # tuples bruts, sans objet Row par ligne
+    cursor.arraysize = arraysize
+    cursor.execute(sql, params)
+
+    if fmt == 'csv':
+        yield _csv_chunk([COLUMNS])
+        serialize = _csv_chunk
+    else:
+        serialize = _jsonl_chunk
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield serialize(rows)
+
+
+def gzip_chunks(chunks, level=6, encoding='utf-8'):
+    """Compresse un flux de morceaux de texte au format gzip, à la volée"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,432 @@
+"""Moteur de formules de la calculatrice : analyse une fois, compile en fermetures, met en cache.
+
+Grammaire autorisée : nombres, + - * / **, moins et plus unaires, parenthèses
+(celle de safe_eval), plus :
+
+- les agrégats d'une catégorie du ledger : `sum(Alimentation)`, `count(...)`,
+  `avg(...)`, `min(...)`, `max(...)` (nom entre guillemets s'il contient des
+  espaces) ;
+- la variable `amount`, montant de la transaction courante en évaluation par lot.
+
+La formule est découpée en jetons, analysée par descente récursive puis compilée
+en une fermeture Python (les sous-expressions constantes sont calculées à la
+compilation). Les formules compilées sont gardées dans un cache LRU indexé par le
+texte normalisé. `evaluate_batch()` applique une formule à toute une colonne de
+montants en une passe par opérateur (NumPy si installé, sinon module `array`).
+NumPy n'est importé qu'au premier lot, pour ne pas alourdir le démarrage.
+
+Limites : longueur du texte, nombre de nœuds, profondeur d'imbrication, exposant
+et ordre de grandeur des opérandes et résultats. Tous les calculs se font en
+flottants, donc chaque opération coûte O(1) : le temps d'évaluation est borné par
+le nombre de nœuds, et `9**9**9` est refusé avant d'être calculé.
+"""
+import math
+import operator
+import re
+from array import array
+from functools import lru_cache
+from itertools import repeat
+
+MAX_LENGTH = 500
+MAX_NODES = 200
+MAX_DEPTH = 50
+MAX_EXPONENT = 100
+MAX_MAGNITUDE = 1e15
+CACHE_SIZE = 1024
+
+TOKEN_RE = re.compile(
+    r'\s*(?:(\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)'  # nombre
+    r'|(\*\*|[-+*/(),])'                                              # opérateur
+    r'|([^\W\d]\w*)'                                                   # identifiant
+    r'|"([^"]*)"|\'([^\']*)\')'                                         # chaîne
+)
+
+AGGREGATES = ('sum', 'count', 'avg', 'min', 'max')
+ROW_VARIABLE = 'amount'
+
+
+class FormulaError(ValueError):
+    """Formule invalide, non autorisée ou hors limites"""
+
+
+def normalize(text):
+    """Clé de cache : la formule sans espaces hors chaînes"""
+    if '"' in text or "'" in text:
+        return text.strip()
+    return ''.join(text.split())
+
+
+def tokenize(text):
+    if len(text) > MAX_LENGTH:
+        raise FormulaError(f'Formule trop longue (max {MAX_LENGTH} caractères).')
+    tokens, pos, end = [], 0, len(text.rstrip())
+    while pos < end:
+        match = TOKEN_RE.match(text, pos)
+        if not match:
+            raise FormulaError(f'Caractère non autorisé à la position {pos + 1}.')
+        number, op, name, dquoted, squoted = match.groups()
+        if number is not None:
+            tokens.append(('num', float(number)))
+        elif op is not None:
+            tokens.append(('op', op))
+        elif name is not None:
+            tokens.append(('name', name))
+        else:
+            tokens.append(('str', dquoted if dquoted is not None else squoted))
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    """Descente récursive avec les priorités de Python : ** (associatif à droite) > unaires > * / > + -"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.nodes = 0
+        self.depth = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise FormulaError('Formule vide.')
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise FormulaError('Formule invalide ou dangereuse.')
+        return node
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take_op(self, *ops):
+        kind, value = self.peek()
+        if kind == 'op' and value in ops:
+            self.pos += 1
+            return value
+        return None
+
+    def node(self, *node):
+        self.nodes += 1
+        if self.nodes > MAX_NODES:
+            raise FormulaError(f'Formule trop complexe (max {MAX_NODES} éléments).')
+        return node
+
+    def expr(self):
+        node = self.term()
+        while (op := self.take_op('+', '-')):
+            node = self.node('bin', op, node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while (op := self.take_op('*', '/')):
+            node = self.node('bin', op, node, self.unary())
+        return node
+
+    def unary(self):
+        op = self.take_op('+', '-')
+        if op:
+            self.enter()
+            node = self.node('neg' if op == '-' else 'pos', self.unary())
+            self.depth -= 1
+            return node
+        return self.power()
+
+    def power(self):
+        node = self.atom()
+        if self.take_op('**'):
+            self.enter()
+            node = self.node('bin', '**', node, self.unary())
+            self.depth -= 1
+        return node
+
+    def atom(self):
+        kind, value = self.peek()
+        if kind == 'num':
+            self.pos += 1
+            return self.node('num', value)
+        if kind == 'name':
+            self.pos += 1
+            if value == ROW_VARIABLE:
+                return self.node('var', value)
+            if value in AGGREGATES and self.take_op('('):
+                arg_kind, category = self.peek()
+                if arg_kind not in ('name', 'str') or self.tokens[self.pos + 1:self.pos + 2] != [('op', ')')]:
+                    raise FormulaError(f'{value}() attend un nom de catégorie.')
+                self.pos += 2
+                return self.node('agg', value, category)
+            raise FormulaError(f'Nom inconnu : {value}.')
+        if self.take_op('('):
+            self.enter()
+            node = self.expr()
+            self.depth -= 1
+            if not self.take_op(')'):
+                raise FormulaError('Parenthèse fermante manquante.')
+            return node
+        raise FormulaError('Formule invalide ou dangereuse.')
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise FormulaError(f'Formule trop imbriquée (max {MAX_DEPTH} niveaux).')
+
+
+def check_magnitude(value):
+    if not math.isfinite(value) or abs(value) > MAX_MAGNITUDE:
+        raise FormulaError('Résultat hors limites.')
+    return value
+
+
+def _add(a, b):
+    return check_magnitude(a + b)
+
+
+def _sub(a, b):
+    return check_magnitude(a - b)
+
+
+def _mul(a, b):
+    return check_magnitude(a * b)
+
+
+def _div(a, b):
+    if b == 0:
+        raise FormulaError('Division par zéro.')
+    return check_magnitude(a / b)
+
+
+def _pow(a, b):
+    if abs(b) > MAX_EXPONENT:
+        raise FormulaError(f'Exposant trop grand (max {MAX_EXPONENT}).')
+    if a == 0 and b < 0:
+        raise FormulaError('Division par zéro.')
+    if a < 0 and not b.is_integer():
+        raise FormulaError('Puissance non réelle.')
+    # Refus avant calcul si le résultat dépasse l'ordre de grandeur autorisé
+    if a and b * math.log10(abs(a)) > math.log10(MAX_MAGNITUDE):
+        raise FormulaError('Résultat hors limites.')
+    return check_magnitude(a ** b)
+
+
+BINARY = {'+': _add, '-': _sub, '*': _mul, '/': _div, '**': _pow}
+
+
+class Bindings:
+    """Valeurs liées aux noms d'une formule : agrégats par catégorie et montant courant"""
+
+    def __init__(self, categories=None, amount=None):
+        self.categories = categories or {}
+        self.amount = amount
+
+    def aggregate(self, func, category):
+        totals = self.categories.get(category)
+        if totals is None:
+            raise FormulaError(f'Catégorie inconnue : {category}.')
+        if func == 'sum':
+            return float(totals['total'])
+        if func == 'avg':
+            return totals['total'] / totals['count']
+        return float(totals[func])
+
+    def row_amount(self):
+        if self.amount is None:
+            raise FormulaError('`amount` n\'est disponible qu\'en évaluation par transaction.')
+        return self.amount
+
+
+def _compile(node):
+    """Transforme l'arbre en fermeture f(bindings) ; renvoie (fermeture, constante ou None)"""
+    kind = node[0]
+    if kind == 'num':
+        value = check_magnitude(node[1])
+        return (lambda b: value), value
+    if kind == 'var':
+        return (lambda b: b.row_amount()), None
+    if kind == 'agg':
+        _, func, category = node
+        return (lambda b: b.aggregate(func, category)), None
+    if kind in ('neg', 'pos'):
+        operand, const = _compile(node[1])
+        if const is not None:
+            value = -const if kind == 'neg' else const
+            return (lambda b: value), value
+        if kind == 'pos':
+            return operand, None
+        return (lambda b: -operand(b)), None
+    _, op, left, right = node
+    fn = BINARY[op]
+    left, left_const = _compile(left)
+    right, right_const = _compile(right)
+    if left_const is not None and right_const is not None:
+        value = fn(left_const, right_const)
+        return (lambda b: value), value
+    return (lambda b: fn(left(b), right(b))), None
+
+
+def _walk(node):
+    yield node
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            yield from _walk(child)
+
+
+class CompiledFormula:
+    """Formule analysée et compilée ; s'appelle avec des Bindings"""
+
+    def __init__(self, text):
+        self.text = text
+        self.tree = _Parser(tokenize(text)).parse()
+        self.fn, self.constant = _compile(self.tree)
+        kinds = {node[0] for node in _walk(self.tree)}
+        self.uses_aggregates = 'agg' in kinds
+        self.uses_amount = 'var' in kinds
+
+    def __call__(self, bindings=None):
+        return self.fn(bindings or Bindings())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile_normalized(text):
+    return CompiledFormula(text)
+
+
+def compile_formula(text):
+    """Formule compilée (mise en cache)"""
+    return _compile_normalized(normalize(text))
+
+
+def format_result(value):
+    """Affiche les résultats entiers sans décimale (`15` plutôt que `15.0`)"""
+    return int(value) if value.is_integer() else value
+
+
+def evaluate(text, categories=None):
+    """Évalue une formule ; `categories` fournit les agrégats ({catégorie: {total, count, min, max}}).
+
+    Lève FormulaError si la formule est invalide ou hors limites.
+    """
+    return format_result(compile_formula(text)(Bindings(categories)))
+
+
+# --- Évaluation par lot : une passe par opérateur sur toute la colonne ---
+
+def _check_column(values):
+    # Bornes par max()/min() ; NaN et infinis se propagent dans sum() (passes en C)
+    if len(values) and (max(values) > MAX_MAGNITUDE or min(values) < -MAX_MAGNITUDE
+                        or not math.isfinite(sum(values))):
+        raise FormulaError('Résultat hors limites.')
+    return values
+
+
+def _array_binary(op, left, right, size):
+    """Opérateur binaire sur des colonnes array('d') et/ou des scalaires, via map() en C"""
+    left_col, right_col = not isinstance(left, float), not isinstance(right, float)
+    if not left_col and not right_col:
+        return BINARY[op](left, right)
+    if op == '/' and (0.0 in right if right_col else right == 0):
+        raise FormulaError('Division par zéro.')
+    if op == '**':
+        exponents = right if right_col else (right,)
+        # Colonne vide : rien à borner, le résultat est une colonne vide
+        if len(exponents) and max(map(abs, exponents)) > MAX_EXPONENT:
+            raise FormulaError(f'Exposant trop grand (max {MAX_EXPONENT}).')
+        return array('d', map(_pow, left if left_col else repeat(left, size), right if right_col else repeat(right, size)))
+    fn = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}[op]
+    try:
+        result = array('d', map(fn, left if left_col else repeat(left, size), right if right_col else repeat(right, size)))
+    except OverflowError:
+        raise FormulaError('Résultat hors limites.')
+    return _check_column(result)
+
+
+@lru_cache(maxsize=None)
+def numpy_module():
+    """NumPy, importé au premier appel ; None s'il n'est pas installé"""
+    try:
+        import numpy
+    except ImportError:  # dépendance optionnelle : repli sur le module array
+        return None
+    return numpy
+
+
+def _numpy_binary(op, left, right, size):
+    numpy = numpy_module()
+    if isinstance(left, float) and isinstance(right, float):
+        return BINARY[op](left, right)
+    if op == '/' and numpy.any(numpy.asarray(right) == 0):
+        raise FormulaError('Division par zéro.')
+    if op == '**':
+        if numpy.size(right) and numpy.max(numpy.abs(right)) > MAX_EXPONENT:
+            raise FormulaError(f'Exposant trop grand (max {MAX_EXPONENT}).')
+        if numpy.any((numpy.asarray(left) < 0) & (numpy.asarray(right) % 1 != 0)):
+            raise FormulaError('Puissance non réelle.')
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        result = {'+': numpy.add, '-': numpy.subtract, '*': numpy.multiply,
+                  '/': numpy.true_divide, '**': numpy.power}[op](left, right)
+    if result.size and (not numpy.all(numpy.isfinite(result)) or numpy.max(numpy.abs(result)) > MAX_MAGNITUDE):
+        raise FormulaError('Résultat hors limites.')
+    return result
+
+
+def _eval_column(node, column, bindings, binary):
+    kind = node[0]
+    if kind == 'num':
+        return node[1]
+    if kind == 'var':
+        return column
+    if kind == 'agg':
+        return bindings.aggregate(node[1], node[2])
+    if kind == 'pos':
+        return _eval_column(node[1], column, bindings, binary)
+    if kind == 'neg':
+        value = _eval_column(node[1], column, bindings, binary)
+        if isinstance(value, float):
+            return -value
+        return -value if binary is _numpy_binary else array('d', map(operator.neg, value))
+    _, op, left, right = node
+    return binary(op, _eval_column(left, column, bindings, binary),
+                  _eval_column(right, column, bindings, binary), len(column))
+
+
+def evaluate_batch(text, amounts, categories=None, backend=None):
+    """Applique la formule à chaque montant de `amounts` ; renvoie une colonne de résultats.
+
+    `backend` vaut 'numpy' ou 'array' (par défaut NumPy s'il est installé). Les
+    agrégats sont résolus une fois pour tout le lot.
+    """
+    compiled = compile_formula(text)
+    numpy = numpy_module()
+    backend = backend or ('numpy' if numpy is not None else 'array')
+    if backend == 'numpy':
+        if numpy is None:
+            raise RuntimeError('NumPy n\'est pas installé')
+        column, binary = numpy.asarray(amounts, dtype=float), _numpy_binary
+        if column.size and (not numpy.all(numpy.isfinite(column)) or numpy.max(numpy.abs(column)) > MAX_MAGNITUDE):
+            raise FormulaError('Montant hors limites.')
+    else:
+        column = amounts if isinstance(amounts, array) and amounts.typecode == 'd' else array('d', amounts)
+        _check_column(column)
+        binary = _array_binary
+    result = _eval_column(compiled.tree, column, Bindings(categories), binary)
+    if isinstance(result, float):
+        # Formule sans `amount` : même valeur pour toutes les lignes
+        return numpy.full(len(column), result) if backend == 'numpy' else array('d', repeat(result, len(column)))
+    return result
+
+
+def summarize_column(results):
+    """(somme, min, max) d'une colonne de résultats, en float ; min et max à None si elle est vide"""
+    if not len(results):
+        return 0.0, None, None
+    numpy = numpy_module()
+    if numpy is not None and isinstance(results, numpy.ndarray):
+        # Réductions NumPy : une passe en C, sans scalaire Python par élément
+        return float(results.sum()), float(results.min()), float(results.max())
+    return float(sum(results)), float(min(results)), float(max(results))
+
+
+def cache_info():
+    return _compile_normalized.cache_info()
+
+
+def cache_clear():
+    _compile_normalized.cache_clear()
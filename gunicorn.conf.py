@@ -0,0 +1,54 @@
+"""Configuration gunicorn de production, lue automatiquement depuis ce dossier.
+
+    gunicorn wsgi:app                                   # app.py
+    BUDGET_APP=corrige gunicorn wsgi:app                # app-corrigé.py
+    BUDGET_WORKER_CLASS=gevent gunicorn wsgi:app        # workers asynchrones (paquet gevent requis)
+
+Modèle de processus :
+
+- L'application est importée une fois dans le maître (`preload_app`), puis les
+  workers sont forkés : démarrage plus rapide, mémoire partagée en copie sur
+  écriture (dont le cache du ledger si BUDGET_WARMUP=1).
+- Le maître applique les migrations avant le fork (`when_ready`) et ferme ses
+  connexions. Chaque worker ouvre les siennes dans `post_fork` : aucun handle
+  SQLite n'est partagé de part et d'autre d'un fork.
+- Nombre de workers : 2 × cœurs + 1 par défaut (BUDGET_WORKERS).
+- Classe de worker (BUDGET_WORKER_CLASS) :
+  - `gthread` par défaut : BUDGET_THREADS threads par worker, à garder sous
+    DB_POOL_SIZE (8).
+  - `sync` : une requête à la fois par worker.
+  - `gevent` : beaucoup de connexions lentes ou longues. Les appels SQLite
+    restent bloquants pour la boucle d'événements.
+
+Rechargement sans coupure :
+
+- `kill -HUP <maître>` relance les workers un à un avec la configuration relue.
+- Avec `preload_app`, le code n'est pas relu par HUP. Pour une nouvelle
+  version, passer par USR2 (nouveau maître), puis WINCH et QUIT sur l'ancien.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BUDGET_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('BUDGET_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.environ.get('BUDGET_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('BUDGET_THREADS', 4))
+worker_connections = int(os.environ.get('BUDGET_WORKER_CONNECTIONS', 1000))
+preload_app = True
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+# Recyclage des workers après N requêtes (0 : jamais), décalé pour ne pas les relancer tous ensemble
+max_requests = int(os.environ.get('BUDGET_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    import wsgi
+    wsgi.module.prepare_server(wsgi.app)
+
+
+def post_fork(server, worker):
+    import wsgi
+    wsgi.module.init_worker(wsgi.app)
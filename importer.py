@@ -0,0 +1,175 @@
+"""Import en masse de transactions depuis un flux CSV ou JSONL.
+
+Le fichier est lu ligne à ligne (jamais chargé entièrement en mémoire), chaque
+ligne est validée avec les mêmes règles que `TransactionForm` (app-corrigé.py),
+puis les lignes valides sont insérées par lots avec `ledger.bulk_insert`
+(`executemany` et mise à jour ensembliste des agrégats et de l'index), un commit
+par lot. Le rapport renvoyé donne le nombre de lignes acceptées et rejetées ainsi
+qu'un échantillon des erreurs.
+"""
+import codecs
+import csv
+import json
+import math
+from datetime import date
+
+import ledger
+
+# Règles de TransactionForm
+DESCRIPTION_MAX_LENGTH = 100
+CATEGORY_MAX_LENGTH = 50
+
+DEFAULT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+FORMATS = ('csv', 'jsonl')
+
+
+def validate_row(description, amount, category, booked_on=None):
+    """Valide une transaction ; renvoie (description, montant, catégorie, date) ou lève ValueError
+
+    La date (AAAA-MM-JJ) est facultative : absente, la base prend la date du jour.
+    """
+    if not isinstance(description, str) or not description.strip():
+        raise ValueError('description requise')
+    if len(description) > DESCRIPTION_MAX_LENGTH:
+        raise ValueError(f'description trop longue (max {DESCRIPTION_MAX_LENGTH})')
+    if not isinstance(category, str) or not category.strip():
+        raise ValueError('catégorie requise')
+    if len(category) > CATEGORY_MAX_LENGTH:
+        raise ValueError(f'catégorie trop longue (max {CATEGORY_MAX_LENGTH})')
+    if isinstance(amount, bool):
+        raise ValueError('montant invalide')
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError('montant invalide')
+    # DataRequired refuse 0 ; NaN et infini ne sont pas des montants
+    if not amount or not math.isfinite(amount):
+        raise ValueError('montant requis')
+    if booked_on in (None, ''):
+        booked_on = None
+    else:
+        try:
+            booked_on = date.fromisoformat(booked_on).isoformat()
+        except (TypeError, ValueError):
+            raise ValueError('date invalide (attendu AAAA-MM-JJ)')
+    return description, amount, category, booked_on
+
+
+def text_lines(stream, encoding='utf-8-sig'):
+    """Décode un flux binaire en lignes de texte, par morceaux"""
+    return codecs.iterdecode(stream, encoding)
+
+
+def parse_csv(lines):
+    """(numéro de ligne, (description, montant, catégorie, date)) pour chaque ligne d'un CSV avec en-tête ;
+    la colonne `booked_on` est facultative, les champs valent None si la ligne est mal formée"""
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [name.strip().lower() for name in header]
+    try:
+        i_desc, i_amount, i_cat = (columns.index(name) for name in ('description', 'amount', 'category'))
+    except ValueError:
+        raise ValueError("en-tête CSV attendu : description, amount, category")
+    i_date = columns.index('booked_on') if 'booked_on' in columns else None
+    width = max(i_desc, i_amount, i_cat, -1 if i_date is None else i_date)
+    for row in reader:
+        if len(row) <= width:
+            if row:
+                yield reader.line_num, None
+            continue
+        yield reader.line_num, (row[i_desc], row[i_amount], row[i_cat],
+                                None if i_date is None else row[i_date])
+
+
+def parse_jsonl(lines):
+    """(numéro de ligne, (description, montant, catégorie, date)) pour chaque objet JSON d'un flux JSONL"""
+    loads = json.loads
+    for line_no, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = loads(line)
+            fields = (record.get('description'), record.get('amount'), record.get('category'),
+                      record.get('booked_on'))
+        except (ValueError, AttributeError):
+            fields = None
+        yield line_no, fields
+
+
+def parse(stream, fmt):
+    if fmt not in FORMATS:
+        raise ValueError(f"format inconnu {fmt!r} (attendu : {', '.join(FORMATS)})")
+    lines = text_lines(stream)
+    return parse_csv(lines) if fmt == 'csv' else parse_jsonl(lines)
+
+
+def guess_format(filename=None, mimetype=None):
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        return 'jsonl'
+    return 'csv'
+
+
+def import_records(conn, records, batch_size=DEFAULT_BATCH_SIZE, table='transactions', index=None,
+                   skip_duplicates=False):
+    """Valide et insère les enregistrements par lots ; renvoie le rapport d'import
+
+    Avec un index `ingest.IngestIndex`, une ligne sans catégorie reçoit la catégorie
+    suggérée et chaque lot est comparé aux transactions déjà enregistrées : les
+    doublons probables sont comptés (et écartés si `skip_duplicates`).
+    """
+    report = {'accepted': 0, 'rejected': 0, 'batches': 0, 'errors': []}
+    if index is not None:
+        report.update(categorized=0, duplicates=0, skipped=0, duplicate_lines=[])
+    batch, lines = [], []
+    for line_no, fields in records:
+        try:
+            if fields is None:
+                raise ValueError('ligne mal formée')
+            if index is not None and not fields[2] and isinstance(fields[0], str):
+                suggested, _ = index.suggest_category(fields[0])
+                if suggested:
+                    fields = (fields[0], fields[1], suggested, fields[3])
+                    report['categorized'] += 1
+            batch.append(validate_row(*fields))
+            lines.append(line_no)
+        except ValueError as e:
+            report['rejected'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line_no, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            _flush(conn, batch, lines, report, table, index, skip_duplicates)
+            batch, lines = [], []
+    if batch:
+        _flush(conn, batch, lines, report, table, index, skip_duplicates)
+    return report
+
+
+def _flush(conn, batch, lines, report, table, index=None, skip_duplicates=False):
+    if index is not None:
+        # Index rattrapé sur les lots précédents : seules leurs lignes sont lues
+        duplicates = index.sync(conn).check(batch)
+        for line_no, duplicate_of in zip(lines, duplicates):
+            if duplicate_of is not None:
+                report['duplicates'] += 1
+                if len(report['duplicate_lines']) < MAX_REPORTED_ERRORS:
+                    report['duplicate_lines'].append({'line': line_no, 'duplicate_of': duplicate_of})
+        if skip_duplicates:
+            kept = [row for row, duplicate_of in zip(batch, duplicates) if duplicate_of is None]
+            report['skipped'] += len(batch) - len(kept)
+            batch = kept
+    if batch:
+        ledger.bulk_insert(conn, batch, table)
+    report['accepted'] += len(batch)
+    report['batches'] += 1
+
+
+def import_stream(conn, stream, fmt, batch_size=DEFAULT_BATCH_SIZE, table='transactions', index=None,
+                  skip_duplicates=False):
+    """Importe un flux binaire CSV ou JSONL dans la table des transactions"""
+    return import_records(conn, parse(stream, fmt), batch_size, table, index, skip_duplicates)
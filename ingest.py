@@ -0,0 +1,178 @@
+"""Contrôle des transactions entrantes : catégorie suggérée et doublons probables.
+
+Deux index en mémoire, construits une fois depuis la table des transactions puis
+tenus à jour comme `suggest` (seules les lignes d'id supérieur au dernier id
+indexé sont lues ; une modification ou une suppression provoque une
+reconstruction) :
+
+- fréquences mot → catégorie : chaque mot normalisé d'une description (sans
+  accents ni casse, nombres exclus) compte les catégories des lignes où il
+  apparaît. La catégorie suggérée est celle qui cumule le plus de votes,
+  chaque mot votant selon la répartition de ses catégories ;
+- empreintes des doublons : hachage de (description normalisée, montant en
+  centimes, jour) → id de la première ligne et nombre de lignes identiques.
+
+Une ligne entrante coûte quelques accès à des dictionnaires, quelle que soit la
+taille du ledger : l'import de gros fichiers vérifie chaque lot avant de
+l'insérer. Dans un même lot, N lignes identiques ne sont des doublons que si la
+base en contient déjà N (deux cafés le même jour restent possibles). Les mois
+déplacés dans l'archive ne sont plus indexés.
+"""
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from flask import current_app
+
+import db_pool
+import ledger_cache
+import search_index
+from suggest import normalize
+
+BUILD_BATCH_SIZE = 10_000
+MIN_WORD_LENGTH = 2
+
+
+def tokens(text):
+    """Mots normalisés d'une description, dans l'ordre"""
+    # Normalisation mot par mot : le vocabulaire est réduit, le cache LRU de `normalize` sert presque toujours
+    return [normalize(word) for word in search_index.TOKEN_RE.findall(text or '')]
+
+
+def category_words(words):
+    """Mots utilisés pour classer (nombres et mots d'une lettre exclus)"""
+    return {word for word in words if len(word) >= MIN_WORD_LENGTH and not word.isdigit()}
+
+
+def fingerprint(words, amount, booked_on=None):
+    """Empreinte d'une transaction : description normalisée, montant au centime et jour (aujourd'hui si absent)"""
+    day = booked_on or datetime.now(timezone.utc).date().isoformat()
+    return hash((' '.join(words), round(amount * 100), day))
+
+
+class IngestIndex:
+    """Index des catégories par mot et des empreintes d'une table, rafraîchi d'après la version du ledger"""
+
+    def __init__(self, table='transactions'):
+        self.table = table
+        self._state = None
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.word_categories = defaultdict(Counter)
+        self.word_totals = Counter()
+        self.categories = {}
+        self.first_ids = {}
+        self.repeats = Counter()
+        self._last_id = 0
+
+    def sync(self, conn):
+        """Indexe les transactions ajoutées depuis le dernier accès ; renvoie l'index"""
+        if ledger_cache.read_state(conn) != self._state:
+            with self._lock, ledger_cache.read_snapshot(conn):
+                state = ledger_cache.read_state(conn)
+                if state != self._state:
+                    if self._state is None or state[2] != self._state[2]:
+                        self._reset()
+                    self._index_rows(conn)
+                    self._state = state
+        return self
+
+    def _index_rows(self, conn):
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'SELECT id, description, amount, category, booked_on FROM "{self.table}" '
+                       'WHERE id > ? ORDER BY id', (self._last_id,))
+        word_categories, word_totals = self.word_categories, self.word_totals
+        first_ids, repeats, categories = self.first_ids, self.repeats, self.categories
+        while True:
+            rows = cursor.fetchmany(BUILD_BATCH_SIZE)
+            if not rows:
+                break
+            for id_, description, amount, category, booked_on in rows:
+                words = tokens(description)
+                key = fingerprint(words, amount, booked_on)
+                if key in first_ids:
+                    repeats[key] += 1
+                else:
+                    first_ids[key] = id_
+                if not category:
+                    continue
+                # Orthographe de référence d'une catégorie (la première rencontrée) : « loisirs » vote pour « Loisirs »
+                category = categories.setdefault(normalize(category), category)
+                for word in category_words(words):
+                    word_categories[word][category] += 1
+                    word_totals[word] += 1
+            self._last_id = rows[-1][0]
+        cursor.close()
+
+    @property
+    def version(self):
+        return self._state and self._state[0]
+
+    def suggest_category(self, description):
+        """(catégorie, confiance entre 0 et 1) d'après les mots de la description ; (None, 0.0) si aucun n'est connu"""
+        scores = Counter()
+        known = 0
+        with self._lock:
+            for word in category_words(tokens(description)):
+                total = self.word_totals.get(word)
+                if not total:
+                    continue
+                known += 1
+                for category, count in self.word_categories[word].items():
+                    scores[category] += count / total
+        if not known:
+            return None, 0.0
+        category, score = scores.most_common(1)[0]
+        return category, round(score / known, 3)
+
+    def canonical_category(self, category):
+        """Orthographe déjà utilisée d'une catégorie saisie librement (casse et accents ignorés)"""
+        return self.categories.get(normalize(category), category)
+
+    def find_duplicate(self, description, amount, booked_on=None):
+        """Id d'une transaction identique déjà enregistrée (même description normalisée, montant et jour), sinon None"""
+        return self.first_ids.get(fingerprint(tokens(description), amount, booked_on))
+
+    def check(self, rows):
+        """Pour chaque (description, montant, catégorie, date) d'un lot : id du doublon probable ou None"""
+        used = Counter()
+        results = []
+        with self._lock:
+            first_ids, repeats = self.first_ids, self.repeats
+            for description, amount, _, booked_on in rows:
+                key = fingerprint(tokens(description), amount, booked_on)
+                duplicate_of = first_ids.get(key)
+                if duplicate_of is not None:
+                    if used[key] > repeats[key]:
+                        duplicate_of = None
+                    used[key] += 1
+                results.append(duplicate_of)
+        return results
+
+    def stats(self):
+        return {'words': len(self.word_totals), 'categories': len(self.categories),
+                'fingerprints': len(self.first_ids), 'last_id': self._last_id, 'version': self.version}
+
+
+def init_app(app, table='transactions'):
+    """Déclare l'index de contrôle des transactions entrantes de l'application"""
+    app.config.setdefault('INGEST_TABLE', table)
+    app.extensions['ingest'] = None
+
+
+def get_index(conn, app=None):
+    """Index de l'application, construit au premier usage puis synchronisé avec la base"""
+    app = app or current_app
+    # Un index par base : par shard si le routage par locataire est actif
+    store = db_pool.extensions(app)
+    index = store.get('ingest')
+    database = app.config.get('DATABASE') or app.config.get('SQLALCHEMY_DATABASE_URI')
+    if index is None or index.database != database:
+        index = IngestIndex(app.config['INGEST_TABLE'])
+        index.database = database
+        store['ingest'] = index
+    return index.sync(conn)
+
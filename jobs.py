@@ -0,0 +1,363 @@
+"""Tâches de fond : file SQLite (`jobs`) et worker multi-processus, hors des requêtes HTTP.
+
+- Une route enregistre la tâche (`submit`) et répond aussitôt ; l'état et
+  l'avancement se lisent ensuite dans la table (`get`).
+- Le worker (`flask jobs-worker`) réserve les tâches une à une (UPDATE …
+  RETURNING, atomique) et les exécute avec un `ProcessPoolExecutor`.
+- Les parcours complets du ledger sont découpés en tranches d'ids contiguës.
+  Chaque processus lit sa tranche sur sa propre connexion en lecture seule et
+  renvoie des totaux partiels, fusionnés dans le worker. L'avancement est
+  compté en tranches terminées.
+- Un parcours en tranches n'est pas un instantané unique. La vérification
+  compare l'état du ledger avant et après, et recommence s'il a changé. La
+  reconstruction garde le verrou d'écriture pendant le parcours : les lecteurs
+  WAL voient alors tous la même base.
+- Une tâche restée `running` alors que son worker a disparu est remise en
+  file au démarrage du worker suivant.
+- Avec le routage par locataire, chaque shard a sa propre file (la route
+  /jobs écrit dans la base de la requête) ; le worker les relève toutes.
+"""
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import archive
+import db_pool
+import exporter
+import ledger
+import ledger_cache
+import reports
+import search_index
+
+JOBS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    chunks_done INTEGER NOT NULL DEFAULT 0,
+    chunks_total INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    worker_pid INTEGER,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+'''
+
+STATUSES = ('queued', 'running', 'done', 'failed')
+DEFAULT_POLL = 1.0
+# Tranches par processus : équilibre la charge et affine l'avancement
+CHUNKS_PER_PROCESS = 4
+VERIFY_ATTEMPTS = 3
+RECENT_LIMIT = 20
+
+
+def install_jobs(conn, table='transactions'):
+    """Crée la file des tâches de fond (idempotent)"""
+    conn.executescript(JOBS_SCHEMA)
+
+
+# --- File ---
+
+FLAG_VALUES = {'1': True, 'true': True, '0': False, 'false': False}
+
+
+def parse_flag(name, value):
+    """Booléen d'un paramètre JSON (true/false, 1/0) ou de la ligne de commande ('true', 'false', '1', '0')"""
+    if isinstance(value, bool):
+        return value
+    flag = FLAG_VALUES.get(str(value).strip().lower()) if isinstance(value, (str, int)) else None
+    if flag is None:
+        raise ValueError(f"{name} doit valoir true/false ou 1/0, pas {value!r}")
+    return flag
+
+
+def submit(conn, kind, params=None):
+    """Met une tâche en file ; renvoie son id"""
+    params = params or {}
+    if not isinstance(params, dict):
+        raise ValueError('paramètres invalides (objet JSON attendu)')
+    if kind not in RUNNERS:
+        raise ValueError(f"tâche inconnue {kind!r} (attendu : {', '.join(RUNNERS)})")
+    if kind == 'export':
+        # Paramètres vérifiés à la soumission plutôt qu'à l'exécution
+        if params.get('format', 'csv') not in exporter.FORMATS:
+            raise ValueError(f"format inconnu {params['format']!r}")
+        exporter.parse_filters(params)
+        if 'gzip' in params:
+            params = dict(params, gzip=parse_flag('gzip', params['gzip']))
+    with conn:
+        cursor = conn.execute('INSERT INTO jobs (kind, params) VALUES (?, ?)', (kind, json.dumps(params)))
+    return cursor.lastrowid
+
+
+def _as_dict(row):
+    id_, kind, params, status, done, total, result, error, created_at, started_at, finished_at = row
+    return {'id': id_, 'kind': kind, 'params': json.loads(params), 'status': status,
+            'progress': {'done': done, 'total': total, 'ratio': round(done / total, 3) if total else None},
+            'result': json.loads(result) if result else None, 'error': error,
+            'created_at': created_at, 'started_at': started_at, 'finished_at': finished_at}
+
+
+SELECT_JOB = ('SELECT id, kind, params, status, chunks_done, chunks_total, result, error, '
+              'created_at, started_at, finished_at FROM jobs')
+
+
+def get(conn, job_id):
+    """État d'une tâche (dict), ou None"""
+    row = conn.execute(SELECT_JOB + ' WHERE id = ?', (job_id,)).fetchone()
+    return _as_dict(tuple(row)) if row else None
+
+
+def recent(conn, limit=RECENT_LIMIT, status=None):
+    """Dernières tâches, les plus récentes d'abord"""
+    if status is not None:
+        rows = conn.execute(SELECT_JOB + ' WHERE status = ? ORDER BY id DESC LIMIT ?', (status, limit))
+    else:
+        rows = conn.execute(SELECT_JOB + ' ORDER BY id DESC LIMIT ?', (limit,))
+    return [_as_dict(tuple(row)) for row in rows]
+
+
+def claim(conn):
+    """Réserve la plus ancienne tâche en file pour ce processus ; renvoie (id, kind, params) ou None"""
+    with conn:
+        row = conn.execute(
+            "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = datetime('now') "
+            "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1) "
+            'RETURNING id, kind, params', (os.getpid(),)
+        ).fetchone()
+    return (row[0], row[1], json.loads(row[2])) if row else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def requeue_orphans(conn):
+    """Remet en file les tâches `running` dont le worker n'existe plus ; renvoie leur nombre"""
+    orphans = [job_id for job_id, pid in conn.execute("SELECT id, worker_pid FROM jobs WHERE status = 'running'")
+               if pid is None or not _alive(pid)]
+    with conn:
+        conn.executemany("UPDATE jobs SET status = 'queued', chunks_done = 0, chunks_total = 0, "
+                         'worker_pid = NULL, started_at = NULL WHERE id = ?', [(job_id,) for job_id in orphans])
+    return len(orphans)
+
+
+def _finish(conn, job_id, status, result=None, error=None):
+    with conn:
+        conn.execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = datetime('now') WHERE id = ?",
+                     (status, None if result is None else json.dumps(result), error, job_id))
+
+
+# --- Parcours parallèle en tranches d'ids ---
+
+def id_ranges(conn, chunks, table='transactions'):
+    """Découpe [MIN(id), MAX(id)] en au plus `chunks` intervalles fermés contigus"""
+    low, high = conn.execute(f'SELECT MIN(id), MAX(id) FROM "{table}"').fetchone()
+    if low is None:
+        return []
+    chunks = max(1, min(chunks, high - low + 1))
+    step = -(-(high - low + 1) // chunks)
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+
+def _scan_chunk(database, table, low, high):
+    """Totaux par catégorie d'une tranche d'ids (exécuté dans un processus du pool)"""
+    conn = sqlite3.connect(archive._uri(database, mode='ro'), uri=True)
+    try:
+        return conn.execute(
+            f'SELECT IFNULL(category, \'\'), SUM(amount), COUNT(*), MIN(amount), MAX(amount) FROM "{table}" '
+            'WHERE id BETWEEN ? AND ? GROUP BY 1', (low, high)
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def parallel_scan_totals(conn, pool, database, table='transactions', chunks=None, progress=None):
+    """Équivalent de `ledger.scan_totals` réparti sur les processus de `pool` ; renvoie (totaux, catégories)"""
+    ranges = id_ranges(conn, chunks or CHUNKS_PER_PROCESS * (os.cpu_count() or 1), table)
+    categories = ledger.external_category_totals(conn)
+    futures = [pool.submit(_scan_chunk, database, table, low, high) for low, high in ranges]
+    for done, future in enumerate(as_completed(futures), start=1):
+        for row in future.result():
+            ledger.merge_category(categories, *row)
+        if progress is not None:
+            progress(done, len(ranges))
+    totals = {'balance': 0.0, 'count': 0}
+    for entry in categories.values():
+        totals['balance'] += entry['total']
+        totals['count'] += entry['count']
+    return totals, categories
+
+
+# --- Exécution ---
+
+class Job:
+    """Tâche réservée par le worker : connexion, pool et suivi de l'avancement"""
+
+    def __init__(self, conn, pool, database, table, job_id, params, chunks=None):
+        self.conn, self.pool, self.database, self.table = conn, pool, database, table
+        self.id, self.params, self.chunks = job_id, params, chunks
+
+    def progress(self, done, total):
+        # Pendant une reconstruction (BEGIN IMMEDIATE en cours), l'avancement n'est publié qu'au commit
+        in_transaction = self.conn.in_transaction
+        self.conn.execute('UPDATE jobs SET chunks_done = ?, chunks_total = ? WHERE id = ?', (done, total, self.id))
+        if not in_transaction:
+            self.conn.commit()
+
+    def scan_totals(self):
+        return parallel_scan_totals(self.conn, self.pool, self.database, self.table, self.chunks, self.progress)
+
+
+def _scan_result(totals, categories):
+    return {'balance': round(totals['balance'], 2), 'count': totals['count'], 'categories': categories}
+
+
+def run_scan_totals(job):
+    """Solde et totaux par catégorie recalculés par un parcours complet (sans rien écrire)"""
+    state = ledger_cache.read_state(job.conn)
+    result = _scan_result(*job.scan_totals())
+    result['consistent'] = ledger_cache.read_state(job.conn) == state
+    return result
+
+
+def run_verify_totals(job):
+    """Compare les agrégats incrémentaux au parcours parallèle ; recommence si le ledger a changé entre-temps"""
+    for attempt in range(1, VERIFY_ATTEMPTS + 1):
+        state = ledger_cache.read_state(job.conn)
+        scan = job.scan_totals()
+        errors = ledger.verify_totals(job.conn, job.table, scan)
+        if ledger_cache.read_state(job.conn) == state:
+            return {'errors': errors, 'attempts': attempt}
+    raise RuntimeError(f'ledger modifié pendant chacun des {VERIFY_ATTEMPTS} parcours, vérification abandonnée')
+
+
+def run_rebuild_totals(job):
+    """Reconstruit les agrégats ; les écritures attendent la fin du parcours (verrou d'écriture gardé)"""
+    job.conn.execute('BEGIN IMMEDIATE')
+    try:
+        totals = ledger.rebuild_totals(job.conn, job.table, job.scan_totals())
+    except BaseException:
+        job.conn.rollback()
+        raise
+    return {'balance': round(totals['balance'], 2), 'count': totals['count']}
+
+
+def run_rebuild_reports(job):
+    return {'rows': reports.rebuild_rollups(job.conn, job.table)}
+
+
+def run_rebuild_search_index(job):
+    search_index.rebuild_fts(job.conn, job.table)
+    search_index.optimize_fts(job.conn, job.table)
+    return {}
+
+
+def export_dir(database):
+    return os.path.splitext(os.path.abspath(database))[0] + '-exports'
+
+
+def run_export(job):
+    """Export CSV/JSONL (gzip facultatif) dans `<base>-exports/`, avec les filtres de /export"""
+    fmt = job.params.get('format', 'csv')
+    filters = exporter.parse_filters(job.params)
+    chunks = exporter.iter_export(job.conn, fmt, filters, table=job.table)
+    filename = f'job-{job.id}.{fmt}'
+    if job.params.get('gzip'):
+        chunks = exporter.gzip_chunks(chunks)
+        filename += '.gz'
+    os.makedirs(export_dir(job.database), exist_ok=True)
+    path = os.path.join(export_dir(job.database), filename)
+    with open(path + '.part', 'wb') as output:
+        for chunk in chunks:
+            output.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+    os.replace(path + '.part', path)
+    return {'path': path, 'bytes': os.path.getsize(path)}
+
+
+RUNNERS = {
+    'scan-totals': run_scan_totals,
+    'verify-totals': run_verify_totals,
+    'rebuild-totals': run_rebuild_totals,
+    'rebuild-reports': run_rebuild_reports,
+    'rebuild-search-index': run_rebuild_search_index,
+    'export': run_export,
+}
+
+
+def run_job(conn, pool, database, table, job_id, kind, params, chunks=None):
+    """Exécute une tâche réservée et enregistre son résultat ou son erreur ; renvoie le statut final"""
+    try:
+        result = RUNNERS[kind](Job(conn, pool, database, table, job_id, params, chunks))
+    except Exception as e:
+        _finish(conn, job_id, 'failed', error=f'{type(e).__name__}: {e}')
+        return 'failed'
+    _finish(conn, job_id, 'done', result)
+    return 'done'
+
+
+def make_pool(processes=None):
+    """Pool de processus `spawn` : aucun état (connexion SQLite, verrou) hérité du worker"""
+    return ProcessPoolExecutor(processes or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+
+
+def run_worker(database, table='transactions', processes=None, chunks=None, poll=DEFAULT_POLL, once=False,
+               echo=print, databases=None):
+    """Boucle du worker : réserve et exécute les tâches en file ; avec `once`, s'arrête quand la file est vide
+
+    `databases` (appelable, relu à chaque tour) donne les bases dont la file est relevée : celles de tous
+    les locataires si le routage est actif. Une tâche au plus par base et par tour, chacune à son tour.
+    """
+    databases = databases or (lambda: [database])
+    processes = processes or os.cpu_count()
+    chunks = chunks or CHUNKS_PER_PROCESS * processes
+    conns = {}
+
+    def connection(path):
+        conn = conns.get(path)
+        if conn is None:
+            conn = conns[path] = db_pool.configure_connection(sqlite3.connect(path))
+            requeued = requeue_orphans(conn)
+            if requeued:
+                echo(f'↻ {requeued} tâche(s) interrompue(s) remise(s) en file ({path})')
+        return conn
+
+    try:
+        with make_pool(processes) as pool:
+            while True:
+                claimed = False
+                for path in databases():
+                    try:
+                        conn = connection(path)
+                        job = claim(conn)
+                    except sqlite3.Error:
+                        # Base d'un locataire en cours de création (file pas encore migrée) : tour suivant
+                        continue
+                    if job is None:
+                        continue
+                    claimed = True
+                    job_id, kind, params = job
+                    start = time.perf_counter()
+                    status = run_job(conn, pool, path, table, job_id, kind, params, chunks)
+                    echo(f"{'✓' if status == 'done' else '❌'} tâche {job_id} ({kind}) : {status} "
+                         f'en {time.perf_counter() - start:.2f} s' + ('' if path == database else f' ({path})'))
+                if not claimed:
+                    if once:
+                        return
+                    time.sleep(poll)
+    finally:
+        for conn in conns.values():
+            conn.close()
@@ -0,0 +1,324 @@
+"""Agrégats du ledger maintenus par SQLite (solde global et totaux par catégorie).
+
+Les tables `ledger_totals` et `ledger_category_totals` sont tenues à jour par des
+triggers sur la table des transactions : toute insertion, modification ou
+suppression (formulaire, ORM ou SQL direct) met à jour les totaux dans la même
+transaction. Lire le solde coûte donc une seule ligne, quelle que soit la taille
+du ledger.
+
+`ledger_totals.version` est incrémenté à chaque écriture : c'est le compteur de
+version du ledger qui sert de clé aux caches de pages (ETag).
+
+Les fonctions acceptent une connexion `sqlite3` et le nom de la table des
+transactions (`transactions` pour app.py, `transaction` pour app-corrigé.py).
+
+Pour les imports en masse, `bulk_insert()` suspend les triggers d'insertion ligne
+à ligne (drapeau `ledger_bulk_load`, visible de la seule transaction en cours) et
+met à jour les agrégats et index dérivés en une passe ensembliste par lot.
+"""
+
+# Écart toléré entre les totaux incrémentaux et un recalcul complet (arrondis flottants)
+TOLERANCE = 0.005
+
+# Drapeau des opérations en masse : tant qu'il contient une ligne, les triggers
+# d'insertion ligne à ligne sont ignorés (voir bulk_insert), ainsi que ceux de
+# suppression une fois DELETE_TRIGGER installé (archivage, voir archive.py)
+BULK_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ledger_bulk_load (active INTEGER NOT NULL);
+'''
+
+TOTALS_SCHEMA = BULK_SCHEMA + '''
+CREATE TABLE IF NOT EXISTS ledger_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    balance REAL NOT NULL DEFAULT 0,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS ledger_category_totals (
+    category TEXT PRIMARY KEY NOT NULL,
+    total REAL NOT NULL DEFAULT 0,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    min_amount REAL,
+    max_amount REAL
+);
+
+INSERT OR IGNORE INTO ledger_totals (id, balance, row_count) VALUES (1, 0, 0);
+
+CREATE TRIGGER IF NOT EXISTS {prefix}_totals_insert AFTER INSERT ON "{table}"
+WHEN NOT EXISTS (SELECT 1 FROM ledger_bulk_load)
+BEGIN
+    UPDATE ledger_totals SET balance = balance + NEW.amount, row_count = row_count + 1, version = version + 1
+    WHERE id = 1;
+    INSERT INTO ledger_category_totals (category, total, row_count, min_amount, max_amount)
+        VALUES (IFNULL(NEW.category, ''), NEW.amount, 1, NEW.amount, NEW.amount)
+        ON CONFLICT (category) DO UPDATE SET
+            total = total + excluded.total,
+            row_count = row_count + 1,
+            min_amount = MIN(min_amount, excluded.min_amount),
+            max_amount = MAX(max_amount, excluded.max_amount);
+END;
+
+CREATE TRIGGER IF NOT EXISTS {prefix}_totals_delete AFTER DELETE ON "{table}"
+BEGIN
+    UPDATE ledger_totals SET balance = balance - OLD.amount, row_count = row_count - 1, version = version + 1
+    WHERE id = 1;
+{remove_old}
+END;
+
+CREATE TRIGGER IF NOT EXISTS {prefix}_version_update AFTER UPDATE ON "{table}"
+BEGIN
+    UPDATE ledger_totals SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS {prefix}_totals_update AFTER UPDATE OF amount, category ON "{table}"
+BEGIN
+    UPDATE ledger_totals SET balance = balance - OLD.amount + NEW.amount WHERE id = 1;
+{remove_old}
+    INSERT INTO ledger_category_totals (category, total, row_count, min_amount, max_amount)
+        VALUES (IFNULL(NEW.category, ''), NEW.amount, 1, NEW.amount, NEW.amount)
+        ON CONFLICT (category) DO UPDATE SET
+            total = total + excluded.total,
+            row_count = row_count + 1,
+            min_amount = MIN(min_amount, excluded.min_amount),
+            max_amount = MAX(max_amount, excluded.max_amount);
+END;
+'''
+
+# Retire OLD de sa catégorie ; min/max ne sont recalculés que si OLD en était une borne
+REMOVE_OLD = '''
+    UPDATE ledger_category_totals SET
+        total = total - OLD.amount,
+        row_count = row_count - 1,
+        min_amount = CASE WHEN OLD.amount <= min_amount
+            THEN (SELECT MIN(amount) FROM "{table}" WHERE category IS OLD.category) ELSE min_amount END,
+        max_amount = CASE WHEN OLD.amount >= max_amount
+            THEN (SELECT MAX(amount) FROM "{table}" WHERE category IS OLD.category) ELSE max_amount END
+    WHERE category = IFNULL(OLD.category, '');
+    DELETE FROM ledger_category_totals WHERE category = IFNULL(OLD.category, '') AND row_count <= 0;'''
+
+
+# Suppression qui laisse les agrégats intacts sous le drapeau : les lignes archivées restent comptées
+DELETE_TRIGGER = '''
+DROP TRIGGER IF EXISTS {prefix}_totals_delete;
+
+CREATE TRIGGER {prefix}_totals_delete AFTER DELETE ON "{table}"
+WHEN NOT EXISTS (SELECT 1 FROM ledger_bulk_load)
+BEGIN
+    UPDATE ledger_totals SET balance = balance - OLD.amount, row_count = row_count - 1, version = version + 1
+    WHERE id = 1;
+{remove_old}
+END;
+'''
+
+# Application ensembliste des agrégats aux lignes d'id > ? insérées par bulk_insert
+BULK_TOTALS = '''
+UPDATE ledger_totals SET
+    balance = balance + (SELECT IFNULL(SUM(amount), 0) FROM "{table}" WHERE id > :first_id),
+    row_count = row_count + (SELECT COUNT(*) FROM "{table}" WHERE id > :first_id),
+    version = version + 1
+WHERE id = 1;
+
+INSERT INTO ledger_category_totals (category, total, row_count, min_amount, max_amount)
+    SELECT IFNULL(category, ''), SUM(amount), COUNT(*), MIN(amount), MAX(amount)
+    FROM "{table}" WHERE id > :first_id GROUP BY 1
+    ON CONFLICT (category) DO UPDATE SET
+        total = total + excluded.total,
+        row_count = row_count + excluded.row_count,
+        min_amount = MIN(min_amount, excluded.min_amount),
+        max_amount = MAX(max_amount, excluded.max_amount);
+'''
+
+# La date absente (None) prend la date du jour, comme le trigger par défaut de migrations.py
+INSERT_SQL = ('INSERT INTO "{table}" (description, amount, category, booked_on) '
+              "VALUES (?, ?, ?, IFNULL(?, date('now')))")
+
+# Fonctions appelées par bulk_insert(conn, first_id, table) pour mettre à jour les structures dérivées
+_bulk_hooks = []
+
+# Fonctions sans argument appelées après chaque écriture validée (ex. réveil du flux en direct, live.py)
+_commit_hooks = []
+
+# Fonctions source(conn) -> lignes (catégorie, total, nombre, min, max) des transactions tenues hors
+# de la table (ex. partitions d'archive), ajoutées aux recalculs complets
+_totals_sources = []
+
+
+def register_bulk_hook(hook):
+    """Ajoute une mise à jour ensembliste exécutée après chaque lot de bulk_insert"""
+    if hook not in _bulk_hooks:
+        _bulk_hooks.append(hook)
+
+
+def register_commit_hook(hook):
+    """Ajoute une fonction appelée après chaque écriture validée (voir notify_committed)"""
+    if hook not in _commit_hooks:
+        _commit_hooks.append(hook)
+
+
+def notify_committed():
+    """Signale une écriture validée (bulk_insert, file d'écriture, /add) ; à appeler après le commit"""
+    for hook in _commit_hooks:
+        hook()
+
+
+def register_totals_source(source):
+    """Ajoute une source d'agrégats de transactions stockées hors de la table (voir scan_totals)"""
+    if source not in _totals_sources:
+        _totals_sources.append(source)
+
+
+def external_category_totals(conn):
+    """Totaux par catégorie des sources externes : {catégorie: {total, count, min, max}}"""
+    categories = {}
+    for source in _totals_sources:
+        for category, total, count, min_amount, max_amount in source(conn):
+            merge_category(categories, category, total, count, min_amount, max_amount)
+    return categories
+
+
+def merge_category(categories, category, total, count, min_amount, max_amount):
+    """Ajoute une ligne de totaux à {catégorie: {total, count, min, max}}"""
+    entry = categories.get(category)
+    if entry is None:
+        categories[category] = {'total': total, 'count': count, 'min': min_amount, 'max': max_amount}
+    else:
+        entry['total'] += total
+        entry['count'] += count
+        entry['min'] = min(entry['min'], min_amount)
+        entry['max'] = max(entry['max'], max_amount)
+
+
+def _prefix(table):
+    return table.strip('"').replace(' ', '_')
+
+
+def install_totals(conn, table='transactions'):
+    """Crée les tables d'agrégats et leurs triggers (idempotent), puis les initialise si besoin"""
+    fresh = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ledger_totals'"
+    ).fetchone() is None
+    if not fresh and 'version' not in {row[1] for row in conn.execute('PRAGMA table_info(ledger_totals)')}:
+        conn.execute('ALTER TABLE ledger_totals ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    conn.executescript(TOTALS_SCHEMA.format(
+        table=table, prefix=_prefix(table), remove_old=REMOVE_OLD.format(table=table)))
+    if fresh:
+        rebuild_totals(conn, table)
+
+
+def install_bulk_delete(conn, table='transactions'):
+    """Remplace le trigger de suppression par DELETE_TRIGGER (ignoré sous le drapeau ledger_bulk_load)"""
+    conn.executescript(DELETE_TRIGGER.format(
+        table=table, prefix=_prefix(table), remove_old=REMOVE_OLD.format(table=table)))
+
+
+def apply_bulk_totals(conn, first_id, table='transactions'):
+    for statement in BULK_TOTALS.format(table=table).split(';'):
+        if statement.strip():
+            conn.execute(statement, {'first_id': first_id})
+
+
+def bulk_insert(conn, rows, table='transactions'):
+    """Insère un lot de (description, montant, catégorie, date) en une transaction ; renvoie le dernier id
+
+    Les triggers d'insertion sont suspendus pendant l'executemany, puis les agrégats et
+    les hooks enregistrés sont appliqués une fois aux nouvelles lignes (id > premier id).
+    """
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        first_id = conn.execute(f'SELECT IFNULL(MAX(id), 0) FROM "{table}"').fetchone()[0]
+        conn.execute('INSERT INTO ledger_bulk_load (active) VALUES (1)')
+        conn.executemany(INSERT_SQL.format(table=table), rows)
+        conn.execute('DELETE FROM ledger_bulk_load')
+        apply_bulk_totals(conn, first_id, table)
+        for hook in _bulk_hooks:
+            hook(conn, first_id, table)
+        last_id = conn.execute(f'SELECT IFNULL(MAX(id), 0) FROM "{table}"').fetchone()[0]
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    notify_committed()
+    return last_id
+
+
+def read_balance(conn):
+    """Solde global en O(1)"""
+    row = conn.execute('SELECT balance FROM ledger_totals WHERE id = 1').fetchone()
+    return row[0] if row else 0.0
+
+
+def read_version(conn):
+    """Compteur de version du ledger, incrémenté à chaque écriture"""
+    row = conn.execute('SELECT version FROM ledger_totals WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def read_totals(conn):
+    """Solde global et nombre de transactions"""
+    balance, row_count = conn.execute('SELECT balance, row_count FROM ledger_totals WHERE id = 1').fetchone()
+    return {'balance': balance, 'count': row_count}
+
+
+def read_category_totals(conn):
+    """Totaux par catégorie : {catégorie: {total, count, min, max}}"""
+    rows = conn.execute(
+        'SELECT category, total, row_count, min_amount, max_amount FROM ledger_category_totals ORDER BY category'
+    )
+    return {
+        category: {'total': total, 'count': count, 'min': min_amount, 'max': max_amount}
+        for category, total, count, min_amount, max_amount in rows
+    }
+
+
+def scan_totals(conn, table='transactions'):
+    """Recalcule les agrégats par un parcours complet de la table, plus les sources externes
+    (référence pour la vérification)"""
+    totals = {'balance': 0.0, 'count': 0}
+    categories = external_category_totals(conn)
+    rows = conn.execute(
+        f'SELECT IFNULL(category, \'\'), SUM(amount), COUNT(*), MIN(amount), MAX(amount) FROM "{table}" GROUP BY 1'
+    )
+    for row in rows:
+        merge_category(categories, *row)
+    for entry in categories.values():
+        totals['balance'] += entry['total']
+        totals['count'] += entry['count']
+    return totals, categories
+
+
+def rebuild_totals(conn, table='transactions', scan=None):
+    """Reconstruit les agrégats à partir de la table des transactions (ou d'un parcours `scan` déjà fait,
+    voir jobs.parallel_scan_totals)"""
+    totals, categories = scan or scan_totals(conn, table)
+    with conn:
+        conn.execute('UPDATE ledger_totals SET balance = ?, row_count = ?, version = version + 1 WHERE id = 1',
+                     (totals['balance'], totals['count']))
+        conn.execute('DELETE FROM ledger_category_totals')
+        conn.executemany(
+            'INSERT INTO ledger_category_totals (category, total, row_count, min_amount, max_amount) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(c, v['total'], v['count'], v['min'], v['max']) for c, v in categories.items()]
+        )
+    return totals
+
+
+def verify_totals(conn, table='transactions', scan=None):
+    """Compare les agrégats incrémentaux à un parcours complet (`scan` s'il est fourni) ; renvoie la liste des écarts"""
+    expected, expected_categories = scan or scan_totals(conn, table)
+    actual = read_totals(conn)
+    actual_categories = read_category_totals(conn)
+
+    errors = []
+    if actual['count'] != expected['count'] or abs(actual['balance'] - expected['balance']) > TOLERANCE:
+        errors.append(f"global : attendu {expected}, trouvé {actual}")
+    for category in sorted(set(expected_categories) | set(actual_categories)):
+        want, got = expected_categories.get(category), actual_categories.get(category)
+        if want is None or got is None:
+            errors.append(f"catégorie {category!r} : attendu {want}, trouvé {got}")
+            continue
+        if (want['count'] != got['count']
+                or any(abs(want[key] - got[key]) > TOLERANCE for key in ('total', 'min', 'max'))):
+            errors.append(f"catégorie {category!r} : attendu {want}, trouvé {got}")
+    return errors
@@ -0,0 +1,309 @@
+"""Cache en mémoire du ledger, en colonnes compactes, pour les lectures fréquentes.
+
+Au lieu de matérialiser un `sqlite3.Row` ou une instance ORM par ligne lue,
+les transactions sont gardées en colonnes :
+
+- ids et montants dans des `array` (8 octets par ligne chacun) ;
+- catégories et dates internées : un code `array('I')` par ligne et une seule
+  chaîne par valeur distincte ;
+- descriptions encodées en UTF-8 dans un unique `bytearray`, avec un tableau
+  d'offsets.
+
+Les totaux par catégorie sont tenus à jour pendant le chargement ; ceux des
+transactions archivées (`ledger.external_category_totals`) y sont ajoutés. Le
+solde est celui de `ledger_totals`, lu avec l'état.
+
+Le cache est chargé une fois (au démarrage ou au premier usage), puis rafraîchi
+à chaque lecture si la version du ledger a changé. Les lignes d'id supérieur au
+dernier id chargé sont simplement ajoutées. Une modification ou une suppression
+(compteur `ledger_mutations`, tenu par triggers) ou un nombre de lignes
+incohérent provoque un rechargement complet. État et lignes sont lus dans la
+même transaction de lecture, donc cohérents entre eux.
+
+Les écritures se font sous verrou. Les lectures n'en prennent pas : elles
+travaillent sur le nombre de lignes publié à l'instant de la lecture.
+"""
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from itertools import compress
+
+from flask import current_app
+
+import db_pool
+import ledger
+
+LOAD_BATCH_SIZE = 10_000
+
+# Compteur des modifications et suppressions : les ajouts seuls se rattrapent par la fin de table
+MUTATIONS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ledger_mutations (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    seq INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO ledger_mutations (id, seq) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS "{table}_mutations_update" AFTER UPDATE ON "{table}"
+BEGIN
+    UPDATE ledger_mutations SET seq = seq + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS "{table}_mutations_delete" AFTER DELETE ON "{table}"
+BEGIN
+    UPDATE ledger_mutations SET seq = seq + 1 WHERE id = 1;
+END;
+'''
+
+# Le trigger de date par défaut (migration 4) complète booked_on par un UPDATE, dans l'INSERT même : ce
+# n'est pas une modification, les caches peuvent rester en ajout seul
+DATE_FILL_SCHEMA = '''
+DROP TRIGGER IF EXISTS "{table}_mutations_update";
+
+CREATE TRIGGER "{table}_mutations_update" AFTER UPDATE ON "{table}"
+WHEN NOT (OLD.booked_on IS NULL AND NEW.booked_on IS NOT NULL AND NEW.id = OLD.id
+          AND NEW.description IS OLD.description AND NEW.amount IS OLD.amount AND NEW.category IS OLD.category)
+BEGIN
+    UPDATE ledger_mutations SET seq = seq + 1 WHERE id = 1;
+END;
+'''
+
+STATE_SQL = ('SELECT version, row_count, (SELECT seq FROM ledger_mutations WHERE id = 1), balance '
+             'FROM ledger_totals WHERE id = 1')
+
+
+def install_mutation_log(conn, table='transactions'):
+    """Crée le compteur de modifications et ses triggers (idempotent)"""
+    conn.executescript(MUTATIONS_SCHEMA.format(table=table))
+
+
+def exclude_date_fill(conn, table='transactions'):
+    """Sort le remplissage de booked_on par défaut du compteur de modifications (idempotent)"""
+    conn.executescript(DATE_FILL_SCHEMA.format(table=table))
+
+
+def read_state(conn):
+    """(version du ledger, nombre de lignes, compteur de modifications, solde)"""
+    return tuple(conn.execute(STATE_SQL).fetchone())
+
+
+@contextmanager
+def read_snapshot(conn):
+    """Transaction de lecture : état et lignes lus dans le même instantané (WAL : sans bloquer les écritures)"""
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute('BEGIN')
+    try:
+        yield conn
+    finally:
+        if own_transaction:
+            conn.rollback()
+
+
+class _Interned:
+    """Valeurs distinctes d'une colonne de chaînes, numérotées dans l'ordre d'apparition"""
+
+    __slots__ = ('values', 'codes')
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class _Columns:
+    """Colonnes d'un chargement ; `size` n'avance qu'une fois toutes les colonnes d'une ligne écrites"""
+
+    def __init__(self):
+        self.ids = array('q')
+        self.amounts = array('d')
+        self.category_codes = array('I')
+        self.date_codes = array('I')
+        self.text = bytearray()
+        self.offsets = array('Q', [0])
+        self.categories = _Interned()
+        self.dates = _Interned()
+        # Par code de catégorie : [total, nombre, min, max]
+        self.category_totals = []
+        self.size = 0
+
+    def append(self, rows):
+        ids, amounts, text, offsets = self.ids, self.amounts, self.text, self.offsets
+        category_code, date_code = self.categories.code, self.dates.code
+        totals = self.category_totals
+        for row_id, description, amount, category, booked_on in rows:
+            code = category_code(category)
+            if code == len(totals):
+                totals.append([0.0, 0, amount, amount])
+            entry = totals[code]
+            entry[0] += amount
+            entry[1] += 1
+            if amount < entry[2]:
+                entry[2] = amount
+            if amount > entry[3]:
+                entry[3] = amount
+            ids.append(row_id)
+            amounts.append(amount)
+            self.category_codes.append(code)
+            self.date_codes.append(date_code(booked_on))
+            text += description.encode('utf-8')
+            offsets.append(len(text))
+            self.size += 1
+
+    def row(self, i):
+        return {
+            'id': self.ids[i],
+            'description': self.text[self.offsets[i]:self.offsets[i + 1]].decode('utf-8'),
+            'amount': self.amounts[i],
+            'category': self.categories.values[self.category_codes[i]],
+            'booked_on': self.dates.values[self.date_codes[i]],
+        }
+
+    def nbytes(self):
+        arrays = (self.ids, self.amounts, self.category_codes, self.date_codes, self.offsets)
+        strings = self.categories.values + self.dates.values
+        return (sum(a.itemsize * len(a) for a in arrays) + len(self.text)
+                + sum(sys.getsizeof(s) for s in strings))
+
+
+class LedgerCache:
+    """Transactions d'une table en colonnes, rafraîchies d'après la version du ledger"""
+
+    def __init__(self, table='transactions'):
+        self.table = table
+        self._columns = _Columns()
+        self._state = None  # (version, nombre de lignes, compteur de modifications, solde)
+        self._external = {}  # totaux par catégorie des transactions hors de la table (archive)
+        self._lock = threading.Lock()
+        self._stats = {'syncs': 0, 'appended': 0, 'reloads': 0}
+
+    def sync(self, conn):
+        """Met le cache à jour depuis `conn` si le ledger a changé ; renvoie le cache"""
+        if read_state(conn) != self._state:
+            with self._lock, read_snapshot(conn):
+                state = read_state(conn)
+                if state != self._state:
+                    self._refresh(conn, state)
+        return self
+
+    def _refresh(self, conn, state):
+        self._stats['syncs'] += 1
+        version, row_count, mutations, _ = state
+        external = ledger.external_category_totals(conn)
+        # row_count compte aussi les transactions archivées, absentes de la table
+        row_count -= sum(entry['count'] for entry in external.values())
+        columns = self._columns
+        if self._state is None or mutations != self._state[2]:
+            columns = self._load(conn, _Columns(), 0)
+        else:
+            before = columns.size
+            last_id = columns.ids[-1] if before else 0
+            self._load(conn, columns, last_id)
+            self._stats['appended'] += columns.size - before
+        if columns.size != row_count:
+            # Ligne insérée sous le dernier id connu : on recharge tout
+            columns = self._load(conn, _Columns(), 0)
+        self._columns = columns
+        self._external = external
+        self._state = state
+
+    def _load(self, conn, columns, after_id):
+        if after_id == 0:
+            self._stats['reloads'] += 1
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'SELECT id, description, amount, category, booked_on FROM "{self.table}" '
+                       f'WHERE id > ? ORDER BY id', (after_id,))
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                break
+            columns.append(rows)
+        cursor.close()
+        return columns
+
+    def page(self, before_id=None, limit=None):
+        """Transactions par id décroissant, à partir de `before_id` (au plus `limit`)"""
+        return list(self.iter_rows(before_id, limit))
+
+    def iter_rows(self, before_id=None, limit=None):
+        columns = self._columns
+        end = columns.size
+        if before_id is not None:
+            end = bisect_left(columns.ids, before_id, 0, end)
+        start = 0 if limit is None else max(0, end - limit)
+        for i in range(end - 1, start - 1, -1):
+            yield columns.row(i)
+
+    def lookup(self, ids):
+        """Transactions des `ids` dans l'ordre donné (les ids inconnus sont ignorés)"""
+        columns = self._columns
+        size = columns.size
+        rows = []
+        for row_id in ids:
+            i = bisect_left(columns.ids, row_id, 0, size)
+            if i < size and columns.ids[i] == row_id:
+                rows.append(columns.row(i))
+        return rows
+
+    def balance(self):
+        return self._state[3] if self._state else 0.0
+
+    def amount_column(self, category=None):
+        """Colonnes (ids, montants) des transactions, de la catégorie si précisée"""
+        columns = self._columns
+        size = columns.size
+        if category is None:
+            return columns.ids[:size], columns.amounts[:size]
+        code = columns.categories.codes.get(category)
+        if code is None:
+            return array('q'), array('d')
+        mask = list(map(code.__eq__, columns.category_codes[:size]))
+        return array('q', compress(columns.ids[:size], mask)), array('d', compress(columns.amounts[:size], mask))
+
+    def category_totals(self):
+        """Totaux par catégorie : {catégorie: {total, count, min, max}}, comme ledger.read_category_totals"""
+        columns = self._columns
+        categories = columns.categories.values
+        totals = {category: dict(entry) for category, entry in self._external.items()}
+        for code, (total, count, low, high) in enumerate(list(columns.category_totals)):
+            ledger.merge_category(totals, categories[code] or '', total, count, low, high)
+        return dict(sorted(totals.items()))
+
+    def stats(self):
+        columns = self._columns
+        nbytes = columns.nbytes()
+        return dict(self._stats, rows=columns.size, bytes=nbytes,
+                    bytes_per_million_rows=round(nbytes / columns.size * 1_000_000) if columns.size else None,
+                    categories=len(columns.categories.values), version=self._state and self._state[0])
+
+
+def init_app(app, table='transactions'):
+    """Déclare le cache de l'application (LEDGER_CACHE pour l'activer)"""
+    app.config.setdefault('LEDGER_CACHE', False)
+    app.config.setdefault('LEDGER_CACHE_TABLE', table)
+    app.extensions['ledger_cache'] = None
+
+
+def get_cache(conn, app=None):
+    """Cache de l'application, créé et chargé au premier usage puis synchronisé ; None si désactivé"""
+    app = app or current_app
+    if not app.config['LEDGER_CACHE']:
+        return None
+    # Un cache par base : par shard si le routage par locataire est actif
+    store = db_pool.extensions(app)
+    cache = store.get('ledger_cache')
+    database = app.config.get('DATABASE') or app.config.get('SQLALCHEMY_DATABASE_URI')
+    if cache is None or cache.database != database:
+        cache = LedgerCache(app.config['LEDGER_CACHE_TABLE'])
+        cache.database = database
+        store['ledger_cache'] = cache
+    return cache.sync(conn)
@@ -0,0 +1,266 @@
+"""Flux en direct (server-sent events) des nouvelles transactions et du solde, servi par /stream.
+
+Un seul thread diffuseur par base et par processus, quel que soit le nombre
+d'abonnés :
+
+- il relit l'état du ledger (`ledger_cache.read_state`) quand une écriture du
+  processus le réveille (`ledger.notify_committed`, après chaque commit de
+  /add, de la file d'écriture et de `bulk_insert`), et au plus tard toutes les
+  `LIVE_POLL` secondes pour les écritures des autres processus (workers
+  gunicorn, import en ligne de commande, tâches de fond) ;
+- si l'état a changé, il lit les lignes d'id supérieur au dernier id publié et
+  publie des événements `transactions` (lots d'au plus `EVENT_BATCH_SIZE`
+  lignes, id de l'événement = id de la dernière ligne), puis un événement
+  `balance`. Chaque événement est sérialisé une fois, en octets, pour tous ;
+- les événements récents restent dans un tampon circulaire. Un abonné n'est
+  qu'un curseur dans ce tampon, en attente sur une condition commune : une
+  publication réveille tous les abonnés, sans file ni thread par client.
+
+Reprise : un client reconnecté avec `Last-Event-ID` (ou `?last_event_id=`)
+reçoit d'abord les lignes manquées, relues en base si elles ne sont plus dans
+le tampon. Au-delà de `MAX_CATCHUP` lignes, ou si un abonné trop lent a été
+dépassé par le tampon, un événement `reset` l'invite à recharger /transactions
+et le flux reprend au dernier id.
+
+Chaque abonné garde une connexion HTTP ouverte : avec gunicorn, des workers
+gevent (BUDGET_WORKER_CLASS=gevent) tiennent des centaines d'abonnés ; en
+gthread, chacun occupe un thread.
+"""
+import json
+import sqlite3
+import threading
+import weakref
+from collections import deque
+
+from flask import current_app
+
+import db_pool
+import ledger
+import ledger_cache
+
+DEFAULT_POLL = 1.0  # en s
+DEFAULT_HEARTBEAT = 15.0  # en s
+DEFAULT_BACKLOG = 1024  # événements gardés pour la reprise
+EVENT_BATCH_SIZE = 500
+MAX_CATCHUP = 10_000
+RETRY_MS = 2000
+
+PING = b': ping\n\n'
+ROW_COLUMNS = ('id', 'description', 'amount', 'category', 'booked_on')
+
+# Diffuseurs vivants du processus, réveillés après chaque écriture validée
+_broadcasters = weakref.WeakSet()
+
+
+def encode(event, data, id_=None):
+    """Événement SSE sérialisé (octets)"""
+    head = f'id: {id_}\n' if id_ is not None else ''
+    return f'{head}event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+def encode_rows(rows):
+    """Événements `transactions` d'une suite de lignes (id, description, montant, catégorie, date)"""
+    return [encode('transactions', [dict(zip(ROW_COLUMNS, row)) for row in rows[i:i + EVENT_BATCH_SIZE]],
+                   rows[min(i + EVENT_BATCH_SIZE, len(rows)) - 1][0])
+            for i in range(0, len(rows), EVENT_BATCH_SIZE)]
+
+
+def encode_reset(last_id):
+    return encode('reset', {'last_id': last_id}, last_id)
+
+
+def notify():
+    """Réveille les diffuseurs du processus (hook de `ledger.notify_committed`)"""
+    for broadcaster in list(_broadcasters):
+        broadcaster.wake()
+
+
+ledger.register_commit_hook(notify)
+
+
+class Broadcaster:
+    """Diffuseur d'une base : un thread lecteur, un tampon d'événements partagé par tous les abonnés"""
+
+    def __init__(self, database, table='transactions', poll=DEFAULT_POLL, backlog=DEFAULT_BACKLOG):
+        self.database = database
+        self.table = table
+        self.poll = poll
+        # (numéro, premier id, dernier id, octets) ; ids à None pour un événement `balance`
+        self._events = deque(maxlen=backlog)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._closed = False
+        self._subscribers = 0
+        self._stats = {'events': 0, 'rows': 0, 'resets': 0, 'catchups': 0, 'refreshes': 0, 'errors': 0}
+        self._conn = db_pool.configure_connection(sqlite3.connect(database, check_same_thread=False))
+        self._state = ledger_cache.read_state(self._conn)
+        self.last_id = self._conn.execute(f'SELECT IFNULL(MAX(id), 0) FROM "{table}"').fetchone()[0]
+        self._balance = self._balance_event(self._state)
+        self._thread = threading.Thread(target=self._run, name='live-broadcaster', daemon=True)
+        self._thread.start()
+        _broadcasters.add(self)
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._wake.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._closed:
+                self._wake.wait(self.poll)
+                self._wake.clear()
+                if self._closed:
+                    break
+                try:
+                    self._refresh()
+                except sqlite3.Error:
+                    # Base verrouillée ou migration en cours : nouvel essai au prochain réveil
+                    self._stats['errors'] += 1
+        finally:
+            self._conn.close()
+
+    @staticmethod
+    def _balance_event(state):
+        version, count, _, balance = state
+        return encode('balance', {'balance': round(balance, 2), 'count': count, 'version': version})
+
+    def _refresh(self):
+        """Publie les lignes ajoutées et le solde si l'état du ledger a changé"""
+        if ledger_cache.read_state(self._conn) == self._state:
+            return
+        with ledger_cache.read_snapshot(self._conn):
+            state = ledger_cache.read_state(self._conn)
+            last_id = self._conn.execute(f'SELECT IFNULL(MAX(id), 0) FROM "{self.table}"').fetchone()[0]
+            new_rows = self._conn.execute(f'SELECT COUNT(*) FROM "{self.table}" WHERE id > ?',
+                                          (self.last_id,)).fetchone()[0]
+            if new_rows > MAX_CATCHUP:
+                # Import massif : pas de diffusion ligne à ligne, les abonnés rechargent
+                events = [(last_id - new_rows + 1, last_id, encode_reset(last_id))]
+            else:
+                rows = self._conn.execute(
+                    f'SELECT {", ".join(ROW_COLUMNS)} FROM "{self.table}" WHERE id > ? ORDER BY id',
+                    (self.last_id,)).fetchall()
+                events = [(rows[i][0], rows[min(i + EVENT_BATCH_SIZE, len(rows)) - 1][0], payload)
+                          for i, payload in zip(range(0, len(rows), EVENT_BATCH_SIZE), encode_rows(rows))]
+        balance = self._balance_event(state)
+        events.append((None, None, balance))
+        with self._cond:
+            for first_id, event_last_id, payload in events:
+                self._seq += 1
+                self._events.append((self._seq, first_id, event_last_id, payload))
+            self._stats['refreshes'] += 1
+            self._stats['events'] += len(events)
+            self._stats['rows' if new_rows <= MAX_CATCHUP else 'resets'] += new_rows if new_rows <= MAX_CATCHUP else 1
+            self._state, self._balance = state, balance
+            self.last_id = max(self.last_id, last_id)
+            self._cond.notify_all()
+
+    def subscribe(self, conn, after_id=None, heartbeat=DEFAULT_HEARTBEAT):
+        """Flux SSE (générateur d'octets) d'un abonné ; avec `after_id`, rattrape d'abord les lignes manquées
+
+        Le rattrapage en base se fait ici, sur `conn`, avant le premier octet du flux : la connexion
+        peut être rendue au pool dès la fin de la requête.
+        """
+        with self._cond:
+            cursor, bound, balance = self._seq, self.last_id + 1, self._balance
+            if after_id is not None:
+                # Événements du tampon entièrement postérieurs à after_id : rejoués depuis le tampon
+                for seq, first_id, _, _ in self._events:
+                    if first_id is not None and first_id > after_id:
+                        cursor, bound = seq - 1, first_id
+                        break
+        prefix = [f'retry: {RETRY_MS}\n\n'.encode()]
+        if after_id is not None and after_id < bound - 1:
+            rows = conn.execute(
+                f'SELECT {", ".join(ROW_COLUMNS)} FROM "{self.table}" WHERE id > ? AND id < ? ORDER BY id LIMIT ?',
+                (after_id, bound, MAX_CATCHUP + 1)).fetchall()
+            with self._cond:
+                self._stats['catchups'] += 1
+                if len(rows) > MAX_CATCHUP:
+                    cursor, last_id, balance = self._seq, self.last_id, self._balance
+                    self._stats['resets'] += 1
+            if len(rows) > MAX_CATCHUP:
+                prefix.append(encode_reset(last_id))
+            else:
+                prefix.extend(encode_rows([tuple(row) for row in rows]))
+        if cursor == self._seq:
+            # Sans rejeu du tampon (qui a ses propres événements `balance`) : solde courant tout de suite
+            prefix.append(balance)
+        return self._stream(cursor, b''.join(prefix), heartbeat)
+
+    def _stream(self, cursor, prefix, heartbeat):
+        with self._cond:
+            self._subscribers += 1
+        try:
+            yield prefix
+            while True:
+                with self._cond:
+                    if not self._cond.wait_for(lambda: self._seq > cursor or self._closed, heartbeat):
+                        payload = PING
+                    elif self._closed:
+                        return
+                    elif cursor < self._events[0][0] - 1:
+                        # Abonné dépassé par le tampon : il recharge, le flux reprend au dernier id
+                        payload = encode_reset(self.last_id) + self._balance
+                        cursor = self._seq
+                        self._stats['resets'] += 1
+                    else:
+                        start = cursor - self._events[0][0] + 1
+                        payload = b''.join(self._events[i][3] for i in range(start, len(self._events)))
+                        cursor = self._seq
+                yield payload
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, subscribers=self._subscribers, buffered=len(self._events),
+                        last_id=self.last_id, version=self._state[0])
+
+
+def init_app(app, table='transactions'):
+    """Configuration par défaut du flux en direct ; le diffuseur est créé au premier abonné"""
+    app.config.setdefault('LIVE_TABLE', table)
+    app.config.setdefault('LIVE_POLL', DEFAULT_POLL)
+    app.config.setdefault('LIVE_HEARTBEAT', DEFAULT_HEARTBEAT)
+    app.config.setdefault('LIVE_BACKLOG', DEFAULT_BACKLOG)
+    app.extensions['live'] = None
+
+
+def after_fork(app):
+    """Dans un processus enfant : le thread diffuseur n'a pas survécu au fork, il sera recréé à l'usage"""
+    app.extensions['live'] = None
+
+
+def get_broadcaster(database, app=None):
+    """Diffuseur de `database` (la base de la requête), démarré au premier usage"""
+    app = app or current_app
+    # Un diffuseur par base : par shard si le routage par locataire est actif
+    store = db_pool.extensions(app)
+    broadcaster = store.get('live')
+    if broadcaster is None or broadcaster.database != database:
+        created = Broadcaster(database, app.config['LIVE_TABLE'], app.config['LIVE_POLL'], app.config['LIVE_BACKLOG'])
+        # Pas de verrou global (créé avant le fork, il bloquerait les workers gevent) : si une requête
+        # concurrente a déjà installé le sien, on le garde et on arrête celui-ci
+        broadcaster = store.get('live')
+        if broadcaster is not None and broadcaster.database == database:
+            created.close()
+        else:
+            if broadcaster is not None:
+                broadcaster.close()
+            store['live'] = broadcaster = created
+    return broadcaster
+
+
+def get_stats(app=None):
+    """Statistiques du diffuseur de la base courante, s'il a été démarré"""
+    broadcaster = db_pool.extensions(app or current_app).get('live')
+    return broadcaster.stats() if broadcaster else {'enabled': False}
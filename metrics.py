@@ -0,0 +1,299 @@
+"""Instrumentation : latence par route, temps et lignes par requête SQL, requêtes lentes.
+
+- `init_app()` chronomètre chaque requête HTTP (`before_request` / `after_request`)
+  dans un histogramme étiqueté par route, méthode et statut ; pour une réponse en
+  flux, c'est le temps jusqu'au premier octet.
+- `InstrumentedConnection` (fabrique de connexion sqlite3, pour le pool de app.py
+  et le moteur SQLAlchemy de app-corrigé.py) mesure chaque instruction, lecture
+  des lignes comprise, et compte les lignes lues ou modifiées, par opération et
+  par table. Au-delà de `SLOW_QUERY_MS`, l'instruction est journalisée
+  (logger `budget.slow_query`).
+- `render()` produit le format texte Prometheus (route /metrics).
+
+Les mesures sont réparties sur `SHARDS` compartiments choisis par thread, chacun
+avec son propre verrou : pas de verrou global sur le chemin chaud, et l'export
+additionne les compartiments.
+"""
+import bisect
+import logging
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+from flask import Response, g, request
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SHARDS = 16
+ITER_CHUNK = 256
+DEFAULT_SLOW_QUERY_MS = 100.0
+
+SQL_DURATION = 'budget_sql_query_duration_seconds'
+
+# nom : (type, aide) ; le compteur de lignes est tenu dans les entrées de l'histogramme SQL
+METRICS = {
+    'budget_http_request_duration_seconds': ('histogram', 'Durée des requêtes HTTP par route'),
+    SQL_DURATION: ('histogram', 'Durée des instructions SQL (exécution et lecture)'),
+    'budget_sql_rows_total': ('counter', 'Lignes lues ou modifiées par les instructions SQL'),
+    'budget_sql_slow_queries_total': ('counter', 'Instructions SQL plus lentes que le seuil'),
+}
+
+slow_query_log = logging.getLogger('budget.slow_query')
+
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', re.IGNORECASE)
+
+
+class _Shard:
+    __slots__ = ('lock', 'histograms', 'counters')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+
+class Registry:
+    """Histogrammes et compteurs étiquetés, répartis en compartiments par thread"""
+
+    def __init__(self, buckets=BUCKETS, shards=SHARDS):
+        self.buckets = buckets
+        self.slow_query_seconds = DEFAULT_SLOW_QUERY_MS / 1000
+        self._shards = [_Shard() for _ in range(shards)]
+        self._local = threading.local()
+        self._gauges = {}
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._shards[threading.get_native_id() % len(self._shards)]
+            return shard
+
+    def observe(self, name, labels, value, rows=0):
+        """Ajoute une observation (en secondes) à l'histogramme `name` ; `labels` est un tuple de paires"""
+        shard = self._shard()
+        with shard.lock:
+            entry = shard.histograms.get((name, labels))
+            if entry is None:
+                # Un compteur par borne (+Inf compris), la somme des valeurs, puis le nombre de lignes
+                entry = shard.histograms[(name, labels)] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[bisect.bisect_left(self.buckets, value)] += 1
+            entry[-2] += value
+            entry[-1] += rows
+
+    def inc(self, name, labels, amount=1):
+        shard = self._shard()
+        with shard.lock:
+            shard.counters[(name, labels)] = shard.counters.get((name, labels), 0) + amount
+
+    def register_gauge(self, name, help_text, read):
+        """Jauge lue au moment de l'export : `read()` renvoie un nombre, ou None pour l'omettre"""
+        self._gauges[name] = (help_text, read)
+
+    def collect(self):
+        """Additionne les compartiments : ({(nom, labels): [compteurs..., somme, lignes]}, {(nom, labels): total})"""
+        histograms, counters = {}, {}
+        for shard in self._shards:
+            with shard.lock:
+                for key, entry in shard.histograms.items():
+                    merged = histograms.get(key)
+                    histograms[key] = list(entry) if merged is None else [a + b for a, b in zip(merged, entry)]
+                for key, value in shard.counters.items():
+                    counters[key] = counters.get(key, 0) + value
+        for (name, labels), entry in histograms.items():
+            if name == SQL_DURATION and entry[-1]:
+                counters['budget_sql_rows_total', labels] = entry[-1]
+        return histograms, counters
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.histograms.clear()
+                shard.counters.clear()
+
+    def render(self):
+        """Export au format texte Prometheus (version 0.0.4)"""
+        histograms, counters = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for (metric, labels), entry in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + ('+Inf',), entry):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", str(bound)),))} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {entry[-2]}')
+                    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+            else:
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {value}')
+        for name, (help_text, read) in sorted(self._gauges.items()):
+            value = read()
+            if value is not None:
+                lines.extend((f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}'))
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+REGISTRY = Registry()
+
+
+@lru_cache(maxsize=1024)
+def classify(sql):
+    """Étiquettes (opération, table) d'une instruction SQL, ex. (('op', 'select'), ('table', 'transactions'))"""
+    words = sql.split(None, 1)
+    match = _TABLE_RE.search(sql)
+    return ('op', words[0].lower() if words else 'other'), ('table', match.group(1) if match else '')
+
+
+def observe_sql(sql, elapsed, rows, registry=REGISTRY):
+    labels = classify(sql)
+    registry.observe(SQL_DURATION, labels, elapsed, rows)
+    if elapsed >= registry.slow_query_seconds:
+        registry.inc('budget_sql_slow_queries_total', labels)
+        slow_query_log.warning('requête lente %.1f ms (%d lignes) : %s', elapsed * 1000, rows, ' '.join(sql.split()))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Curseur qui chronomètre chaque instruction jusqu'à la dernière ligne lue (ou sa fermeture)"""
+
+    _sql = None
+
+    def _start(self, sql, start):
+        if self.description is None:
+            # Écriture ou DDL : rien à lire, l'instruction est terminée
+            observe_sql(sql, time.perf_counter() - start, max(self.rowcount, 0))
+        else:
+            self._sql, self._elapsed, self._rows = sql, time.perf_counter() - start, 0
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            observe_sql(sql, self._elapsed, self._rows)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except BaseException:
+            observe_sql(sql, time.perf_counter() - start, 0)
+            raise
+        self._start(sql, start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except BaseException:
+            observe_sql(sql, time.perf_counter() - start, 0)
+            raise
+        self._start(sql, start)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            if row is None:
+                self._finish()
+            else:
+                self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += len(rows)
+            if len(rows) < size:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - start
+            self._rows += len(rows)
+            self._finish()
+        return rows
+
+    def __iter__(self):
+        # Lecture par blocs : le chronométrage coûte un appel par bloc et non par ligne
+        size = max(self.arraysize, ITER_CHUNK)
+        while True:
+            rows = self.fetchmany(size)
+            yield from rows
+            if len(rows) < size:
+                return
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Curseur abandonné avant la dernière ligne (ex. `conn.execute(...).fetchone()`)
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connexion sqlite3 dont les curseurs (y compris ceux de `execute()`) sont instrumentés"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return sqlite3.Connection.cursor(self, factory)
+
+    def execute(self, sql, parameters=()):
+        return sqlite3.Connection.cursor(self, InstrumentedCursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return sqlite3.Connection.cursor(self, InstrumentedCursor).executemany(sql, seq_of_parameters)
+
+
+def init_app(app, registry=REGISTRY):
+    """Chronomètre les requêtes de l'application et fixe le seuil des requêtes lentes (SLOW_QUERY_MS)"""
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+    if app.config['METRICS_ENABLED'] and not app.config.get('DB_CONNECTION_FACTORY'):
+        # Utilisée par db_pool pour ouvrir les connexions des requêtes
+        app.config['DB_CONNECTION_FACTORY'] = InstrumentedConnection
+    registry.slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None and app.config['METRICS_ENABLED']:
+            # Gabarit de route plutôt que l'URL, pour borner le nombre de séries
+            route = request.url_rule.rule if request.url_rule is not None else 'inconnue'
+            registry.observe('budget_http_request_duration_seconds',
+                             (('route', route), ('method', request.method), ('status', response.status_code)),
+                             time.perf_counter() - start)
+        return response
+
+
+def metrics_response(registry=REGISTRY):
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,90 @@
+"""Migrations versionnées du schéma SQLite.
+
+Chaque migration est une étape numérotée, idempotente, appliquée une seule fois
+dans l'ordre ; les versions appliquées sont enregistrées dans `schema_migrations`.
+`migrate()` met à niveau en place un `budget.db` existant, sans toucher aux
+transactions qu'il contient.
+"""
+import archive
+import jobs
+import ledger
+import ledger_cache
+import reports
+import search_index
+
+SCHEMA_TABLE = '''
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL DEFAULT (datetime('now'))
+)
+'''
+
+
+def _create_transactions(conn, table):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS "{table}" (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT
+        )
+    ''')
+
+
+def _add_booked_on(conn, table):
+    """Date de la transaction (AAAA-MM-JJ) et index couvrants pour les filtres par catégorie et par période"""
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')}
+    if 'booked_on' not in columns:
+        conn.execute(f'ALTER TABLE "{table}" ADD COLUMN booked_on TEXT')
+        # Date inconnue pour l'historique : on prend la date de la migration
+        conn.execute(f'UPDATE "{table}" SET booked_on = date(\'now\') WHERE booked_on IS NULL')
+    conn.executescript(f'''
+        CREATE TRIGGER IF NOT EXISTS "{table}_booked_on_default" AFTER INSERT ON "{table}"
+        WHEN NEW.booked_on IS NULL
+        BEGIN
+            UPDATE "{table}" SET booked_on = date('now') WHERE id = NEW.id;
+        END;
+        CREATE INDEX IF NOT EXISTS "idx_{table}_category_booked_on" ON "{table}" (category, booked_on, amount);
+        CREATE INDEX IF NOT EXISTS "idx_{table}_booked_on_amount" ON "{table}" (booked_on, amount);
+    ''')
+
+
+# (version, nom, fonction(conn, table)) ; ne jamais modifier une migration publiée, en ajouter une
+MIGRATIONS = [
+    (1, 'create_transactions', _create_transactions),
+    (2, 'ledger_totals', lambda conn, table: ledger.install_totals(conn, table)),
+    (3, 'fulltext_index', lambda conn, table: search_index.install_fts(conn, table)),
+    (4, 'booked_on_and_indexes', _add_booked_on),
+    (5, 'monthly_rollups', lambda conn, table: reports.install_rollups(conn, table)),
+    (6, 'mutation_log', lambda conn, table: ledger_cache.install_mutation_log(conn, table)),
+    (7, 'archive_partitions', lambda conn, table: archive.install_archive(conn, table)),
+    (8, 'jobs', lambda conn, table: jobs.install_jobs(conn, table)),
+    (9, 'mutation_log_skips_date_fill', lambda conn, table: ledger_cache.exclude_date_fill(conn, table)),
+]
+
+
+def current_version(conn):
+    conn.execute(SCHEMA_TABLE)
+    return conn.execute('SELECT IFNULL(MAX(version), 0) FROM schema_migrations').fetchone()[0]
+
+
+def pending(conn):
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m[0] > version]
+
+
+def migrate(conn, table='transactions', target=None, echo=None):
+    """Applique les migrations en attente (jusqu'à `target`) ; renvoie la liste des versions appliquées"""
+    applied = []
+    for version, name, step in pending(conn):
+        if target is not None and version > target:
+            break
+        if echo:
+            echo(f'→ migration {version} : {name}')
+        step(conn, table)
+        with conn:
+            conn.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+        applied.append(version)
+    return applied
+
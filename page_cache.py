@@ -0,0 +1,110 @@
+"""Templates précompilés et cache de pages avec ETag / GET conditionnel.
+
+`register_templates()` place les templates de l'application dans un `DictLoader`
+de l'environnement Jinja. Chacun est compilé au premier rendu, pas au démarrage,
+puis gardé dans le cache de l'environnement : `render_template(nom)` réutilise
+le template compilé au lieu de re-hacher le source à chaque requête comme
+`render_template_string`.
+
+`cached_page()` met en cache le corps des pages en lecture, indexé par l'URL et
+le compteur de version du ledger (incrémenté à chaque écriture). La réponse porte
+un ETag fort ; si le client renvoie le même dans `If-None-Match`, on répond 304
+sans rien rendre.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+from jinja2 import ChoiceLoader, DictLoader
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+def register_templates(app, templates):
+    """Ajoute des templates nommés à l'environnement Jinja de l'appli (compilés au premier rendu)"""
+    loader = app.jinja_loader
+    app.jinja_loader = ChoiceLoader([DictLoader(templates), loader]) if loader else DictLoader(templates)
+
+
+class ResponseCache:
+    """Cache LRU borné de corps de réponses, partagé entre les threads d'un worker"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'not_modified': self.not_modified}
+
+
+def make_etag(version, key):
+    return f'v{version}-{zlib.crc32(key.encode()):08x}'
+
+
+def cached_page(get_version, cache=None):
+    """Décorateur de vue : cache par (URL, version du ledger), ETag fort et réponses 304.
+
+    Les réponses en flux et les statuts autres que 200 ne sont pas mis en cache.
+    """
+    cache = cache if cache is not None else ResponseCache()
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = get_version()
+            key = request.full_path
+            etag = make_etag(version, key)
+            if request.if_none_match.contains(etag):
+                cache.record_not_modified()
+                response = Response(status=304)
+                response.set_etag(etag)
+                return response
+
+            entry = cache.get((key, version))
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = (response.get_data(), response.mimetype)
+                cache.put((key, version), entry)
+            body, mimetype = entry
+            response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+            # Le navigateur garde la page mais revalide à chaque visite (304 si le ledger n'a pas changé)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,240 @@
+"""Limitation de débit par client et contrôle d'admission des routes coûteuses (/search, /calculate).
+
+- Seau à jetons par (client, route) : `rate` jetons par seconde, au plus
+  `burst`. Chaque requête prend un jeton ; seau vide : 429 immédiat, avec
+  Retry-After (délai jusqu'au prochain jeton). Le client est l'adresse IP de la
+  requête ; derrière N proxys de confiance (RATE_LIMIT_TRUSTED_PROXIES = N),
+  c'est l'adresse que le plus externe a ajoutée à X-Forwarded-For. Sinon tous
+  les clients partageraient l'adresse du proxy, donc le même seau.
+- Les seaux sont gardés en mémoire du processus, ou dans un fichier SQLite
+  partagé par tous les workers gunicorn (RATE_LIMIT_STORE, de préférence sous
+  /dev/shm : mémoire partagée, sans écriture disque). Un UPSERT … RETURNING
+  remplit, prend le jeton et lit le résultat en une seule instruction atomique.
+- Admission : au plus `concurrency` requêtes simultanées par route et par
+  processus. Au-delà, une requête attend une place au plus `queue_timeout` s,
+  puis reçoit un 503 avec Retry-After. La charge excédentaire est refusée tout
+  de suite au lieu d'occuper tous les workers.
+- Les routes absentes de RATE_LIMITS ne passent par aucun des deux contrôles.
+- Refus comptés par route et par motif dans /metrics
+  (`budget_rate_limit_rejections_total`) ; admissions, attentes et requêtes en
+  cours dans /rate-limit-stats.
+
+Seaux et sémaphores sont créés à la première requête, dans le worker : rien
+n'est partagé de part et d'autre d'un fork, et ils sont compatibles avec gevent.
+"""
+import math
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, jsonify, request
+
+import metrics
+
+# Par gabarit de route : jetons par seconde, rafale, requêtes simultanées, attente maximale d'une place (s)
+DEFAULT_LIMITS = {
+    '/search': {'rate': 5.0, 'burst': 10, 'concurrency': 4, 'queue_timeout': 0.5},
+    '/calculate': {'rate': 5.0, 'burst': 10, 'concurrency': 2, 'queue_timeout': 0.5},
+    '/api/formula': {'rate': 5.0, 'burst': 10, 'concurrency': 2, 'queue_timeout': 0.5},
+}
+# Seaux inactifs depuis plus longtemps supprimés (ils seraient pleins de toute façon)
+IDLE_SECONDS = 3600
+PRUNE_EVERY = 10_000
+
+REJECTIONS = 'budget_rate_limit_rejections_total'
+metrics.METRICS[REJECTIONS] = ('counter', 'Requêtes refusées par la limitation de débit (429) ou l\'admission (503)')
+
+BUCKETS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    allowed INTEGER NOT NULL
+) WITHOUT ROWID
+'''
+
+# Remplissage depuis la dernière requête, borné à la rafale, puis prise d'un jeton s'il y en a un
+# (dans un UPDATE, les expressions lisent les valeurs d'avant la mise à jour)
+TAKE_SQL = '''
+INSERT INTO rate_buckets (key, tokens, updated, allowed) VALUES (:key, :burst - 1, :now, 1)
+ON CONFLICT (key) DO UPDATE SET
+    allowed = MIN(:burst, tokens + (:now - updated) * :rate) >= 1,
+    tokens = MIN(:burst, tokens + (:now - updated) * :rate) - (MIN(:burst, tokens + (:now - updated) * :rate) >= 1),
+    updated = :now
+RETURNING tokens, allowed
+'''
+
+
+class MemoryStore:
+    """Seaux du processus : {clé: (jetons, instant de mise à jour)}"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._takes = 0
+
+    def take(self, key, rate, burst, now):
+        """Prend un jeton ; renvoie 0 si la requête passe, sinon le délai (s) jusqu'au prochain jeton"""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - allowed, now)
+            self._takes += 1
+            if self._takes % PRUNE_EVERY == 0:
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < IDLE_SECONDS}
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SQLiteStore:
+    """Seaux partagés entre processus dans un fichier SQLite (une connexion par processus)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=5.0)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        # Seaux perdus en cas de coupure : sans conséquence, pas de synchronisation disque
+        self._conn.execute('PRAGMA synchronous = OFF')
+        self._conn.execute(BUCKETS_SCHEMA)
+        self._lock = threading.Lock()
+        self._takes = 0
+
+    def take(self, key, rate, burst, now):
+        """Prend un jeton ; renvoie 0 si la requête passe, sinon le délai (s) jusqu'au prochain jeton"""
+        with self._lock:
+            tokens, allowed = self._conn.execute(
+                TAKE_SQL, {'key': key, 'rate': rate, 'burst': burst, 'now': now}).fetchone()
+            self._takes += 1
+            if self._takes % PRUNE_EVERY == 0:
+                self._conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - IDLE_SECONDS,))
+        return 0.0 if allowed else (1 - tokens) / rate
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM rate_buckets').fetchone()[0]
+
+
+class Limiter:
+    """Seaux à jetons et sémaphores d'admission des routes limitées d'une application"""
+
+    def __init__(self, limits, store):
+        self.limits = limits
+        self.store = store
+        self._slots = {route: threading.BoundedSemaphore(limit['concurrency']) for route, limit in limits.items()}
+        self._lock = threading.Lock()
+        self._stats = {route: {'admitted': 0, 'rate_limited': 0, 'shed': 0, 'queued': 0, 'in_flight': 0,
+                               'waiting': 0} for route in limits}
+
+    def _count(self, route, **changes):
+        with self._lock:
+            stats = self._stats[route]
+            for name, delta in changes.items():
+                stats[name] += delta
+
+    def check_rate(self, route, client):
+        """0 si la requête passe, sinon le délai (s) avant de réessayer"""
+        limit = self.limits[route]
+        wait = self.store.take(f'{route} {client}', limit['rate'], limit['burst'], time.time())
+        if wait:
+            self._count(route, rate_limited=1)
+        return wait
+
+    def admit(self, route):
+        """Réserve une place d'exécution (attente bornée) ; False si la route est saturée"""
+        slots = self._slots[route]
+        if slots.acquire(blocking=False):
+            self._count(route, admitted=1, in_flight=1)
+            return True
+        self._count(route, waiting=1)
+        admitted = slots.acquire(timeout=self.limits[route]['queue_timeout'])
+        if admitted:
+            self._count(route, waiting=-1, admitted=1, queued=1, in_flight=1)
+        else:
+            self._count(route, waiting=-1, shed=1)
+        return admitted
+
+    def release(self, route):
+        self._slots[route].release()
+        self._count(route, in_flight=-1)
+
+    def stats(self):
+        with self._lock:
+            routes = {route: dict(stats, **self.limits[route]) for route, stats in self._stats.items()}
+        return {'store': getattr(self.store, 'path', 'memory'), 'buckets': len(self.store), 'routes': routes}
+
+
+def client_address(trusted_proxies=0):
+    """Adresse du client : N-ième depuis la fin de X-Forwarded-For derrière N proxys de confiance
+
+    Comme ProxyFix (x_for=N) : les entrées plus à gauche peuvent être forgées par le client. En-tête absent
+    ou plus court que N : adresse de la connexion.
+    """
+    if trusted_proxies:
+        forwarded = [address.strip() for address in request.headers.get('X-Forwarded-For', '').split(',')]
+        forwarded = [address for address in forwarded if address]
+        if len(forwarded) >= trusted_proxies:
+            return forwarded[-trusted_proxies]
+    return request.remote_addr
+
+
+def _reject(status, route, reason, retry_after, message):
+    metrics.REGISTRY.inc(REJECTIONS, (('route', route), ('reason', reason)))
+    response = jsonify({'error': message, 'retry_after': round(retry_after, 3)})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def init_app(app):
+    """Limites par route (RATE_LIMITS) et contrôles avant chaque requête ; désactivés si RATE_LIMIT est faux"""
+    app.config.setdefault('RATE_LIMIT', False)
+    app.config.setdefault('RATE_LIMITS', DEFAULT_LIMITS)
+    app.config.setdefault('RATE_LIMIT_STORE', None)
+    app.config.setdefault('RATE_LIMIT_TRUSTED_PROXIES', 0)
+    # Limiteur du processus, créé à la première requête limitée (voir get_limiter)
+    app.extensions['rate_limit'] = {}
+
+    @app.before_request
+    def limit_request():
+        route = request.url_rule.rule if request.url_rule is not None else None
+        limiter = get_limiter(app) if route in app.config['RATE_LIMITS'] else None
+        if limiter is None:
+            return None
+        wait = limiter.check_rate(route, client_address(app.config['RATE_LIMIT_TRUSTED_PROXIES']))
+        if wait:
+            return _reject(429, route, 'rate', wait, 'trop de requêtes, réessayez plus tard')
+        if not limiter.admit(route):
+            return _reject(503, route, 'concurrency', app.config['RATE_LIMITS'][route]['queue_timeout'],
+                           'serveur saturé, réessayez dans un instant')
+        g.rate_limit_slot = (limiter, route)
+        return None
+
+    @app.teardown_request
+    def release_slot(exc=None):
+        slot = g.pop('rate_limit_slot', None)
+        if slot is not None:
+            limiter, route = slot
+            limiter.release(route)
+
+
+def after_fork(app):
+    """Dans un processus enfant : seaux et sémaphores recréés à la première requête"""
+    app.extensions['rate_limit'] = {}
+
+
+def get_limiter(app=None):
+    """Limiteur de l'application, créé au premier usage ; None si la limitation est désactivée"""
+    app = app or current_app
+    if not app.config['RATE_LIMIT']:
+        return None
+    holder = app.extensions['rate_limit']
+    limiter = holder.get('limiter')
+    if limiter is None:
+        path = app.config['RATE_LIMIT_STORE']
+        # setdefault est atomique : des premières requêtes simultanées se partagent les mêmes sémaphores
+        limiter = holder.setdefault('limiter', Limiter(app.config['RATE_LIMITS'],
+                                                       SQLiteStore(path) if path else MemoryStore()))
+    return limiter
@@ -0,0 +1,228 @@
+"""Rapports mensuels servis par des agrégats matérialisés (« rollups »).
+
+La table `ledger_monthly_totals` contient, pour chaque (mois, catégorie), la
+somme des revenus, celle des dépenses et le nombre de transactions. Comme les
+agrégats de `ledger.py`, elle est tenue à jour par des triggers sur la table des
+transactions (et par un hook ensembliste pour `ledger.bulk_insert`). Un rapport
+lit au plus mois × catégories lignes : sa latence ne dépend pas de la taille du
+ledger.
+
+Le mois est `substr(booked_on, 1, 7)` (AAAA-MM) ; une date encore absente au
+moment du trigger compte pour la date du jour, comme le trigger par défaut de
+la migration 4.
+"""
+import re
+
+import ledger
+
+MONTH_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+ROLLUP_TABLE = '''
+CREATE TABLE IF NOT EXISTS ledger_monthly_totals (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    income REAL NOT NULL DEFAULT 0,
+    expense REAL NOT NULL DEFAULT 0,
+    row_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, category)
+) WITHOUT ROWID;
+'''
+
+ROLLUP_SCHEMA = ledger.BULK_SCHEMA + ROLLUP_TABLE + '''
+CREATE TRIGGER IF NOT EXISTS "{table}_monthly_insert" AFTER INSERT ON "{table}"
+WHEN NOT EXISTS (SELECT 1 FROM ledger_bulk_load)
+BEGIN
+{add_new}
+END;
+
+CREATE TRIGGER IF NOT EXISTS "{table}_monthly_delete" AFTER DELETE ON "{table}"
+BEGIN
+{remove_old}
+END;
+
+CREATE TRIGGER IF NOT EXISTS "{table}_monthly_update" AFTER UPDATE OF amount, category, booked_on ON "{table}"
+BEGIN
+{remove_old}
+{add_new}
+END;
+'''
+
+ADD_NEW = '''
+    INSERT INTO ledger_monthly_totals (month, category, income, expense, row_count)
+        VALUES (substr(IFNULL(NEW.booked_on, date('now')), 1, 7), IFNULL(NEW.category, ''),
+                MAX(NEW.amount, 0), MIN(NEW.amount, 0), 1)
+        ON CONFLICT (month, category) DO UPDATE SET
+            income = income + excluded.income,
+            expense = expense + excluded.expense,
+            row_count = row_count + 1;'''
+
+REMOVE_OLD = '''
+    UPDATE ledger_monthly_totals SET
+        income = income - MAX(OLD.amount, 0),
+        expense = expense - MIN(OLD.amount, 0),
+        row_count = row_count - 1
+    WHERE month = substr(IFNULL(OLD.booked_on, date('now')), 1, 7) AND category = IFNULL(OLD.category, '');
+    DELETE FROM ledger_monthly_totals
+    WHERE month = substr(IFNULL(OLD.booked_on, date('now')), 1, 7) AND category = IFNULL(OLD.category, '')
+        AND row_count <= 0;'''
+
+# Suppression qui laisse les rollups intacts sous le drapeau ledger_bulk_load (archivage, voir archive.py)
+DELETE_TRIGGER = '''
+DROP TRIGGER IF EXISTS "{table}_monthly_delete";
+
+CREATE TRIGGER "{table}_monthly_delete" AFTER DELETE ON "{table}"
+WHEN NOT EXISTS (SELECT 1 FROM ledger_bulk_load)
+BEGIN
+{remove_old}
+END;
+'''
+
+# Agrégation ensembliste des transactions (toutes, ou filtrées par `where`)
+ROLLUP_SELECT = '''
+    SELECT substr(IFNULL(booked_on, date('now')), 1, 7), IFNULL(category, ''),
+           SUM(MAX(amount, 0)), SUM(MIN(amount, 0)), COUNT(*)
+    FROM "{table}" {where} GROUP BY 1, 2
+'''
+
+MERGE_ROLLUP = '''
+INSERT INTO ledger_monthly_totals (month, category, income, expense, row_count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (month, category) DO UPDATE SET
+        income = income + excluded.income,
+        expense = expense + excluded.expense,
+        row_count = row_count + excluded.row_count
+'''
+
+BULK_ROLLUPS = '''
+INSERT INTO ledger_monthly_totals (month, category, income, expense, row_count)
+''' + ROLLUP_SELECT.format(table='{table}', where='WHERE id > ?') + '''
+    ON CONFLICT (month, category) DO UPDATE SET
+        income = income + excluded.income,
+        expense = expense + excluded.expense,
+        row_count = row_count + excluded.row_count
+'''
+
+# Fonctions source(conn) -> lignes (mois, catégorie, revenus, dépenses, nombre) des transactions
+# tenues hors de la table (ex. partitions d'archive), ajoutées aux recalculs complets
+_rollup_sources = []
+
+
+def register_rollup_source(source):
+    """Ajoute une source de rollups de transactions stockées hors de la table (voir rebuild_rollups)"""
+    if source not in _rollup_sources:
+        _rollup_sources.append(source)
+
+
+def install_rollups(conn, table='transactions'):
+    """Crée la table des rollups et ses triggers (idempotent), puis la remplit si besoin"""
+    fresh = not has_rollups(conn)
+    conn.executescript(ROLLUP_SCHEMA.format(table=table, add_new=ADD_NEW, remove_old=REMOVE_OLD))
+    if fresh:
+        rebuild_rollups(conn, table)
+
+
+def has_rollups(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ledger_monthly_totals'"
+    ).fetchone() is not None
+
+
+def install_bulk_delete(conn, table='transactions'):
+    """Remplace le trigger de suppression par DELETE_TRIGGER (ignoré sous le drapeau ledger_bulk_load)"""
+    conn.executescript(DELETE_TRIGGER.format(table=table, remove_old=REMOVE_OLD))
+
+
+def rebuild_rollups(conn, table='transactions'):
+    """Recalcule les rollups à partir de la table des transactions et des sources externes
+    (reprise d'historique, backfill)"""
+    with conn:
+        conn.execute('DELETE FROM ledger_monthly_totals')
+        conn.execute('INSERT INTO ledger_monthly_totals (month, category, income, expense, row_count) '
+                     + ROLLUP_SELECT.format(table=table, where=''))
+        for source in _rollup_sources:
+            conn.executemany(MERGE_ROLLUP, list(source(conn)))
+        conn.execute('UPDATE ledger_totals SET version = version + 1 WHERE id = 1')
+    return conn.execute('SELECT COUNT(*) FROM ledger_monthly_totals').fetchone()[0]
+
+
+def apply_bulk_rollups(conn, first_id, table='transactions'):
+    """Ajoute en une passe les lignes d'id > first_id (imports en masse, voir ledger.bulk_insert)"""
+    if has_rollups(conn):
+        conn.execute(BULK_ROLLUPS.format(table=table), (first_id,))
+
+
+ledger.register_bulk_hook(apply_bulk_rollups)
+
+
+def verify_rollups(conn, table='transactions'):
+    """Compare les rollups à un recalcul complet ; renvoie la liste des écarts"""
+    expected = {}
+    rows = [conn.execute(ROLLUP_SELECT.format(table=table, where=''))] + [source(conn) for source in _rollup_sources]
+    for month, category, income, expense, count in (row for source in rows for row in source):
+        want = expected.get((month, category), (0.0, 0.0, 0))
+        expected[month, category] = (want[0] + income, want[1] + expense, want[2] + count)
+    actual = {(m, c): (i, e, n) for m, c, i, e, n in conn.execute(
+        'SELECT month, category, income, expense, row_count FROM ledger_monthly_totals')}
+    errors = []
+    for key in sorted(set(expected) | set(actual)):
+        want, got = expected.get(key), actual.get(key)
+        if (want is None or got is None or want[2] != got[2]
+                or any(abs(w - g) > ledger.TOLERANCE for w, g in zip(want[:2], got[:2]))):
+            errors.append(f"{key[0]} / {key[1]!r} : attendu {want}, trouvé {got}")
+    return errors
+
+
+def parse_filters(args):
+    """Filtres de rapport : since / until (AAAA-MM, inclus) et category"""
+    filters = {}
+    for key in ('since', 'until'):
+        value = args.get(key)
+        if value not in (None, ''):
+            if not MONTH_RE.match(value):
+                raise ValueError(f'{key} doit être un mois AAAA-MM')
+            filters[key] = value
+    if args.get('category'):
+        filters['category'] = args.get('category')
+    return filters
+
+
+def monthly_report(conn, filters=None):
+    """Dépenses et revenus par catégorie et par mois, bilan mensuel et solde cumulé"""
+    filters = filters or {}
+    clauses, params = [], []
+    if 'category' in filters:
+        clauses.append('category = ?')
+        params.append(filters['category'])
+    # Solde de départ : tout ce qui précède la période (lu dans les rollups, pas dans les transactions)
+    opening = 0.0
+    if 'since' in filters:
+        opening = conn.execute(
+            'SELECT IFNULL(SUM(income + expense), 0) FROM ledger_monthly_totals WHERE month < ?'
+            + ''.join(f' AND {clause}' for clause in clauses), [filters['since']] + params
+        ).fetchone()[0]
+        clauses.append('month >= ?')
+        params.append(filters['since'])
+    if 'until' in filters:
+        clauses.append('month <= ?')
+        params.append(filters['until'])
+    where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+
+    by_category = []
+    months = {}
+    for month, category, income, expense, count in conn.execute(
+            'SELECT month, category, income, expense, row_count FROM ledger_monthly_totals'
+            + where + ' ORDER BY month, category', params):
+        by_category.append({'month': month, 'category': category, 'income': round(income, 2),
+                            'expense': round(expense, 2), 'count': count})
+        totals = months.setdefault(month, [0.0, 0.0, 0])
+        totals[0] += income
+        totals[1] += expense
+        totals[2] += count
+
+    balance = opening
+    timeline = []
+    for month, (income, expense, count) in months.items():
+        balance += income + expense
+        timeline.append({'month': month, 'income': round(income, 2), 'expense': round(expense, 2),
+                         'net': round(income + expense, 2), 'count': count, 'balance': round(balance, 2)})
+    return {'filters': filters, 'opening_balance': round(opening, 2), 'months': timeline,
+            'by_category': by_category}
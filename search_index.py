@@ -0,0 +1,141 @@
+"""Index plein texte (SQLite FTS5) sur la description et la catégorie des transactions.
+
+La table virtuelle `<table>_fts` est un index « external content » : elle ne
+duplique pas les données et reste synchronisée avec la table des transactions par
+triggers. La recherche est classée (bm25), accepte les préfixes (`cour` trouve
+« Courses ») et ignore les accents. Pour borner le coût des termes très fréquents,
+le classement porte sur les `RANK_WINDOW` correspondances les plus récentes.
+Si SQLite est compilé sans FTS5, on retombe sur un `LIKE` paramétré.
+"""
+import re
+import sqlite3
+
+import ledger
+
+DEFAULT_LIMIT = 100
+RANK_WINDOW = 1000
+
+FTS_SCHEMA = ledger.BULK_SCHEMA + '''
+CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5(
+    description, category,
+    content='{table}', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS "{fts}_insert" AFTER INSERT ON "{table}"
+WHEN NOT EXISTS (SELECT 1 FROM ledger_bulk_load)
+BEGIN
+    INSERT INTO "{fts}" (rowid, description, category) VALUES (NEW.id, NEW.description, NEW.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS "{fts}_delete" AFTER DELETE ON "{table}" BEGIN
+    INSERT INTO "{fts}" ("{fts}", rowid, description, category) VALUES ('delete', OLD.id, OLD.description, OLD.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS "{fts}_update" AFTER UPDATE OF description, category ON "{table}" BEGIN
+    INSERT INTO "{fts}" ("{fts}", rowid, description, category) VALUES ('delete', OLD.id, OLD.description, OLD.category);
+    INSERT INTO "{fts}" (rowid, description, category) VALUES (NEW.id, NEW.description, NEW.category);
+END;
+'''
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Ids des `RANK_WINDOW` correspondances les plus récentes, avec leur score bm25
+RANKED_IDS = 'SELECT rowid, rank FROM "{fts}" WHERE "{fts}" MATCH ? ORDER BY rowid DESC LIMIT ?'
+
+
+def fts_table(table='transactions'):
+    return f'{table}_fts'
+
+
+def install_fts(conn, table='transactions'):
+    """Crée l'index FTS5 et ses triggers (idempotent) ; renvoie False si FTS5 est indisponible"""
+    fts = fts_table(table)
+    fresh = not has_fts(conn, table)
+    try:
+        conn.executescript(FTS_SCHEMA.format(table=table, fts=fts))
+    except sqlite3.OperationalError as e:
+        if 'fts5' in str(e):
+            return False
+        raise
+    if fresh:
+        rebuild_fts(conn, table)
+    return True
+
+
+def rebuild_fts(conn, table='transactions'):
+    """Reconstruit l'index à partir de la table des transactions"""
+    fts = fts_table(table)
+    with conn:
+        conn.execute(f'INSERT INTO "{fts}" ("{fts}") VALUES (\'rebuild\')')
+
+
+def optimize_fts(conn, table='transactions'):
+    """Fusionne les segments de l'index et purge les entrées supprimées (après une suppression en masse)"""
+    if has_fts(conn, table):
+        fts = fts_table(table)
+        with conn:
+            conn.execute(f'INSERT INTO "{fts}" ("{fts}") VALUES (\'optimize\')')
+
+
+def index_new_rows(conn, first_id, table='transactions'):
+    """Indexe en une passe les lignes d'id > first_id (imports en masse, voir ledger.bulk_insert)"""
+    if has_fts(conn, table):
+        fts = fts_table(table)
+        conn.execute(
+            f'INSERT INTO "{fts}" (rowid, description, category) '
+            f'SELECT id, description, category FROM "{table}" WHERE id > ?', (first_id,)
+        )
+
+
+ledger.register_bulk_hook(index_new_rows)
+
+
+def has_fts(conn, table='transactions'):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table(table),)
+    ).fetchone() is not None
+
+
+def match_expression(query):
+    """Traduit une saisie libre en requête FTS5 : chaque mot devient un préfixe, tous requis"""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+def search(conn, query, limit=DEFAULT_LIMIT, table='transactions', vocabulary=None):
+    """Transactions correspondant à `query`, les plus pertinentes d'abord (au plus `limit`)
+
+    `vocabulary` (ex. suggest.PrefixIndex) écarte sans requête SQL les saisies dont
+    un mot n'est le préfixe d'aucun terme indexé.
+    """
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    if has_fts(conn, table):
+        expression = match_expression(query)
+        if not expression or (vocabulary is not None and not vocabulary.matches(query)):
+            return []
+        fts = fts_table(table)
+        return cursor.execute(
+            f'SELECT t.id, t.description, t.amount, t.category FROM ({RANKED_IDS.format(fts=fts)}) f '
+            f'JOIN "{table}" t ON t.id = f.rowid ORDER BY f.rank LIMIT ?',
+            (expression, max(limit, RANK_WINDOW), limit)
+        ).fetchall()
+    return cursor.execute(
+        f'SELECT id, description, amount, category FROM "{table}" '
+        f'WHERE description LIKE ? ORDER BY id DESC LIMIT ?',
+        (f'%{query}%', limit)
+    ).fetchall()
+
+
+def search_ids(conn, query, limit=DEFAULT_LIMIT, table='transactions', vocabulary=None):
+    """Ids des transactions correspondant à `query`, classés, sans lire la table ; None sans FTS5"""
+    if not has_fts(conn, table):
+        return None
+    expression = match_expression(query)
+    if not expression or (vocabulary is not None and not vocabulary.matches(query)):
+        return []
+    rows = conn.execute(
+        f'SELECT rowid FROM ({RANKED_IDS.format(fts=fts_table(table))}) ORDER BY rank LIMIT ?',
+        (expression, max(limit, RANK_WINDOW), limit)
+    )
+    return [row[0] for row in rows]
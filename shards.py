@@ -0,0 +1,227 @@
+"""Un ledger par locataire (compte), chacun dans son propre fichier SQLite.
+
+Avec une seule base, tous les utilisateurs se disputent l'unique verrou
+d'écriture. Ici :
+
+- Le routeur choisit le shard de chaque requête d'après le locataire (en-tête
+  `X-Tenant` ou `?tenant=`). Sans locataire, c'est la base principale
+  (`DATABASE`) : le comportement reste celui d'avant.
+- Chaque shard est un fichier `<SHARDS_DIR>/<locataire>.db`. Il est créé et mis
+  à niveau par les migrations au premier accès.
+- Les écritures de locataires différents ne se bloquent plus : le débit
+  d'écriture suit le nombre de locataires actifs.
+
+Les shards ouverts sont gardés dans un LRU borné (`SHARD_MAX_OPEN`). Chacun a
+son petit pool de connexions et ses structures en mémoire (cache du ledger,
+index de suggestions, voir `db_pool.extensions()`). Au-delà du plafond, le
+moins récemment utilisé est fermé ; une connexion encore empruntée est fermée
+à sa restitution.
+
+Les requêtes d'administration sur tous les locataires (ex. totaux globaux)
+sont réparties sur un pool de threads. Chaque tâche ouvre sa propre connexion
+pour ne pas évincer les shards chauds du LRU.
+"""
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, has_request_context, jsonify, request
+
+import db_pool
+import migrations
+
+DEFAULT_TENANT = 'default'
+TENANT_HEADER = 'X-Tenant'
+TENANT_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+DEFAULT_MAX_OPEN = 64
+DEFAULT_POOL_SIZE = 2
+DEFAULT_FANOUT_WORKERS = 8
+
+
+class InvalidTenant(ValueError):
+    """Nom de locataire refusé (caractères autorisés : lettres, chiffres, - et _)"""
+
+
+class Shard:
+    """Base d'un locataire : pool de connexions et structures en mémoire associées"""
+
+    def __init__(self, tenant, database, pool):
+        self.tenant = tenant
+        self.database = database
+        self.pool = pool
+        self.extensions = {}
+
+    def close(self):
+        self.pool.close()
+        # Structures qui tiennent un thread ou une connexion (diffuseur du flux en direct) : arrêtées avec le shard
+        for extension in [self.extensions.pop('live', None), *self.extensions.values()]:
+            close = getattr(extension, 'close', None)
+            if close is not None:
+                close()
+        self.extensions.clear()
+
+
+class ShardRouter:
+    """Associe un locataire à son fichier SQLite et garde les shards ouverts dans un LRU borné"""
+
+    def __init__(self, directory, default_database, max_open=DEFAULT_MAX_OPEN, pool_size=DEFAULT_POOL_SIZE,
+                 timeout=db_pool.DEFAULT_TIMEOUT, factory=sqlite3.Connection, table='transactions'):
+        self.directory = directory
+        self.default_database = default_database
+        self.max_open = max_open
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.factory = factory
+        self.table = table
+        self._open = OrderedDict()
+        self._migrated = set()
+        self._opening = {}  # locataire -> verrou de sa première migration
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'hits': 0, 'evicted': 0}
+
+    def database_for(self, tenant):
+        if tenant == DEFAULT_TENANT:
+            return self.default_database
+        if not TENANT_RE.match(tenant):
+            raise InvalidTenant(f'locataire invalide {tenant!r}')
+        return os.path.join(self.directory, f'{tenant}.db')
+
+    def shard(self, tenant):
+        """Shard ouvert du locataire (créé et migré au premier accès), marqué le plus récemment utilisé"""
+        with self._lock:
+            shard = self._hit(tenant)
+            if shard is not None:
+                return shard
+            database = self.database_for(tenant)
+            # Verrou propre au locataire : sa première migration ne bloque pas les requêtes des autres
+            opening = None if database in self._migrated else self._opening.setdefault(tenant, threading.Lock())
+        if opening is not None:
+            with opening:
+                if database not in self._migrated:
+                    self._migrate(database)
+        with self._lock:
+            self._opening.pop(tenant, None)
+            shard = self._hit(tenant)
+            if shard is not None:
+                return shard
+            shard = Shard(tenant, database,
+                          db_pool.ConnectionPool(database, self.pool_size, self.timeout, self.factory))
+            self._open[tenant] = shard
+            self._stats['opened'] += 1
+            evicted = []
+            while len(self._open) > self.max_open:
+                evicted.append(self._open.popitem(last=False)[1])
+                self._stats['evicted'] += 1
+        # Fermeture hors verrou : elle attend l'arrêt des threads du shard (diffuseur du flux en direct)
+        for old in evicted:
+            old.close()
+        return shard
+
+    def _hit(self, tenant):
+        shard = self._open.get(tenant)
+        if shard is not None:
+            self._open.move_to_end(tenant)
+            self._stats['hits'] += 1
+        return shard
+
+    def _migrate(self, database):
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+        conn = db_pool.configure_connection(sqlite3.connect(database))
+        try:
+            migrations.migrate(conn, self.table)
+        finally:
+            conn.close()
+        with self._lock:
+            self._migrated.add(database)
+
+    def current(self):
+        """Shard du locataire de la requête courante (la base principale hors requête)"""
+        tenant = g.get('tenant', DEFAULT_TENANT) if has_request_context() else DEFAULT_TENANT
+        return self.shard(tenant)
+
+    def tenants(self):
+        """Locataires connus : la base principale et les fichiers du répertoire des shards"""
+        names = [DEFAULT_TENANT]
+        if os.path.isdir(self.directory):
+            names += sorted(name[:-3] for name in os.listdir(self.directory)
+                            if name.endswith('.db') and TENANT_RE.match(name[:-3]))
+        return names
+
+    def fan_out(self, fn, tenants=None, workers=DEFAULT_FANOUT_WORKERS):
+        """Applique `fn(conn)` à chaque locataire en parallèle ; renvoie {locataire: résultat}"""
+        def run(tenant):
+            conn = db_pool.configure_connection(sqlite3.connect(self.database_for(tenant)))
+            try:
+                return tenant, fn(conn)
+            finally:
+                conn.close()
+
+        tenants = self.tenants() if tenants is None else tenants
+        with ThreadPoolExecutor(max(1, min(workers, len(tenants)))) as executor:
+            return dict(executor.map(run, tenants))
+
+    def close(self):
+        with self._lock:
+            for shard in self._open.values():
+                shard.close()
+            self._open.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, open=len(self._open), max_open=self.max_open,
+                        in_use=sum(shard.pool.stats()['in_use'] for shard in self._open.values()))
+
+
+def init_app(app, table='transactions'):
+    """Active le routage par locataire si SHARDS_DIR est défini (SHARD_MAX_OPEN, SHARD_POOL_SIZE)"""
+    app.config.setdefault('SHARDS_DIR', None)
+    app.config.setdefault('SHARD_MAX_OPEN', DEFAULT_MAX_OPEN)
+    app.config.setdefault('SHARD_POOL_SIZE', DEFAULT_POOL_SIZE)
+    app.config.setdefault('SHARD_FANOUT_WORKERS', DEFAULT_FANOUT_WORKERS)
+    app.config.setdefault('SHARD_TABLE', table)
+    app.extensions['shard_router'] = None
+    if app.config['SHARDS_DIR']:
+        enable(app)
+
+    @app.before_request
+    def resolve_tenant():
+        if app.extensions.get('shard_router') is None:
+            return None
+        tenant = request.headers.get(TENANT_HEADER) or request.args.get('tenant') or DEFAULT_TENANT
+        if not TENANT_RE.match(tenant):
+            return jsonify({'error': f'locataire invalide {tenant!r}'}), 400
+        g.tenant = tenant
+        return None
+
+
+def enable(app):
+    """(Re)crée le routeur d'après la configuration courante (SHARDS_DIR, DATABASE) ; le renvoie"""
+    router = app.extensions.get('shard_router')
+    if router is not None:
+        router.close()
+    router = app.extensions['shard_router'] = ShardRouter(
+        app.config['SHARDS_DIR'], app.config['DATABASE'], app.config['SHARD_MAX_OPEN'],
+        app.config['SHARD_POOL_SIZE'], app.config['DB_POOL_TIMEOUT'], db_pool.connection_factory(app),
+        app.config['SHARD_TABLE'])
+    return router
+
+
+def after_fork(app):
+    """Dans un processus enfant : routeur neuf, les shards (et leurs connexions) hérités sont écartés sans être fermés"""
+    router = app.extensions.get('shard_router')
+    if router is not None:
+        db_pool.keep_inherited(router)
+        app.extensions['shard_router'] = None
+        enable(app)
+
+
+def get_router(app=None):
+    """Routeur de l'application ; None si le routage par locataire est désactivé"""
+    return (app or current_app).extensions.get('shard_router')
+
+
+def current_tenant():
+    return g.get('tenant', DEFAULT_TENANT)
@@ -0,0 +1,253 @@
+"""Suggestions de recherche à la frappe : index de préfixes en mémoire et cache des préfixes chauds.
+
+L'index garde, en listes triées parcourues par `bisect`, les termes normalisés
+comme par le tokenizer FTS5 (minuscules, sans accents) avec leur forme
+d'affichage et leur nombre d'occurrences :
+
+- les mots des descriptions ;
+- les catégories complètes ;
+- les nombres, pour la seule vérification des préfixes, jamais suggérés.
+
+Il est construit une fois depuis la table des transactions, puis tenu à jour
+comme `ledger_cache` : à chaque accès, si la version du ledger a changé, seules
+les lignes d'id supérieur au dernier id indexé sont lues. Une modification ou
+une suppression provoque une reconstruction.
+
+Les réponses sont gardées dans un cache LRU à durée de vie (TTL), indexé par
+préfixe et par version de l'index. `search_index.search()` réutilise l'index
+(`matches()`) : une requête dont un mot n'est le préfixe d'aucun terme indexé
+n'a pas de résultat, sans interroger SQLite.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from flask import current_app
+
+import db_pool
+import ledger_cache
+import search_index
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Au-delà, les termes d'un préfixe très court ne sont pas tous classés
+MAX_SCAN = 5000
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 30.0
+BUILD_BATCH_SIZE = 10_000
+
+
+@lru_cache(maxsize=65536)
+def normalize(text):
+    """Forme de recherche d'un texte : minuscules et sans accents (tokenizer FTS5 `remove_diacritics`)"""
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class _Terms:
+    """Termes normalisés triés, avec forme d'affichage et nombre d'occurrences"""
+
+    def __init__(self):
+        self.keys = []
+        self.display = {}
+        self.counts = {}
+
+    def add_counts(self, counts):
+        """Ajoute {forme brute: nombre} ; les nouvelles clés sont fusionnées en un seul tri"""
+        new_keys = []
+        for text, count in counts.items():
+            key = normalize(text)
+            if key not in self.counts:
+                new_keys.append(key)
+                self.counts[key] = 0
+                self.display[key] = text
+            self.counts[key] += count
+        if len(new_keys) > 1:
+            self.keys.extend(new_keys)
+            self.keys.sort()
+        elif new_keys:
+            insort(self.keys, new_keys[0])
+
+    def has_prefix(self, prefix):
+        i = bisect_left(self.keys, prefix)
+        return i < len(self.keys) and self.keys[i].startswith(prefix)
+
+    def top(self, prefix, limit):
+        """Les `limit` termes commençant par `prefix`, les plus fréquents d'abord"""
+        keys, counts = self.keys, self.counts
+        i = bisect_left(keys, prefix)
+        candidates = []
+        while i < len(keys) and keys[i].startswith(prefix) and len(candidates) < MAX_SCAN:
+            candidates.append(keys[i])
+            i += 1
+        return [(self.display[key], counts[key]) for key in heapq.nsmallest(
+            limit, candidates, key=lambda key: (-counts[key], key))]
+
+
+class PrefixIndex:
+    """Index de préfixes des descriptions et catégories d'une table, rafraîchi d'après la version du ledger"""
+
+    def __init__(self, table='transactions'):
+        self.table = table
+        self._state = None
+        self._last_id = 0
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.words, self.numbers, self.categories = _Terms(), _Terms(), _Terms()
+        self._last_id = 0
+
+    def sync(self, conn):
+        """Indexe les transactions ajoutées depuis le dernier accès ; renvoie l'index"""
+        if ledger_cache.read_state(conn) != self._state:
+            with self._lock, ledger_cache.read_snapshot(conn):
+                state = ledger_cache.read_state(conn)
+                if state != self._state:
+                    if self._state is None or state[2] != self._state[2]:
+                        self._reset()
+                    self._index_rows(conn)
+                    self._state = state
+        return self
+
+    def _index_rows(self, conn):
+        words, categories = Counter(), Counter()
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(f'SELECT id, description, category FROM "{self.table}" WHERE id > ? ORDER BY id',
+                       (self._last_id,))
+        findall = search_index.TOKEN_RE.findall
+        while True:
+            rows = cursor.fetchmany(BUILD_BATCH_SIZE)
+            if not rows:
+                break
+            # Un seul passage de l'expression régulière par lot plutôt qu'un par ligne
+            words.update(findall(' '.join([row[1] for row in rows])))
+            categories.update(row[2] for row in rows if row[2])
+            self._last_id = rows[-1][0]
+        cursor.close()
+        # Les mots des catégories sont indexés par FTS5 comme ceux des descriptions
+        for category, count in categories.items():
+            for word in findall(category):
+                words[word] += count
+        # Comptage sur les formes brutes, normalisation une fois par terme distinct
+        self.words.add_counts({word: count for word, count in words.items() if not word.isdigit()})
+        self.numbers.add_counts({word: count for word, count in words.items() if word.isdigit()})
+        self.categories.add_counts(categories)
+
+    @property
+    def version(self):
+        return self._state and self._state[0]
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Catégories puis mots commençant par `prefix` (normalisé), les plus fréquents d'abord"""
+        key = normalize(prefix.strip())
+        if not key:
+            return []
+        with self._lock:
+            categories = self.categories.top(key, limit)
+            words = self.words.top(key, limit + len(categories))
+        seen = {normalize(text) for text, _ in categories}
+        suggestions = [{'text': text, 'kind': 'category', 'count': count} for text, count in categories]
+        suggestions += [{'text': text, 'kind': 'word', 'count': count}
+                        for text, count in words if normalize(text) not in seen]
+        return suggestions[:limit]
+
+    def matches(self, query):
+        """Faux si un mot de `query` n'est le préfixe d'aucun terme indexé (la recherche FTS5 serait vide)"""
+        with self._lock:
+            return all(self.words.has_prefix(key) or self.numbers.has_prefix(key)
+                       for key in map(normalize, search_index.TOKEN_RE.findall(query)))
+
+    def stats(self):
+        return {'words': len(self.words.keys), 'numbers': len(self.numbers.keys),
+                'categories': len(self.categories.keys), 'last_id': self._last_id, 'version': self.version}
+
+
+class TTLCache:
+    """Cache LRU borné dont les entrées expirent après `ttl` secondes"""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def init_app(app, table='transactions'):
+    """Déclare l'index de suggestions de l'application et son cache (SUGGEST_CACHE_SIZE, SUGGEST_CACHE_TTL)"""
+    app.config.setdefault('SUGGEST_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    app.config.setdefault('SUGGEST_CACHE_TTL', DEFAULT_CACHE_TTL)
+    app.config.setdefault('SUGGEST_TABLE', table)
+    app.extensions['suggest'] = None
+
+
+def get_index(conn, app=None):
+    """Index de l'application, construit au premier usage puis synchronisé avec la base"""
+    app = app or current_app
+    # Un index par base : par shard si le routage par locataire est actif
+    store = db_pool.extensions(app)
+    index = store.get('suggest')
+    database = app.config.get('DATABASE') or app.config.get('SQLALCHEMY_DATABASE_URI')
+    if index is None or index.database != database:
+        index = PrefixIndex(app.config['SUGGEST_TABLE'])
+        index.database = database
+        index.cache = TTLCache(app.config['SUGGEST_CACHE_SIZE'], app.config['SUGGEST_CACHE_TTL'])
+        store['suggest'] = index
+    return index.sync(conn)
+
+
+def warm_index(conn, app=None):
+    """Index déjà construit pour la base courante, synchronisé ; None s'il ne l'a pas encore été
+
+    Pour les usages où l'index n'est qu'un raccourci (vocabulaire de /search) : sa
+    construction, plusieurs secondes sur un gros ledger, reste payée par
+    /api/search/suggest ou par le préchauffage (WARMUP).
+    """
+    app = app or current_app
+    index = db_pool.extensions(app).get('suggest')
+    database = app.config.get('DATABASE') or app.config.get('SQLALCHEMY_DATABASE_URI')
+    if index is None or index.database != database:
+        return None
+    return index.sync(conn)
+
+
+def cached_suggest(conn, prefix, limit=DEFAULT_LIMIT, app=None):
+    """Suggestions pour `prefix`, servies par le cache TTL tant que l'index n'a pas changé"""
+    index = get_index(conn, app)
+    key = (normalize(prefix.strip()), limit, index.version)
+    suggestions = index.cache.get(key)
+    if suggestions is None:
+        suggestions = index.suggest(prefix, limit)
+        index.cache.put(key, suggestions)
+    return suggestions
+
+
+def parse_limit(args):
+    return max(1, min(args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
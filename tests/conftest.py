@@ -0,0 +1,33 @@
+"""Fixtures partagées : application app.py sur une base temporaire migrée (`python -m pytest -q`, pytest requis)"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import app as budget_app  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / 'budget.db')
+
+
+@pytest.fixture
+def app(database):
+    """Application neuve sur une base migrée et remplie des transactions de démonstration"""
+    application = budget_app.create_app({'DATABASE': database, 'TESTING': True})
+    budget_app.init_db(application)
+    yield application
+    for name in ('write_queue', 'shard_router'):
+        extension = application.extensions.get(name)
+        if extension is not None:
+            extension.close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,32 @@
+import threading
+import time
+
+import db_pool
+
+
+def test_concurrent_first_requests_share_one_pool(app, monkeypatch):
+    created = []
+    original = db_pool.ConnectionPool.__init__
+
+    def slow_init(self, *args, **kwargs):
+        # Sans verrou, chaque thread construirait son propre pool pendant cette attente
+        created.append(self)
+        time.sleep(0.05)
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(db_pool.ConnectionPool, '__init__', slow_init)
+    pools = []
+    threads = [threading.Thread(target=lambda: pools.append(db_pool.get_pool(app))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1
+    assert all(pool is created[0] for pool in pools)
+
+
+def test_after_fork_drops_pool_and_lock(app):
+    db_pool.get_pool(app)
+    assert 'db_pool_lock' in app.extensions
+    db_pool.after_fork(app)
+    assert app.extensions['db_pool'] is None and 'db_pool_lock' not in app.extensions
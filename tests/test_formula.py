@@ -0,0 +1,66 @@
+import pytest
+
+import formula
+
+BACKENDS = ['numpy', 'array'] if formula.numpy_module() is not None else ['array']
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('text', ['2 ** amount', 'amount ** 2', 'amount ** amount', '-amount / 2'])
+def test_batch_on_empty_column(backend, text):
+    assert list(formula.evaluate_batch(text, [], backend=backend)) == []
+
+
+def test_api_rows_on_empty_category(client):
+    response = client.post('/api/formula', json={'formula': '2**amount', 'mode': 'rows', 'category': 'Nope'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['count'] == 0 and body['rows'] == []
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_summarize_column(backend):
+    results = formula.evaluate_batch('amount * 2', [1.5, -3.0, 4.0], backend=backend)
+    summary = formula.summarize_column(results)
+    assert summary == (5.0, -6.0, 8.0) and all(type(value) is float for value in summary)
+    assert formula.summarize_column(formula.evaluate_batch('amount', [], backend=backend)) == (0.0, None, None)
+
+
+def test_api_rows_aggregates(client):
+    body = client.post('/api/formula', json={'formula': 'amount', 'mode': 'rows'}).get_json()
+    amounts = [row['amount'] for row in body['rows']]
+    assert body['count'] == len(amounts)
+    assert body['sum'] == pytest.approx(sum(amounts))
+    assert (body['min'], body['max']) == (min(amounts), max(amounts))
+
+
+@pytest.mark.parametrize('text', [
+    '1' + '+1' * formula.MAX_LENGTH,
+    '(' * (formula.MAX_DEPTH + 1) + '1' + ')' * (formula.MAX_DEPTH + 1),
+    f'2 ** {formula.MAX_EXPONENT + 1}',
+    '1e15 * 10',
+    '1 / 0',
+    '__import__("os")',
+])
+def test_scalar_limits(text):
+    with pytest.raises(formula.FormulaError):
+        formula.evaluate(text)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('text, amounts', [
+    (f'amount ** {formula.MAX_EXPONENT + 1}', [2.0]),
+    ('2 ** amount', [float(formula.MAX_EXPONENT + 1)]),
+    ('amount * 1e10', [1e6]),
+    ('1 / amount', [1.0, 0.0]),
+])
+def test_batch_limits(backend, text, amounts):
+    with pytest.raises(formula.FormulaError):
+        formula.evaluate_batch(text, amounts, backend=backend)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_batch_matches_scalar(backend):
+    amounts = [-12.5, 0.0, 3.0, 1500.25]
+    results = formula.evaluate_batch('amount * 2 - 1', amounts, backend=backend)
+    assert [float(value) for value in results] == [formula.evaluate(f'{amount} * 2 - 1') for amount in amounts]
@@ -0,0 +1,78 @@
+import sqlite3
+
+import pytest
+
+import jobs
+
+
+def latest_job(database):
+    conn = sqlite3.connect(database)
+    try:
+        return jobs.recent(conn, 1)[0]
+    finally:
+        conn.close()
+
+
+def test_cli_rejects_param_without_value(app):
+    result = app.test_cli_runner().invoke(args=['submit-job', 'export', '-p', 'gzip'])
+    assert result.exit_code != 0 and "'gzip' : clé=valeur attendu" in result.output
+
+
+def test_cli_submits_params(app, database):
+    result = app.test_cli_runner().invoke(args=['submit-job', 'export', '-p', 'format=jsonl', '-p', 'category=Loisirs'])
+    assert result.exit_code == 0, result.output
+    assert latest_job(database)['params'] == {'format': 'jsonl', 'category': 'Loisirs'}
+
+
+@pytest.mark.parametrize('body', [{'kind': 'export'}, {'kind': 'scan-totals', 'params': {}}])
+def test_api_queues_job(client, body):
+    response = client.post('/jobs', json=body)
+    assert response.status_code == 202 and response.get_json()['status'] == 'queued'
+
+
+@pytest.mark.parametrize('body', [[1], {'kind': 'nope'}, {'kind': 'export', 'params': [1]},
+                                  {'kind': 'scan-totals', 'params': 'x'}, {'kind': 'export', 'params': {'min_id': [1]}}])
+def test_api_rejects_invalid_job(client, body):
+    assert client.post('/jobs', json=body).status_code == 400
+
+
+@pytest.mark.parametrize('value, expected', [('0', False), ('false', False), ('1', True), ('TRUE', True),
+                                             (True, True), (0, False)])
+def test_gzip_is_normalised(app, database, value, expected):
+    conn = sqlite3.connect(database)
+    try:
+        job = jobs.get(conn, jobs.submit(conn, 'export', {'gzip': value}))
+    finally:
+        conn.close()
+    assert job['params']['gzip'] is expected
+
+
+@pytest.mark.parametrize('value', ['yes', '', 2, [1]])
+def test_gzip_rejects_other_values(client, value):
+    assert client.post('/jobs', json={'kind': 'export', 'params': {'gzip': value}}).status_code == 400
+
+
+def test_export_without_gzip(app, database):
+    result = app.test_cli_runner().invoke(args=['submit-job', 'export', '-p', 'gzip=0'])
+    assert result.exit_code == 0, result.output
+    jobs.run_worker(database, processes=1, once=True, echo=lambda message: None)
+    job = latest_job(database)
+    assert job['status'] == 'done' and not job['result']['path'].endswith('.gz')
+
+
+def test_worker_runs_tenant_jobs(tmp_path, database):
+    import app as budget_app
+
+    app = budget_app.create_app({'DATABASE': database, 'SHARDS_DIR': str(tmp_path / 'shards'), 'TESTING': True})
+    budget_app.init_db(app)
+    client = app.test_client()
+    client.post('/api/v1/transactions', json=[{'description': 'Loyer', 'amount': -700, 'category': 'Logement'}],
+                headers={'X-Tenant': 'acme'})
+    job_id = client.post('/jobs', json={'kind': 'scan-totals'}, headers={'X-Tenant': 'acme'}).get_json()['id']
+
+    result = app.test_cli_runner().invoke(args=['jobs-worker', '--processes', '1', '--once'])
+    assert result.exit_code == 0, result.output
+    job = client.get(f'/jobs/{job_id}', headers={'X-Tenant': 'acme'}).get_json()
+    assert job['status'] == 'done' and job['result']['count'] == 1 and job['result']['balance'] == -700
+    assert client.get(f'/jobs/{job_id}').status_code == 404
+    app.extensions['shard_router'].close()
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+import db_pool
+import ledger
+import ledger_cache
+import migrations
+
+INSERT = 'INSERT INTO transactions (description, amount, category) VALUES (?, ?, ?)'
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = db_pool.configure_connection(sqlite3.connect(tmp_path / 'ledger.db'))
+    migrations.migrate(connection)
+    yield connection
+    connection.close()
+
+
+def mutations(conn):
+    return ledger_cache.read_state(conn)[2]
+
+
+def test_date_fill_is_not_a_mutation(conn):
+    before = mutations(conn)
+    with conn:
+        conn.execute(INSERT, ('Courses', -20.0, 'Alimentation'))
+    assert conn.execute('SELECT booked_on FROM transactions').fetchone()[0] is not None
+    assert mutations(conn) == before
+    with conn:
+        conn.execute('UPDATE transactions SET amount = -25.0')
+    assert mutations(conn) == before + 1
+    with conn:
+        conn.execute('UPDATE transactions SET booked_on = NULL')
+    assert mutations(conn) == before + 2
+
+
+def test_cache_appends_rows_inserted_without_date(conn):
+    cache = ledger_cache.LedgerCache().sync(conn)
+    with conn:
+        conn.executemany(INSERT, [('Loyer', -700.0, 'Logement'), ('Salaire', 2500.0, 'Revenu')])
+    cache.sync(conn)
+    stats = cache.stats()
+    assert stats['appended'] == 2 and cache.balance() == pytest.approx(1800.0)
+
+
+def test_trigger_totals_match_full_scan(conn):
+    with conn:
+        conn.executemany(INSERT, [('Loyer', -700.0, 'Logement'), ('Salaire', 2500.0, 'Revenu'),
+                                  ('Courses', -82.4, 'Alimentation'), ('Cinéma', -12.0, None)])
+        conn.execute("UPDATE transactions SET amount = -90.0, category = 'Loisirs' WHERE description = 'Courses'")
+        conn.execute("DELETE FROM transactions WHERE description = 'Cinéma'")
+    ledger.bulk_insert(conn, [(f'Achat {i}', -1.5 * i, 'Loisirs', '2026-02-01') for i in range(100)])
+    assert ledger.verify_totals(conn) == []
+    totals, categories = ledger.scan_totals(conn)
+    assert totals['count'] == 103
+    assert ledger.read_balance(conn) == pytest.approx(totals['balance'])
+    assert set(categories) == {'Logement', 'Revenu', 'Loisirs'}
+
+
+def test_verify_totals_reports_drift(conn):
+    with conn:
+        conn.execute(INSERT, ('Loyer', -700.0, 'Logement'))
+        conn.execute('UPDATE ledger_totals SET balance = balance + 1 WHERE id = 1')
+    assert ledger.verify_totals(conn)
+    ledger.rebuild_totals(conn)
+    assert ledger.verify_totals(conn) == []
@@ -0,0 +1,45 @@
+import pytest
+
+import ratelimit
+
+
+@pytest.fixture
+def limited(app):
+    app.config['RATE_LIMIT'] = True
+    app.config['RATE_LIMITS'] = {'/calculate': {'rate': 0.001, 'burst': 2, 'concurrency': 2, 'queue_timeout': 0.1}}
+    return app
+
+
+def calculate(client, forwarded=None):
+    headers = {'X-Forwarded-For': forwarded} if forwarded else {}
+    return client.post('/calculate', data={'formula': '1 + 1'}, headers=headers).status_code
+
+
+def test_bucket_per_client_address(limited):
+    client = limited.test_client()
+    assert [calculate(client) for _ in range(3)] == [200, 200, 429]
+
+
+def test_forwarded_for_ignored_without_trusted_proxy(limited):
+    client = limited.test_client()
+    assert [calculate(client, f'10.0.0.{i}') for i in range(3)] == [200, 200, 429]
+
+
+def test_forwarded_client_behind_trusted_proxy(limited):
+    limited.config['RATE_LIMIT_TRUSTED_PROXIES'] = 1
+    client = limited.test_client()
+    # Un seau par client réel, même si tous passent par le même proxy
+    assert [calculate(client, f'10.0.0.{i}') for i in range(3)] == [200, 200, 200]
+    assert [calculate(client, '10.0.0.9') for _ in range(3)] == [200, 200, 429]
+    # Entrée de gauche forgée par le client : seule celle ajoutée par le proxy compte
+    assert calculate(client, '1.2.3.4, 10.0.0.9') == 429
+
+
+@pytest.mark.parametrize('header, trusted, expected', [
+    (None, 1, '127.0.0.1'), ('10.0.0.1', 0, '127.0.0.1'), ('10.0.0.1', 2, '127.0.0.1'),
+    ('1.2.3.4, 10.0.0.1', 1, '10.0.0.1'), ('1.2.3.4, 10.0.0.1', 2, '1.2.3.4'),
+])
+def test_client_address(app, header, trusted, expected):
+    with app.test_request_context(headers={'X-Forwarded-For': header} if header else {},
+                                  environ_base={'REMOTE_ADDR': '127.0.0.1'}):
+        assert ratelimit.client_address(trusted) == expected
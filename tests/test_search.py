@@ -0,0 +1,27 @@
+import db_pool
+
+
+def suggest_index(app):
+    with app.app_context():
+        return db_pool.extensions(app).get('suggest')
+
+
+def test_search_without_ledger_cache_does_not_build_vocabulary(app, client):
+    response = client.post('/search', data={'query': 'Loyer'})
+    assert response.status_code == 200 and 'Loyer' in response.get_data(as_text=True)
+    assert suggest_index(app) is None
+
+
+def test_search_reuses_warm_vocabulary(app, client):
+    client.get('/api/search/suggest?q=Lo')
+    index = suggest_index(app)
+    assert index is not None
+    assert 'Loyer' in client.post('/search', data={'query': 'Loyer'}).get_data(as_text=True)
+    assert 'Aucun résultat' in client.post('/search', data={'query': 'zzzz'}).get_data(as_text=True)
+    assert suggest_index(app) is index
+
+
+def test_search_with_ledger_cache_builds_vocabulary(app, client):
+    app.config['LEDGER_CACHE'] = True
+    assert 'Loyer' in client.post('/search', data={'query': 'Loyer'}).get_data(as_text=True)
+    assert suggest_index(app) is not None
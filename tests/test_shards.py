@@ -0,0 +1,57 @@
+import os
+import sqlite3
+
+import pytest
+
+import live
+import migrations
+import shards
+
+
+@pytest.fixture
+def router(tmp_path):
+    default = str(tmp_path / 'main.db')
+    router = shards.ShardRouter(str(tmp_path / 'shards'), default, max_open=2)
+    yield router
+    router.close()
+
+
+def test_shard_is_created_and_migrated(router):
+    shard = router.shard('acme')
+    assert shard.database == os.path.join(router.directory, 'acme.db')
+    conn = sqlite3.connect(shard.database)
+    try:
+        assert migrations.current_version(conn) == migrations.MIGRATIONS[-1][0]
+    finally:
+        conn.close()
+    assert router.shard('acme') is shard and router.stats()['hits'] == 1
+
+
+def test_default_tenant_uses_main_database(router):
+    assert router.shard(shards.DEFAULT_TENANT).database == router.default_database
+
+
+@pytest.mark.parametrize('tenant', ['../evil', 'a b', '', 'x' * 65])
+def test_invalid_tenant(router, tenant):
+    with pytest.raises(shards.InvalidTenant):
+        router.shard(tenant)
+
+
+def test_least_recently_used_shard_is_evicted_and_closed(router):
+    first = router.shard('a')
+    router.shard('b')
+    router.shard('a')
+    broadcaster = first.extensions['live'] = live.Broadcaster(first.database)
+    router.shard('b')
+    router.shard('c')
+    # 'a' était le moins récemment utilisé : fermé avec son diffuseur
+    assert list(router._open) == ['b', 'c'] and router.stats()['evicted'] == 1
+    assert not broadcaster._thread.is_alive() and first.extensions == {}
+    # Rouvert à la demande
+    assert router.shard('a') is not first and router.stats()['opened'] == 4
+
+
+def test_tenants_lists_shard_files(router):
+    router.shard('acme')
+    router.shard('globex')
+    assert router.tenants() == [shards.DEFAULT_TENANT, 'acme', 'globex']
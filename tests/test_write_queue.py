@@ -0,0 +1,68 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import ledger
+import write_queue
+
+ROW = ('Courses', -12.5, 'Alimentation', '2026-01-15')
+
+
+@pytest.fixture
+def queue(database, app):
+    writer = write_queue.WriteBehindQueue(database)
+    yield writer
+    writer.close()
+
+
+def count_rows(database):
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_rows_are_committed(queue, database):
+    before = count_rows(database)
+    ids = [queue.write(ROW, timeout=5) for _ in range(3)]
+    assert ids == sorted(ids) and count_rows(database) == before + 3
+
+
+def test_failing_commit_hook_keeps_the_writer_alive(queue, database, monkeypatch):
+    def broken():
+        raise RuntimeError('hook en échec')
+
+    monkeypatch.setattr(ledger, '_commit_hooks', ledger._commit_hooks + [broken])
+    before = count_rows(database)
+    first = queue.write(ROW, timeout=5)
+    second = queue.write(ROW, timeout=5)
+    assert second > first and count_rows(database) == before + 2
+    # Les requêtes sont débloquées avant les hooks : le compteur peut suivre d'un instant
+    deadline = time.monotonic() + 5
+    while queue.stats()['hook_errors'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert queue.stats()['hook_errors'] == 2
+    assert queue._thread.is_alive()
+
+
+def test_concurrent_first_writes_share_one_queue(app, monkeypatch):
+    app.config['WRITE_BEHIND'] = True
+    created = []
+    original = write_queue.WriteBehindQueue.__init__
+
+    def slow_init(self, *args, **kwargs):
+        created.append(self)
+        time.sleep(0.05)
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(write_queue.WriteBehindQueue, '__init__', slow_init)
+    queues = []
+    threads = [threading.Thread(target=lambda: queues.append(write_queue.get_queue(app))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and all(queue is created[0] for queue in queues)
@@ -0,0 +1,225 @@
+"""File d'écriture différée (write-behind) avec commit groupé pour /add.
+
+Les requêtes déposent la transaction validée dans une file en mémoire ; un seul
+thread écrivain la vide et insère les lignes par lots dans une même transaction
+SQLite (au plus `max_batch` lignes, en attendant au plus `max_latency` secondes
+que le lot se remplisse). Un commit, donc une synchronisation disque, sert tout le
+lot, et il n'y a plus de concurrence entre requêtes pour le verrou d'écriture.
+
+La connexion de l'écrivain est par défaut en `synchronous = FULL` : quand
+`write()` rend la main, le lot de la transaction est durable. Les triggers (agrégats, index plein
+texte, rollups) s'appliquent comme pour une insertion directe.
+"""
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import current_app
+
+import db_pool
+import ledger
+
+DEFAULT_MAX_BATCH = 256
+DEFAULT_MAX_LATENCY = 0.002  # en s
+DEFAULT_SYNCHRONOUS = 'FULL'
+DEFAULT_MAX_DEPTH = 10_000
+DEFAULT_TIMEOUT = 10.0
+LATENCY_WINDOW = 1024
+
+_STOP = object()
+
+log = logging.getLogger('budget.write_queue')
+
+
+class WriteTimeout(RuntimeError):
+    """File pleine ou lot non validé dans le délai imparti"""
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class WriteBehindQueue:
+    """File bornée de (description, montant, catégorie, date) vidée par un thread écrivain unique"""
+
+    def __init__(self, database, max_batch=DEFAULT_MAX_BATCH, max_latency=DEFAULT_MAX_LATENCY,
+                 max_depth=DEFAULT_MAX_DEPTH, synchronous=DEFAULT_SYNCHRONOUS, table='transactions'):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.synchronous = synchronous
+        self.table = table
+        self._queue = queue.Queue(max_depth)
+        self._stats = {'submitted': 0, 'committed': 0, 'batches': 0, 'failed': 0, 'rejected': 0,
+                       'hook_errors': 0}
+        self._commit_ms = deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, row, timeout=DEFAULT_TIMEOUT):
+        """Dépose une ligne dans la file ; renvoie un Future résolu avec son id une fois le lot validé"""
+        future = Future()
+        try:
+            self._queue.put((row, future), timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise WriteTimeout(f'file d\'écriture pleine ({self._queue.maxsize} lignes en attente)')
+        with self._lock:
+            self._stats['submitted'] += 1
+        return future
+
+    def write(self, row, timeout=DEFAULT_TIMEOUT):
+        """Insère une ligne et attend que son lot soit durable ; renvoie son id"""
+        try:
+            return self.submit(row, timeout).result(timeout)
+        except FutureTimeout:
+            raise WriteTimeout(f'lot non validé après {timeout}s')
+
+    def close(self, timeout=DEFAULT_TIMEOUT):
+        """Valide les lignes en attente puis arrête l'écrivain"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _connect(self):
+        conn = db_pool.configure_connection(sqlite3.connect(self.database, isolation_level=None))
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        return conn
+
+    def _next_batch(self):
+        """Bloque jusqu'à la première ligne, puis complète le lot avec les lignes déjà en file ;
+        s'il y a des écrivains concurrents, attend au plus `max_latency` que le lot se remplisse"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                # Requête isolée : on valide tout de suite plutôt que d'attendre des voisines
+                if remaining <= 0 or len(batch) == 1:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn = self._connect()
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        sql = ledger.INSERT_SQL.format(table=self.table)
+        start = time.perf_counter()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            ids = [conn.execute(sql, row).lastrowid for row, _ in batch]
+            conn.execute('COMMIT')
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            if len(batch) > 1:
+                # Une ligne invalide ne doit pas faire échouer tout le lot : on réessaie ligne à ligne
+                for item in batch:
+                    self._commit(conn, [item])
+                return
+            with self._lock:
+                self._stats['failed'] += 1
+            batch[0][1].set_exception(e)
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['committed'] += len(batch)
+            self._stats['batches'] += 1
+            self._commit_ms.append(elapsed)
+            self._batch_sizes.append(len(batch))
+        # Lignes validées : les requêtes sont débloquées avant les hooks, qui ne doivent pas tuer l'écrivain
+        for (_, future), id_ in zip(batch, ids):
+            future.set_result(id_)
+        try:
+            ledger.notify_committed()
+        except Exception:
+            log.exception('hook après commit en échec (lot de %d ligne(s) validé)', len(batch))
+            with self._lock:
+                self._stats['hook_errors'] += 1
+
+    def stats(self):
+        with self._lock:
+            commit_ms = list(self._commit_ms)
+            sizes = list(self._batch_sizes)
+            stats = dict(self._stats)
+        p50, p99 = _percentile(commit_ms, 0.5), _percentile(commit_ms, 0.99)
+        return dict(
+            stats,
+            depth=self._queue.qsize(),
+            max_batch=self.max_batch,
+            max_latency_ms=self.max_latency * 1000,
+            synchronous=self.synchronous,
+            avg_batch=round(sum(sizes) / len(sizes), 1) if sizes else None,
+            commit_ms_p50=round(p50, 3) if commit_ms else None,
+            commit_ms_p99=round(p99, 3) if commit_ms else None,
+            commit_ms_max=round(max(commit_ms), 3) if commit_ms else None,
+        )
+
+
+def init_app(app):
+    """Configuration par défaut de l'écriture différée (désactivée : WRITE_BEHIND = False)"""
+    app.config.setdefault('WRITE_BEHIND', False)
+    app.config.setdefault('WRITE_MAX_BATCH', DEFAULT_MAX_BATCH)
+    app.config.setdefault('WRITE_MAX_LATENCY_MS', DEFAULT_MAX_LATENCY * 1000)
+    app.config.setdefault('WRITE_SYNCHRONOUS', DEFAULT_SYNCHRONOUS)
+    app.config.setdefault('WRITE_TIMEOUT', DEFAULT_TIMEOUT)
+    app.extensions['write_queue'] = None
+
+
+def after_fork(app):
+    """Dans un processus enfant : le thread écrivain n'a pas survécu au fork, la file sera recréée à l'usage"""
+    app.extensions['write_queue'] = None
+    app.extensions.pop('write_queue_lock', None)
+
+
+def get_queue(app=None):
+    """File de l'application, créée au premier usage ; None si l'écriture différée est désactivée"""
+    app = app or current_app
+    write_queue = app.extensions.get('write_queue')
+    enabled = app.config['WRITE_BEHIND']
+    if (write_queue is not None) == enabled and (write_queue is None or write_queue.database == app.config['DATABASE']):
+        return write_queue
+    # Une seule file (un seul écrivain) même si les premières requêtes arrivent ensemble
+    with db_pool.creation_lock(app, 'write_queue'):
+        write_queue = app.extensions.get('write_queue')
+        if write_queue is not None and (not enabled or write_queue.database != app.config['DATABASE']):
+            write_queue.close()
+            write_queue = app.extensions['write_queue'] = None
+        if write_queue is None and enabled:
+            write_queue = WriteBehindQueue(app.config['DATABASE'], app.config['WRITE_MAX_BATCH'],
+                                           app.config['WRITE_MAX_LATENCY_MS'] / 1000,
+                                           synchronous=app.config['WRITE_SYNCHRONOUS'])
+            atexit.register(write_queue.close)
+            app.extensions['write_queue'] = write_queue
+    return write_queue
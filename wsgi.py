@@ -0,0 +1,31 @@
+"""Point d'entrée WSGI de production : `gunicorn wsgi:app` (réglages dans gunicorn.conf.py).
+
+BUDGET_APP choisit l'application servie : `app` (app.py, par défaut) ou
+`corrige` (app-corrigé.py, dont le nom de fichier n'est pas importable tel quel).
+"""
+import importlib.util
+import os
+import sys
+
+APPS = ('app', 'corrige')
+
+
+def load_module(name):
+    """Module de l'application `name` (app.py ou app-corrigé.py)"""
+    if name not in APPS:
+        raise ValueError(f"BUDGET_APP inconnue {name!r} (attendu : {', '.join(APPS)})")
+    if name == 'app':
+        import app as module
+        return module
+    if 'app_corrige' in sys.modules:
+        return sys.modules['app_corrige']
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app-corrigé.py')
+    spec = importlib.util.spec_from_file_location('app_corrige', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['app_corrige'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+module = load_module(os.environ.get('BUDGET_APP', 'app'))
+app = module.app